@@ -2,8 +2,44 @@ import os
 import sqlite3
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
-GLOBAL_CONNECTION = sqlite3.connect(
-    os.path.join(ROOT_DIR, "data", "Chinook.db"), check_same_thread=False
-)
+DATABASE_PATH = os.path.join(ROOT_DIR, "data", "Chinook.db")
+# Number of read-only connections the DatabaseConnector pool keeps open.
+DB_POOL_SIZE = int(os.environ.get("SQL_TABLE_QA_DB_POOL_SIZE", os.cpu_count() or 4))
+DB_POOL_TIMEOUT = float(os.environ.get("SQL_TABLE_QA_DB_POOL_TIMEOUT", 10))
 BOT = "assistant"
 USER = "user"
+# Hard caps on what a single query may load into memory before being truncated.
+MAX_RESULT_ROWS = int(os.environ.get("SQL_TABLE_QA_MAX_RESULT_ROWS", 10_000))
+MAX_RESULT_BYTES = int(os.environ.get("SQL_TABLE_QA_MAX_RESULT_BYTES", 16 * 1024 * 1024))
+# Limits of the query cost guard. Queries are interrupted after QUERY_TIMEOUT seconds.
+QUERY_TIMEOUT = float(os.environ.get("SQL_TABLE_QA_QUERY_TIMEOUT", 10))
+QUERY_MAX_SCAN_ROWS = int(os.environ.get("SQL_TABLE_QA_QUERY_MAX_SCAN_ROWS", 1_000_000))
+# "sqlite", "duckdb" or "auto": where queries run. "auto" sends aggregations over at least
+# DUCKDB_MIN_ROWS source rows to DuckDB, if it is installed, once it has loaded the tables.
+QUERY_ENGINE = os.environ.get("SQL_TABLE_QA_QUERY_ENGINE", "sqlite")
+DUCKDB_MIN_ROWS = int(os.environ.get("SQL_TABLE_QA_DUCKDB_MIN_ROWS", 100_000))
+# Token budget of the chat history sent with each message, and the most recent
+# messages kept verbatim within it. Older messages are summarized.
+CONTEXT_MAX_TOKENS = int(os.environ.get("SQL_TABLE_QA_CONTEXT_MAX_TOKENS", 2000))
+CONTEXT_MAX_MESSAGES = int(os.environ.get("SQL_TABLE_QA_CONTEXT_MAX_MESSAGES", 20))
+# Token budget of a SQL result in an LLM prompt. Larger results are reduced to a digest
+# showing this many rows at each end, with per-column statistics.
+RESULT_DIGEST_MAX_TOKENS = int(os.environ.get("SQL_TABLE_QA_RESULT_DIGEST_MAX_TOKENS", 1000))
+RESULT_DIGEST_ROWS = int(os.environ.get("SQL_TABLE_QA_RESULT_DIGEST_ROWS", 5))
+# Admission control of each HTTP service worker: requests running at once, requests waiting
+# for a slot, seconds a request may wait, and seconds a request may take once admitted.
+# Answer requests mostly wait on the LLM; their SQL is bounded by the pool separately.
+SERVICE_MAX_CONCURRENCY = int(os.environ.get("SQL_TABLE_QA_SERVICE_MAX_CONCURRENCY", 32))
+SERVICE_MAX_QUEUE = int(os.environ.get("SQL_TABLE_QA_SERVICE_MAX_QUEUE", 64))
+SERVICE_QUEUE_TIMEOUT = float(os.environ.get("SQL_TABLE_QA_SERVICE_QUEUE_TIMEOUT", 5))
+SERVICE_REQUEST_TIMEOUT = float(os.environ.get("SQL_TABLE_QA_SERVICE_REQUEST_TIMEOUT", 60))
+
+
+def __getattr__(name: str):
+    # GLOBAL_CONNECTION is kept for the notebooks and only opened when first imported.
+    # Application code borrows read-only connections from the pool in
+    # sql_table_qa.dbutils.connection_pool instead.
+    if name == "GLOBAL_CONNECTION":
+        connection = globals()["GLOBAL_CONNECTION"] = sqlite3.connect(DATABASE_PATH, check_same_thread=False)
+        return connection
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,21 +1,24 @@
-import os
-from dotenv import dotenv_values
-from collections import deque
+import logging
+
 import streamlit as st
-from openai import OpenAI
-from CONSTANTS import ROOT_DIR, BOT, USER
-from sql_table_qa.answerers.langchain_answerer.langchain_naive_answerer import LangchainNaiveAnswerer
-from sql_table_qa.answerers.openai_answerer.openai_answerer import OpenaiAnswerer
+from CONSTANTS import BOT, USER
+from sql_table_qa.answerers.concurrency import SQL_EXECUTOR
+from sql_table_qa.answerers.conversation_context import ConversationContext
+from sql_table_qa.answerers.streaming import SQLBlockDetector
+from sql_table_qa.dbutils.sql_analysis import InvalidSQLError, analyze_sql
+from sql_table_qa.resources import get_config, get_connector, get_general_answerer
+from sql_table_qa.tracing import start_metrics_server
+
+logger = logging.getLogger(__name__)
 
-# naive inclusion of last 20 messages as context
-# TODO: Implement more sophisticated context management using tokens count
-MAX_CONTEXT_LENGTH = 20
-config = {**dotenv_values(f"{ROOT_DIR}/configs/local.env")}
-os.environ["OPENAI_API_KEY"] = config["OPENAI_API_KEY"]
-client = OpenAI()
+# Streamlit re-executes this script on every interaction. The config, clients and
+# answerers come from the process-wide registry, so they are only built on the first run.
+config = get_config()
+if "METRICS_PORT" in config:
+    # Prometheus scrape endpoint with per-stage latency percentiles
+    start_metrics_server(int(config["METRICS_PORT"]), host=config.get("METRICS_HOST", "127.0.0.1"))
 
 
-sql_answerer = LangchainNaiveAnswerer()
 # Streamlit UI
 st.title("LangChain SQL Query Answering System")
 
@@ -23,6 +26,10 @@ st.title("LangChain SQL Query Answering System")
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# Recent messages within a token budget, older ones summarized
+if "context" not in st.session_state:
+    st.session_state.context = ConversationContext()
+
 if "current_sql" not in st.session_state:
     st.session_state.current_sql = ""
 
@@ -33,15 +40,39 @@ for message in st.session_state.messages:
 
 
 def submit_sql(sql: str):
-    st.info(f"{sql} is being executed.")
     st.session_state.current_sql = sql
-    result = sql_answerer.call(st.session_state.current_sql)
-    q = deque(result)
-    while q:
-        msg = q.popleft()
-        st.session_state.messages.append(
-            {"role": BOT, "content": msg}
-        )
+    # Run below the chat history, so that the result shows after it
+    st.session_state.pending_sql = sql
+
+
+def run_sql(sql: str):
+    """Runs the query from the editor as it is, and shows its result in the chat."""
+    st.info(f"{sql} is being executed.")
+    query = f"```\n{sql}\n```"
+    try:
+        # Usually answered from the result cache, filled by prefetch_sql while the reply streamed
+        result = get_connector().execute_sql(sql).to_dataframe()
+    except Exception as e:
+        result = str(e)
+    with st.chat_message(BOT):
+        st.write(query)
+        st.write(result)
+    st.session_state.messages += [{"role": BOT, "content": query}, {"role": BOT, "content": result}]
+
+
+def _log_prefetch_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("Prefetching SQL failed: %s", future.exception())
+
+
+def prefetch_sql(sql: str):
+    # Runs the SQL while the rest of the reply streams, so its result is cached by the time it is executed
+    try:
+        analyze_sql(sql).check_allowed()
+    except InvalidSQLError:
+        # Not a query, e.g. a code block in another language: leave it to the user
+        return
+    SQL_EXECUTOR.submit(get_connector().execute_sql, sql).add_done_callback(_log_prefetch_failure)
 
 
 def render_sql_editor():
@@ -53,20 +84,30 @@ def render_sql_editor():
                 "Execute", on_click=submit_sql, kwargs={'sql': text_area_content})
 
 
-general_answerer = OpenaiAnswerer()
+general_answerer = get_general_answerer()
 render_sql_editor()
+if "pending_sql" in st.session_state:
+    run_sql(st.session_state.pop("pending_sql"))
+
 if user_input := st.chat_input("Chat:"):
     st.session_state.messages.append({"role": USER, "content": user_input})
     with st.chat_message(USER):
         st.write(user_input)
 
-    response = general_answerer.get_chat_response(
-        message=user_input,  context=st.session_state.messages[:-MAX_CONTEXT_LENGTH])
+    sql_blocks = SQLBlockDetector()
+
+    def reply_tokens():
+        for token in general_answerer.stream_response(
+                message=user_input, context=st.session_state.context.build(st.session_state.messages[:-1])):
+            for sql in sql_blocks.feed(token):
+                prefetch_sql(sql)
+            yield token
+
     with st.chat_message(BOT):
-        if "```" in response:
-            code = response.split("```")[1].replace("\n", " ").strip()
-            st.session_state.current_sql = code
-        st.write(response)
+        response = st.write_stream(reply_tokens())
+        if sql_blocks.blocks:
+            # The statement prefetch_sql ran, so that executing it reads the cached result
+            st.session_state.current_sql = sql_blocks.blocks[0].strip()
         st.session_state.messages.append(
             {"role": BOT, "content": response}
         )
@@ -0,0 +1,32 @@
+"""Answers questions about the Chinook database with SQL and LLMs.
+
+The main classes can be imported from the package root. Their modules are imported on
+first access, so `import sql_table_qa` does not pull in sqlglot, langchain or openai."""
+import importlib
+
+
+_LAZY_ATTRIBUTES = {
+    "DatabaseConnector": "sql_table_qa.dbutils.database_connector",
+    "QueryResult": "sql_table_qa.dbutils.query_result",
+    "QueryTooExpensiveError": "sql_table_qa.dbutils.cost_guard",
+    "LangchainNaiveAnswerer": "sql_table_qa.answerers.langchain_answerer.langchain_naive_answerer",
+    "OpenaiAnswerer": "sql_table_qa.answerers.openai_answerer.openai_answerer",
+    "get_connector": "sql_table_qa.resources",
+    "get_sql_answerer": "sql_table_qa.resources",
+    "get_general_answerer": "sql_table_qa.resources",
+    "span": "sql_table_qa.tracing",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str):
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = globals()[name] = getattr(importlib.import_module(module), name)
+    return value
+
+
+def __dir__() -> list:
+    return sorted({*globals(), *__all__})
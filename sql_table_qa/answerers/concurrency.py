@@ -0,0 +1,71 @@
+"""Helpers to run answerers concurrently from asyncio code.
+
+SQLite and the other blocking parts of the pipeline run on a shared thread pool
+sized to the connection pool, so the event loop stays free for LLM calls."""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from CONSTANTS import DB_POOL_SIZE
+
+
+SQL_EXECUTOR = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="sql")
+
+
+async def run_in_sql_executor(func, *args, **kwargs):
+    """
+    Runs a blocking function on the SQL thread pool and awaits its result.
+
+    Args:
+    func (callable): The blocking function, typically touching the database.
+    *args, **kwargs: Arguments for the function.
+
+    Returns:
+    Whatever the function returns.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(SQL_EXECUTOR, functools.partial(func, *args, **kwargs))
+
+
+async def gather_bounded(coroutine_factory, items: list, max_concurrency: int = 8,
+                         timeout: float = None, return_exceptions: bool = True) -> list:
+    """
+    Runs one coroutine per item with at most `max_concurrency` running at once.
+
+    Each call gets its own timeout and is cancelled when it runs over.
+    Cancelling the caller cancels every call still running.
+
+    Args:
+    coroutine_factory (callable): Called with an item, returns the coroutine to run.
+    items (list): The inputs, e.g. user questions.
+    max_concurrency (int): Maximum number of calls in flight.
+    timeout (float): Seconds allowed per call, not counting time waiting for a slot. None means no limit.
+    return_exceptions (bool): Put exceptions (including asyncio.TimeoutError) in the results
+        instead of raising the first one.
+
+    Returns:
+    list: Results in the order of `items`.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_one(item):
+        async with semaphore:
+            return await asyncio.wait_for(coroutine_factory(item), timeout)
+
+    return await asyncio.gather(*(run_one(item) for item in items), return_exceptions=return_exceptions)
+
+
+async def answer_many(answerer, questions: list, max_concurrency: int = 8, timeout: float = None) -> list:
+    """
+    Answers many questions concurrently with an answerer that has an `acall` method.
+
+    Args:
+    answerer: E.g. a LangchainNaiveAnswerer.
+    questions (list): The user questions.
+    max_concurrency (int): Maximum number of questions in flight.
+    timeout (float): Seconds allowed per question.
+
+    Returns:
+    list: One `acall` result, or the exception raised, per question.
+    """
+    return await gather_bounded(answerer.acall, questions, max_concurrency=max_concurrency, timeout=timeout)
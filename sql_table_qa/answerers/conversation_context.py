@@ -0,0 +1,186 @@
+"""Fits a chat history into a token budget before it is sent to the chat model.
+
+The most recent messages are kept verbatim, up to the budget. Older messages are folded
+into a running summary, each message exactly once, so the cost of building the context
+does not grow with the length of the session. Non-text messages, such as the DataFrames
+the SQL answerer adds to the history, are replaced by short digests.
+
+Tokens are counted with tiktoken when it is installed, and estimated from the character
+count otherwise.
+"""
+import re
+import threading
+
+from CONSTANTS import CONTEXT_MAX_TOKENS, CONTEXT_MAX_MESSAGES
+from sql_table_qa.answerers.result_digest import digest_result
+from sql_table_qa.answerers.tokens import count_tokens, truncate_tokens
+from sql_table_qa.dbutils.query_result import QueryResult
+
+
+# Tokens the chat API adds around every message, and to prime the reply
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+_OMITTED = "(earlier turns omitted)"
+
+
+def digest_content(content, max_tokens: int = 120) -> str:
+    """
+    Renders a history message as text. Results are reduced to a digest of their size, first rows and columns.
+
+    Args:
+    content: A string, a pandas DataFrame, a QueryResult, or anything printable.
+    max_tokens (int): Token budget of the digest of a result, label included.
+
+    Returns:
+    str: The text to send to the model.
+    """
+    if isinstance(content, str):
+        return content
+    if isinstance(content, QueryResult) or (hasattr(content, "itertuples") and hasattr(content, "columns")):
+        label = "[SQL result]\n"
+        return label + digest_result(content, max(1, max_tokens - count_tokens(label)), rows=2)
+    return str(content)
+
+
+def _one_line(role: str, text: str) -> str:
+    text = re.sub(r"```(?:sql)?\s*(.*?)```", lambda m: f"SQL: {' '.join(m.group(1).split())}", text,
+                  flags=re.DOTALL | re.IGNORECASE)
+    return f"{role}: {' '.join(text.split())}"
+
+
+class ConversationContext:
+    """
+    Builds the context messages of one conversation within a token budget.
+
+    Keep one instance per conversation: it remembers which messages were already
+    summarized, so each call only digests and summarizes the messages added since.
+    """
+
+    def __init__(self, max_tokens: int = CONTEXT_MAX_TOKENS, max_messages: int = CONTEXT_MAX_MESSAGES,
+                 summary_tokens: int = None, line_tokens: int = 60, digest_tokens: int = 120,
+                 summarizer=None, model: str = "gpt-3.5-turbo"):
+        """
+        Initializes an empty context.
+
+        Args:
+        max_tokens (int): Budget of the whole context, summary included. The system prompt
+            and the new user message come on top.
+        max_messages (int): Most recent messages kept verbatim, if they fit in the budget.
+        summary_tokens (int): Budget of the summary. Defaults to a quarter of `max_tokens`.
+        line_tokens (int): Budget of each summarized message in the default summary.
+        digest_tokens (int): Budget of the digest of each SQL result.
+        summarizer (callable): Called as `summarizer(summary, messages)` with the current summary
+            and the messages to fold in, returns the new summary. Defaults to keeping one
+            shortened line per message, dropping the oldest lines beyond `summary_tokens`.
+        model (str): The model whose tokenizer counts tokens.
+        """
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+        self.summary_tokens = summary_tokens if summary_tokens is not None else max_tokens // 4
+        self.line_tokens = line_tokens
+        self.digest_tokens = digest_tokens
+        self.summarizer = summarizer or self._summarize_lines
+        self.model = model
+        self.summary = ""
+        self._summarized = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Forgets the summary, e.g. when the conversation is cleared."""
+        with self._lock:
+            self.summary = ""
+            self._summarized = 0
+
+    def _tokens(self, text: str) -> int:
+        return count_tokens(text, self.model) + MESSAGE_OVERHEAD_TOKENS
+
+    def _text(self, message: dict) -> str:
+        return digest_content(message["content"], self.digest_tokens)
+
+    def _summarize_lines(self, summary: str, messages: list) -> str:
+        lines = [line for line in summary.splitlines() if line and line != _OMITTED]
+        lines += [truncate_tokens(_one_line(m["role"], self._text(m)), self.line_tokens, self.model)
+                  for m in messages]
+        omitted = summary.startswith(_OMITTED)
+        while lines and count_tokens("\n".join([_OMITTED, *lines]), self.model) > self.summary_tokens:
+            lines.pop(0)
+            omitted = True
+        return "\n".join([_OMITTED, *lines] if omitted else lines)
+
+    def build(self, messages: list) -> list:
+        """
+        Returns the context to send along with a new user message.
+
+        Args:
+        messages (list): The conversation so far, oldest first, as {"role", "content"} dicts.
+            Only appending to it between calls keeps the summary incremental.
+
+        Returns:
+        list: Chat messages: a system message with the summary of older turns, if any,
+            followed by the most recent messages with text content.
+        """
+        with self._lock:
+            if len(messages) < self._summarized:
+                self.summary, self._summarized = "", 0
+            reserve = self._tokens(SUMMARY_PREFIX) + self.summary_tokens
+            recent, start = self._recent(messages, self.max_tokens - (reserve if self.summary else 0))
+            if start > self._summarized and not self.summary:
+                # Older messages have to be summarized, so the summary needs room too
+                recent, start = self._recent(messages, self.max_tokens - reserve)
+            if start > self._summarized:
+                summary = self.summarizer(self.summary, messages[self._summarized:start])
+                self.summary = truncate_tokens(summary, self.summary_tokens, self.model)
+                self._summarized = start
+            context = []
+            if self.summary:
+                context.append({"role": "system", "content": f"{SUMMARY_PREFIX}\n{self.summary}"})
+            return context + recent
+
+    def _recent(self, messages: list, budget: int) -> tuple:
+        """The newest unsummarized messages that fit in `budget`, and the index of the first of them."""
+        recent = []
+        used = 0
+        start = len(messages)
+        while start > self._summarized and len(recent) < self.max_messages:
+            message = messages[start - 1]
+            text = self._text(message)
+            tokens = self._tokens(text)
+            if used + tokens > budget:
+                if not recent:
+                    # The last message alone is over budget: keep its beginning
+                    text = truncate_tokens(text, max(1, budget - MESSAGE_OVERHEAD_TOKENS), self.model)
+                    recent.append({"role": message["role"], "content": text})
+                    start -= 1
+                break
+            recent.append({"role": message["role"], "content": text})
+            used += tokens
+            start -= 1
+        return recent[::-1], start
+
+    def count(self, messages: list) -> int:
+        """Counts the tokens of built context messages."""
+        return sum(self._tokens(str(message["content"])) for message in messages)
+
+
+def openai_summarizer(client, model: str = "gpt-3.5-turbo", max_tokens: int = 300):
+    """
+    Returns a summarizer for ConversationContext that asks an OpenAI chat model to update the summary.
+
+    Args:
+    client (openai.OpenAI): The client to call.
+    model (str): The chat model.
+    max_tokens (int): Maximum length of the summary.
+
+    Returns:
+    callable: `summarizer(summary, messages) -> str`.
+    """
+    def summarize(summary: str, messages: list) -> str:
+        turns = "\n".join(_one_line(m["role"], digest_content(m["content"])) for m in messages)
+        response = client.chat.completions.create(model=model, max_tokens=max_tokens, messages=[
+            {"role": "system", "content": "You maintain a short summary of a conversation about the Chinook "
+                                          "database. Keep the questions asked, the SQL used, the results found "
+                                          "and any open clarifications. Reply with the updated summary only."},
+            {"role": "user", "content": f"Current summary:\n{summary or '(empty)'}\n\nNew turns:\n{turns}"},
+        ])
+        return response.choices[0].message.content.strip()
+    return summarize
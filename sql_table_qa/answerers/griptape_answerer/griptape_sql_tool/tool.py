@@ -1,10 +1,14 @@
 import random
-from griptape.artifacts import TextArtifact
+from griptape.artifacts import ErrorArtifact, TextArtifact
 from griptape.tools import BaseTool
 from griptape.utils.decorators import activity
 from schema import Schema, Literal, Optional
 
+from sql_table_qa.answerers.result_digest import digest_result
+from sql_table_qa.dbutils.cost_guard import QueryTooExpensiveError
 from sql_table_qa.dbutils.database_connector import DatabaseConnector
+from sql_table_qa.resources import get_connector
+from sql_table_qa.tracing import span
 
 
 connect_methods = DatabaseConnector.get_methods_info()
@@ -13,7 +17,7 @@ connect_methods = DatabaseConnector.get_methods_info()
 class DatabaseQueryTool(BaseTool):
     def __init__(self):
         super().__init__()
-        self.connector = DatabaseConnector()
+        self.connector = get_connector()
 
     @activity(config={
         "description": connect_methods.get("execute_sql").get("desc", ""),
@@ -22,8 +26,31 @@ class DatabaseQueryTool(BaseTool):
         })
     })
     def execute_sql(self, params: dict) -> TextArtifact:
-        result = self.connector.execute_sql(**params["values"])
-        return TextArtifact(str(result))
+        with span("tool.griptape.execute_sql"):
+            try:
+                result = self.connector.execute_sql(**params["values"])
+            except QueryTooExpensiveError as e:
+                # Tell the model why, so it can write a cheaper query
+                return ErrorArtifact(str(e))
+            with span("result.render") as render_span:
+                text = digest_result(result, sql=params["values"]["sql"])
+                render_span.set(rows=result.row_count, chars=len(text))
+        return TextArtifact(text)
+
+    @activity(config={
+        "description": connect_methods.get("execute_sql_page").get("desc", ""),
+        "schema": Schema({
+            Literal("sql", description="sql"): str,
+            Optional(Literal("page", description="zero-based page number")): int,
+            Optional(Literal("page_size", description="rows per page")): int
+        })
+    })
+    def execute_sql_page(self, params: dict) -> TextArtifact:
+        try:
+            result = self.connector.execute_sql_page(**params["values"])
+        except QueryTooExpensiveError as e:
+            return ErrorArtifact(str(e))
+        return TextArtifact(digest_result(result.to_result(), sql=params["values"]["sql"]))
 
     @activity(config={
         "description": connect_methods.get("get_methods_info").get("desc", ""),
@@ -66,5 +93,6 @@ class DatabaseQueryTool(BaseTool):
         })
     })
     def validate_sql(self, params: dict) -> TextArtifact:
-        result = self.connector.validate_sql(**params["values"])
+        with span("tool.griptape.validate_sql"):
+            result = self.connector.validate_sql(**params["values"])
         return TextArtifact(str(result))
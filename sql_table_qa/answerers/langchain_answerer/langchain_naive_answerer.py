@@ -1,31 +1,41 @@
 """An answerer that will always assume the user question is correct and fully formed.
 Will always attempt SQL execution and return the result or an error message.
 Will not attempt to correct it's own faulty query."""
-import os
-import ast
-import pandas as pd
-from dotenv import dotenv_values
 from langchain.chains import create_sql_query_chain
+from langchain_core.language_models import BaseChatModel
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnablePassthrough, RunnableSequence
 from langchain_community.utilities import SQLDatabase
-from langchain_openai import ChatOpenAI
-import streamlit as st
-from sql_table_qa.answerers.langchain_answerer.langchain_sql_connector import execute_sql
-from CONSTANTS import ROOT_DIR
+from sql_table_qa.answerers.concurrency import run_in_sql_executor
+from sql_table_qa.answerers.langchain_answerer.tracing_callbacks import SpanTokenUsageHandler
+from sql_table_qa.answerers.question_cache import QuestionCache
+from sql_table_qa.answerers.result_digest import digest_result
+from sql_table_qa.answerers.streaming import StreamEvent, StreamTimer, atimed_stream, timed_stream
+from sql_table_qa.dbutils.database_connector import DatabaseConnector
+from sql_table_qa.dbutils.table_retriever import TableRetriever
+from sql_table_qa.resources import get_config, get_connector
+from sql_table_qa.tracing import span
 
 
 class LangchainNaiveAnswerer:
-    def __init__(self):
-        config = {**dotenv_values(f"{ROOT_DIR}/configs/local.env")}
-        os.environ["OPENAI_API_KEY"] = config["OPENAI_API_KEY"]
-        # Initialize your database and language model objects here
-        self.db = SQLDatabase.from_uri(f"sqlite:///{ROOT_DIR}/data/Chinook.db")
-        self.llm = ChatOpenAI(model="gpt-3.5-turbo-0125")
-        # Tools and chain setup
-        # TODO: this can be easily integrated with our custom db connector
-        self.query_writer = create_sql_query_chain(self.llm, self.db)
+    def __init__(self, use_table_retrieval: bool = False, question_cache: QuestionCache = None,
+                 use_question_cache: bool = True, llm: BaseChatModel = None,
+                 connector: DatabaseConnector = None):
+        if llm is None:
+            # Imported here, langchain_openai being slow to import and unused with other models
+            from langchain_openai import ChatOpenAI
+            get_config()
+            llm = ChatOpenAI(model="gpt-3.5-turbo-0125")
+        self.llm = llm
+        self.connector = connector or get_connector()
+        self.llm.callbacks = [*(self.llm.callbacks or []), SpanTokenUsageHandler()]
+        # Only the tables relevant to the question go into the query-writing prompt. Off by
+        # default: a missed table makes the query unwritable, the whole schema never does.
+        self.table_retriever = TableRetriever(self.connector) if use_table_retrieval else None
+        # Questions answered before skip both LLM calls
+        self.question_cache = (question_cache or QuestionCache()) if use_question_cache else None
+        self._build_query_writer()
         self.answer_prompt = PromptTemplate.from_template(
             """Given the following user question, corresponding SQL query, and SQL result, answer the user question.
 
@@ -36,19 +46,184 @@ class LangchainNaiveAnswerer:
         )
         self.answer_writer = self.answer_prompt | self.llm | StrOutputParser()
 
+    def _build_query_writer(self):
+        # Table info is served from the connector's cached schema prompts,
+        # so LangChain neither compiles DDL nor samples rows for every question
+        self.schema_version = self.connector.schema_version
+        self.db = SQLDatabase.from_uri(
+            f"sqlite:///{self.connector.database_path}",
+            sample_rows_in_table_info=0,
+            custom_table_info=self.connector.get_table_prompts(),
+        )
+        self.query_writer = create_sql_query_chain(self.llm, self.db)
+        # The last step of the chain strips the query, which buffers the whole output,
+        # so tokens are streamed from the step before it and stripped at the end
+        self.query_streamer = RunnableSequence(*self.query_writer.steps[:-1])
+
+    def _query_writer_inputs(self, question: str) -> dict:
+        if self.connector.schema_version != self.schema_version:
+            self._build_query_writer()
+        inputs = {"question": question}
+        if self.table_retriever is not None:
+            inputs["table_names_to_use"] = self.table_retriever.retrieve(question)
+        return inputs
+
     def create_sql_query_from_question(self, question: str) -> str:
-        return self.query_writer.invoke({"question": question})
+        inputs = self._query_writer_inputs(question)
+        with span("llm.query_writing"):
+            return self.query_writer.invoke(inputs)
+
+    async def acreate_sql_query_from_question(self, question: str) -> str:
+        inputs = await run_in_sql_executor(self._query_writer_inputs, question)
+        with span("llm.query_writing"):
+            return await self.query_writer.ainvoke(inputs)
 
     def answer_question(self, question: str, query: str, result: str) -> str:
-        return self.answer_writer.invoke({"question": question, "query": query, "result": result})
+        with span("llm.answer_writing"):
+            return self.answer_writer.invoke({"question": question, "query": query, "result": result})
+
+    async def aanswer_question(self, question: str, query: str, result: str) -> str:
+        with span("llm.answer_writing"):
+            return await self.answer_writer.ainvoke({"question": question, "query": query, "result": result})
 
-    def call(self, msg: str) -> list[any]:
-        query = self.create_sql_query_from_question(msg)
-        result = execute_sql(query)
-        answer = self.answer_question(msg, query, result)
+    def _lookup_cache(self, msg: str, bypass_cache: bool):
+        if self.question_cache is None or bypass_cache:
+            return None
+        return self.question_cache.get(msg, self.llm.model_name, self.connector.schema_version)
+
+    def _execute(self, query: str) -> tuple:
+        """Runs the query and returns (text for the answer prompt, result for the UI, failed)."""
         try:
-            parsed_result = pd.DataFrame(ast.literal_eval(result))
+            result = self.connector.execute_sql(query)
         except Exception as e:
-            print(e)
-            parsed_result = result
-        return [f"```\n{query}\n```", parsed_result, answer]
+            # The error message goes to the answer writer in place of a result
+            return str(e), str(e), True
+        with span("result.render") as render_span:
+            text = digest_result(result, sql=query)
+            render_span.set(rows=result.row_count, chars=len(text))
+            return text, result.to_dataframe(), False
+
+    @staticmethod
+    def _reusable(cached, result_text: str, failed: bool) -> bool:
+        # The data may have changed since the answer was written: it is only reused for the same result
+        return cached is not None and not failed and cached.answers(result_text)
+
+    def _store(self, msg: str, query: str, answer: str, result_text: str, failed: bool):
+        if self.question_cache is not None and not failed:
+            self.question_cache.put(msg, self.llm.model_name, self.connector.schema_version, query, answer,
+                                    result=result_text)
+
+    def call(self, msg: str, bypass_cache: bool = False) -> list[any]:
+        with span("answer.langchain") as answer_span:
+            cached = self._lookup_cache(msg, bypass_cache)
+            answer_span.set(cache_hit=cached is not None)
+            query = cached.sql if cached else self.create_sql_query_from_question(msg)
+            result_text, parsed_result, failed = self._execute(query)
+            if self._reusable(cached, result_text, failed):
+                answer = cached.answer
+            else:
+                answer = self.answer_question(msg, query, result_text)
+                self._store(msg, query, answer, result_text, failed)
+            return [f"```\n{query}\n```", parsed_result, answer]
+
+    async def acall(self, msg: str, bypass_cache: bool = False) -> list[any]:
+        """Same as `call`, but awaits the LLM and runs SQLite work on the SQL thread pool."""
+        with span("answer.langchain") as answer_span:
+            cached = await run_in_sql_executor(self._lookup_cache, msg, bypass_cache)
+            answer_span.set(cache_hit=cached is not None)
+            query = cached.sql if cached else await self.acreate_sql_query_from_question(msg)
+            result_text, parsed_result, failed = await run_in_sql_executor(self._execute, query)
+            if self._reusable(cached, result_text, failed):
+                answer = cached.answer
+            else:
+                answer = await self.aanswer_question(msg, query, result_text)
+                await run_in_sql_executor(self._store, msg, query, answer, result_text, failed)
+            return [f"```\n{query}\n```", parsed_result, answer]
+
+    def stream(self, msg: str, bypass_cache: bool = False):
+        """
+        Same as `call`, but yields the query and the answer token by token as they are written.
+        The query runs as soon as it is complete.
+
+        Args:
+        msg (str): The user question.
+        bypass_cache (bool): Write a new query and answer even if the question was answered before.
+
+        Yields:
+        StreamEvent: "sql_token"s, then "sql", "result", "answer_token"s and "answer".
+            Cached queries skip the "sql_token"s, and cached answers still true of the
+            current result skip the "answer_token"s.
+        """
+        timer = StreamTimer("answer.langchain.stream")
+        error = None
+        try:
+            cached = self._lookup_cache(msg, bypass_cache)
+            timer.attributes["cache_hit"] = cached is not None
+            if cached:
+                query = cached.sql
+            else:
+                inputs = self._query_writer_inputs(msg)
+                pieces = []
+                for token in timed_stream("llm.query_writing.stream", self.query_streamer.stream(inputs)):
+                    timer.chunk(token)
+                    pieces.append(token)
+                    yield StreamEvent("sql_token", token)
+                query = "".join(pieces).strip()
+            yield StreamEvent("sql", query)
+            result_text, parsed_result, failed = self._execute(query)
+            yield StreamEvent("result", parsed_result)
+            if self._reusable(cached, result_text, failed):
+                answer = cached.answer
+            else:
+                pieces = []
+                inputs = {"question": msg, "query": query, "result": result_text}
+                for token in timed_stream("llm.answer_writing.stream", self.answer_writer.stream(inputs)):
+                    timer.chunk(token)
+                    pieces.append(token)
+                    yield StreamEvent("answer_token", token)
+                answer = "".join(pieces)
+                self._store(msg, query, answer, result_text, failed)
+            yield StreamEvent("answer", answer)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            timer.finish(error)
+
+    async def astream(self, msg: str, bypass_cache: bool = False):
+        """Same as `stream`, but awaits the LLM and runs SQLite work on the SQL thread pool."""
+        timer = StreamTimer("answer.langchain.stream")
+        error = None
+        try:
+            cached = await run_in_sql_executor(self._lookup_cache, msg, bypass_cache)
+            timer.attributes["cache_hit"] = cached is not None
+            if cached:
+                query = cached.sql
+            else:
+                inputs = await run_in_sql_executor(self._query_writer_inputs, msg)
+                pieces = []
+                async for token in atimed_stream("llm.query_writing.stream", self.query_streamer.astream(inputs)):
+                    timer.chunk(token)
+                    pieces.append(token)
+                    yield StreamEvent("sql_token", token)
+                query = "".join(pieces).strip()
+            yield StreamEvent("sql", query)
+            result_text, parsed_result, failed = await run_in_sql_executor(self._execute, query)
+            yield StreamEvent("result", parsed_result)
+            if self._reusable(cached, result_text, failed):
+                answer = cached.answer
+            else:
+                pieces = []
+                inputs = {"question": msg, "query": query, "result": result_text}
+                async for token in atimed_stream("llm.answer_writing.stream", self.answer_writer.astream(inputs)):
+                    timer.chunk(token)
+                    pieces.append(token)
+                    yield StreamEvent("answer_token", token)
+                answer = "".join(pieces)
+                await run_in_sql_executor(self._store, msg, query, answer, result_text, failed)
+            yield StreamEvent("answer", answer)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            timer.finish(error)
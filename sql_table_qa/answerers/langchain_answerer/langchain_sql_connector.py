@@ -2,10 +2,12 @@ from typing import Optional, Type
 from langchain.pydantic_v1 import BaseModel, Field
 from langchain.tools import BaseTool, StructuredTool, tool
 
-from sql_table_qa.dbutils.database_connector import DatabaseConnector
+from sql_table_qa.answerers.result_digest import digest_result
+from sql_table_qa.resources import get_connector
 
 
-connector = DatabaseConnector()
+# Rows handed back to the LLM per call. It can ask for more with execute_sql_page.
+TOOL_PAGE_SIZE = 50
 
 
 @tool
@@ -13,9 +15,29 @@ def execute_sql(sql: str) -> str:
     """Executes an SQL statement on the Chinook database and get back the results.
     If the query is not correct, an error message will be returned.
     If an error is returned, rewrite the query, check the query, and try again.
+    Only the first rows of large results are returned; use execute_sql_page to see more.
+    """
+    return execute_sql_page.func(sql, 0)
+
+
+@tool
+def execute_sql_page(sql: str, page: int) -> str:
+    """Executes an SQL statement on the Chinook database and get back one page of the results.
+    Pages are numbered from 0. Use this to read large results a page at a time.
+    If the query is not correct, an error message will be returned.
     """
     try:
-        result = connector.execute_sql(sql)
+        result = get_connector().execute_sql_page(sql, page=page, page_size=TOOL_PAGE_SIZE)
     except Exception as e:
         return str(e)
-    return str(result)
+    text = digest_result(result.to_result(), sql=sql)
+    if result.has_more:
+        return f"{text}\n(Page {page}: more rows are available, request page {page + 1} to see them.)"
+    return text
+
+
+def __getattr__(name: str):
+    # `connector` used to be created on import. It is now the shared connector, built on first use.
+    if name == "connector":
+        return get_connector()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
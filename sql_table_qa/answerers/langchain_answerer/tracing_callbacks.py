@@ -0,0 +1,15 @@
+from langchain_core.callbacks import BaseCallbackHandler
+
+from sql_table_qa.tracing import current_span
+
+
+class SpanTokenUsageHandler(BaseCallbackHandler):
+    """Adds the token usage reported by each LLM call to the innermost open tracing span."""
+
+    def on_llm_end(self, response, **kwargs):
+        span = current_span()
+        if span is None:
+            return
+        token_usage = (response.llm_output or {}).get("token_usage", {})
+        span.add(prompt_tokens=token_usage.get("prompt_tokens", 0),
+                 completion_tokens=token_usage.get("completion_tokens", 0))
@@ -1,10 +1,15 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from CONSTANTS import ROOT_DIR, BOT, USER
+from sql_table_qa.answerers.conversation_context import MESSAGE_OVERHEAD_TOKENS
+from sql_table_qa.answerers.tokens import count_tokens
+from sql_table_qa.answerers.streaming import StreamTimer
+from sql_table_qa.tracing import span
 
 
 class OpenaiAnswerer:
-    def __init__(self, model: str = "gpt-3.5-turbo"):
-        self.client = OpenAI()
+    def __init__(self, model: str = "gpt-3.5-turbo", client: OpenAI = None, async_client: AsyncOpenAI = None):
+        self.client = client or OpenAI()
+        self.async_client = async_client or AsyncOpenAI()
         self.system_prompt = """You are a helpful assistant, expert sqlite user and data analyst.
         You attempt to answer user questions about the Chinook database using SQL queries.
         You can also ask clarifying questions if needed. You can provide insight from SQL query answers.
@@ -13,20 +18,99 @@ class OpenaiAnswerer:
         It is very important that you enclose SQL keywords in triple backticks (```) to avoid confusion."""
         self.model = model
 
-    def get_response(self, message: str, context: list[dict]):
+    def _build_messages(self, message: str, context: list[dict]) -> list[dict]:
         messages_to_send = [{"role": "system", "content": self.system_prompt}]
         if context:
             messages_to_send += context
         messages_to_send.append({"role": USER, "content": message})
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages_to_send
-        )
+        return messages_to_send
+
+    @staticmethod
+    def _record_usage(llm_span, response):
+        if getattr(response, "usage", None) is not None:
+            llm_span.set(prompt_tokens=response.usage.prompt_tokens,
+                         completion_tokens=response.usage.completion_tokens)
+
+    def get_response(self, message: str, context: list[dict]):
+        with span("llm.chat", model=self.model) as llm_span:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=self._build_messages(message, context)
+            )
+            self._record_usage(llm_span, response)
         return response
 
+    async def aget_response(self, message: str, context: list[dict], timeout: float = None):
+        with span("llm.chat", model=self.model) as llm_span:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=self._build_messages(message, context),
+                timeout=timeout
+            )
+            self._record_usage(llm_span, response)
+        return response
+
+    def _estimate_prompt_tokens(self, messages: list[dict]) -> int:
+        # Streamed completions do not report usage in this client version
+        return sum(count_tokens(str(m["content"]), self.model) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+    def stream_response(self, message: str, context: list[dict]):
+        """
+        Streams the reply to a message as it is generated.
+
+        Args:
+        message (str): The user message.
+        context (list[dict]): Earlier messages, e.g. from ConversationContext.build.
+
+        Yields:
+        str: Pieces of the reply text, as they arrive.
+        """
+        messages = self._build_messages(message, context)
+        timer = StreamTimer("llm.chat.stream", model=self.model)
+        text, error = [], None
+        try:
+            stream = self.client.chat.completions.create(model=self.model, messages=messages, stream=True)
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                timer.chunk(delta)
+                if delta:
+                    text.append(delta)
+                    yield delta
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            timer.finish(error, prompt_tokens=self._estimate_prompt_tokens(messages),
+                         completion_tokens=count_tokens("".join(text), self.model) if text else 0)
+
+    async def astream_response(self, message: str, context: list[dict], timeout: float = None):
+        """Same as `stream_response`, with the async client. `timeout` applies to the whole request."""
+        messages = self._build_messages(message, context)
+        timer = StreamTimer("llm.chat.stream", model=self.model)
+        text, error = [], None
+        try:
+            stream = await self.async_client.chat.completions.create(
+                model=self.model, messages=messages, stream=True, timeout=timeout)
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                timer.chunk(delta)
+                if delta:
+                    text.append(delta)
+                    yield delta
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            timer.finish(error, prompt_tokens=self._estimate_prompt_tokens(messages),
+                         completion_tokens=count_tokens("".join(text), self.model) if text else 0)
+
     def get_text_content_response(self, response) -> str:
         return response.choices[0].message.content
 
     def get_chat_response(self, message: str, context: list[dict]) -> str:
         response = self.get_response(message, context)
         return self.get_text_content_response(response)
+
+    async def aget_chat_response(self, message: str, context: list[dict], timeout: float = None) -> str:
+        response = await self.aget_response(message, context, timeout)
+        return self.get_text_content_response(response)
@@ -0,0 +1,270 @@
+import math
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from CONSTANTS import ROOT_DIR
+from sql_table_qa.dbutils.table_retriever import tokenize
+
+
+DEFAULT_QUESTION_CACHE_PATH = os.path.join(ROOT_DIR, "data", "question_cache.db")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercases a question and strips punctuation and extra whitespace."""
+    return " ".join(re.findall(r"[a-z0-9]+", question.lower()))
+
+
+def key_terms(question: str) -> frozenset:
+    """
+    The words and numbers a question cannot lose or change without changing its meaning.
+
+    Args:
+    question (str): The question.
+
+    Returns:
+    frozenset: Its lightly stemmed content words, quantifiers such as "most", "least" and
+        "how many" included, and every number in it.
+    """
+    normalized = normalize_question(question)
+    return frozenset(tokenize(normalized)) | frozenset(re.findall(r"\b\d+\b", normalized))
+
+
+def result_fingerprint(result: str) -> str:
+    """A short hash of the rendered result an answer was written from."""
+    return f"{zlib.crc32(result.encode()):08x}"
+
+
+def hashing_embedding(text: str, dimensions: int = 256) -> list:
+    """
+    Embeds text fully offline by hashing its word unigrams and bigrams into a fixed-size vector.
+
+    Every word of the normalized text counts, so that "most" and "least" or "which" and
+    "how many" pull questions apart.
+
+    Args:
+    text (str): The text to embed.
+    dimensions (int): Length of the vector.
+
+    Returns:
+    list: An L2-normalized vector of floats.
+    """
+    tokens = normalize_question(text).split()
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    vector = [0.0] * dimensions
+    for feature in features:
+        digest = zlib.crc32(feature.encode())
+        vector[digest % dimensions] += 1.0 if digest & 0x80000000 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else vector
+
+
+@dataclass
+class CachedAnswer:
+    """A question answered before, with the SQL and answer generated for it."""
+    question: str
+    sql: str
+    answer: str
+    similarity: float = 1.0
+    # result_fingerprint of the SQL result the answer was written from
+    result_hash: str = None
+
+    def answers(self, result: str) -> bool:
+        """Whether the cached answer was written from this rendering of the SQL result."""
+        return self.result_hash is not None and self.result_hash == result_fingerprint(result)
+
+
+class QuestionCache:
+    """
+    A persistent cache from user questions to the generated SQL and final answer.
+
+    Lookups first try the normalized question text in an in-process LRU, then in
+    a SQLite file, then (if an embedding function is given) the nearest cached
+    question above a similarity threshold that has the same key terms, so that
+    rewordings match but "most" never matches "least", nor "top 5" "top 10".
+    Entries are tagged with the model name and the database schema version, and
+    only match lookups with the same tags. The data can still change under an entry:
+    callers re-run its SQL and only reuse its answer if `CachedAnswer.answers` the result.
+    """
+
+    def __init__(self, path: str = DEFAULT_QUESTION_CACHE_PATH, max_memory_entries: int = 512,
+                 embed=hashing_embedding, similarity_threshold: float = 0.8, ttl_seconds: float = None):
+        """
+        Opens (and creates if needed) the cache file.
+
+        Args:
+        path (str): Path of the SQLite file backing the cache. ":memory:" keeps it in-process.
+        max_memory_entries (int): Size of the in-process LRU in front of the file.
+        embed (callable): Maps text to a normalized vector for nearest-neighbour lookups.
+            None disables similarity matching.
+        similarity_threshold (float): Minimum cosine similarity for a nearest-neighbour hit,
+            which must also have the same key_terms as the question.
+        ttl_seconds (float): Entries older than this are ignored. None keeps them forever.
+        """
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        # (model, schema_version) -> list of (embedding, key, created, key terms) for the nearest-neighbour scan
+        self._vectors = {}
+        self._hits = 0
+        self._similar_hits = 0
+        self._misses = 0
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS question_cache (
+                normalized TEXT NOT NULL,
+                model TEXT NOT NULL,
+                schema_version INTEGER NOT NULL,
+                question TEXT NOT NULL,
+                sql TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                embedding BLOB,
+                created REAL NOT NULL,
+                result_hash TEXT,
+                PRIMARY KEY (normalized, model, schema_version)
+            )""")
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(question_cache)")}
+        if "result_hash" not in columns:
+            # Files written before answers were tied to their result; their answers are never reused
+            self._connection.execute("ALTER TABLE question_cache ADD COLUMN result_hash TEXT")
+        self._connection.commit()
+
+    def get(self, question: str, model: str, schema_version: int) -> CachedAnswer:
+        """
+        Looks up a previously answered question.
+
+        Args:
+        question (str): The user question.
+        model (str): Name of the model that would answer it.
+        schema_version (int): Current schema version of the database.
+
+        Returns:
+        CachedAnswer: The cached SQL and answer, or None on a miss.
+        """
+        key = (normalize_question(question), model, schema_version)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[1]):
+                self._memory.move_to_end(key)
+                self._hits += 1
+                return entry[0]
+            row = self._connection.execute(
+                "SELECT question, sql, answer, created, result_hash FROM question_cache "
+                "WHERE normalized = ? AND model = ? AND schema_version = ?", key).fetchone()
+            if row is not None and not self._expired(row[3]):
+                cached = CachedAnswer(row[0], row[1], row[2], result_hash=row[4])
+                self._remember(key, cached, row[3])
+                self._hits += 1
+                return cached
+            cached = self._nearest(question, model, schema_version)
+            if cached is None:
+                self._misses += 1
+            else:
+                self._similar_hits += 1
+            return cached
+
+    def put(self, question: str, model: str, schema_version: int, sql: str, answer: str, result: str = None):
+        """
+        Stores the SQL and answer generated for a question.
+
+        Args:
+        question (str): The user question.
+        model (str): Name of the model that answered it.
+        schema_version (int): Schema version of the database when it was answered.
+        sql (str): The generated SQL query.
+        answer (str): The final answer.
+        result (str): The rendered SQL result the answer was written from.
+        """
+        key = (normalize_question(question), model, schema_version)
+        vector = self.embed(question) if self.embed is not None else None
+        result_hash = result_fingerprint(result) if result is not None else None
+        created = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO question_cache (normalized, model, schema_version, question, sql, "
+                "answer, embedding, created, result_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, question, sql, answer, self._pack(vector), created, result_hash))
+            self._connection.commit()
+            self._remember(key, CachedAnswer(question, sql, answer, result_hash=result_hash), created)
+            vectors = self._vectors.get((model, schema_version))
+            if vectors is not None and vector is not None:
+                vectors.append((vector, key[0], created, key_terms(key[0])))
+
+    def stats(self) -> dict:
+        """
+        Returns lookup counters.
+
+        Returns:
+        dict: exact hits, similarity hits, misses and number of in-memory entries.
+        """
+        with self._lock:
+            return {"hits": self._hits, "similar_hits": self._similar_hits,
+                    "misses": self._misses, "memory_entries": len(self._memory)}
+
+    def clear(self):
+        """Deletes every cached question."""
+        with self._lock:
+            self._connection.execute("DELETE FROM question_cache")
+            self._connection.commit()
+            self._memory.clear()
+            self._vectors.clear()
+
+    def _nearest(self, question: str, model: str, schema_version: int):
+        if self.embed is None:
+            return None
+        vectors = self._vectors.get((model, schema_version))
+        if vectors is None:
+            rows = self._connection.execute(
+                "SELECT embedding, normalized, created FROM question_cache "
+                "WHERE model = ? AND schema_version = ? AND embedding IS NOT NULL",
+                (model, schema_version)).fetchall()
+            vectors = [(self._unpack(blob), normalized, created, key_terms(normalized))
+                       for blob, normalized, created in rows]
+            self._vectors[(model, schema_version)] = vectors
+        if not vectors:
+            return None
+        query = self.embed(question)
+        terms = key_terms(question)
+        best_similarity, best_key = 0.0, None
+        for vector, normalized, created, candidate_terms in vectors:
+            if candidate_terms != terms or len(vector) != len(query) or self._expired(created):
+                continue
+            similarity = sum(a * b for a, b in zip(query, vector))
+            if similarity > best_similarity:
+                best_similarity, best_key = similarity, normalized
+        if best_key is None or best_similarity < self.similarity_threshold:
+            return None
+        row = self._connection.execute(
+            "SELECT question, sql, answer, result_hash FROM question_cache "
+            "WHERE normalized = ? AND model = ? AND schema_version = ?",
+            (best_key, model, schema_version)).fetchone()
+        if row is None:
+            return None
+        return CachedAnswer(row[0], row[1], row[2], similarity=best_similarity, result_hash=row[3])
+
+    def _remember(self, key: tuple, cached: CachedAnswer, created: float):
+        self._memory[key] = (cached, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created > self.ttl_seconds
+
+    @staticmethod
+    def _pack(vector: list):
+        return None if vector is None else struct.pack(f"{len(vector)}f", *vector)
+
+    @staticmethod
+    def _unpack(blob: bytes) -> list:
+        return list(struct.unpack(f"{len(blob) // 4}f", blob))
@@ -0,0 +1,192 @@
+"""Renders SQL results for LLM prompts within a token budget.
+
+A result that fits in the budget is rendered whole, as a pipe-separated table followed by
+its size, e.g. "(3 rows x 2 columns)". A larger one is reduced to a digest: its first and
+last rows (under the query's ORDER BY, when it has one), its size, and per-column distinct
+and null counts with min/max/mean. The column statistics are computed with pandas over the
+whole result, so the cost of a digest does not depend on how many rows are rendered.
+"""
+import math
+
+from sqlglot import exp
+
+from CONSTANTS import RESULT_DIGEST_MAX_TOKENS, RESULT_DIGEST_ROWS
+from sql_table_qa.answerers.tokens import count_tokens, truncate_tokens
+from sql_table_qa.dbutils.query_result import CHARS_PER_TOKEN, QueryResult
+from sql_table_qa.dbutils.sql_analysis import analyze_sql
+
+
+def describe_order(sql: str) -> str:
+    """
+    Returns the ORDER BY of a query's outermost SELECT, e.g. "Total DESC, Name".
+
+    Args:
+    sql (str): The query, or None.
+
+    Returns:
+    str: The ordering terms, or None if the query is not ordered or cannot be parsed.
+    """
+    if not sql:
+        return None
+    statement = analyze_sql(sql).statement
+    order = statement.args.get("order") if isinstance(statement, exp.Query) else None
+    if order is None:
+        return None
+    return ", ".join(term.sql(dialect="sqlite") for term in order.expressions)
+
+
+def _format_value(value) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NULL"
+    return str(value)
+
+
+def _format_stat(value) -> str:
+    if isinstance(value, str):
+        return repr(value)
+    if float(value).is_integer():
+        return str(int(value))
+    return f"{value:.6g}"
+
+
+def _row_line(row) -> str:
+    return " | ".join(_format_value(value) for value in row)
+
+
+class _Table:
+    """Column names, row access and a DataFrame view over a QueryResult or a DataFrame."""
+
+    def __init__(self, result):
+        self.result = result
+        self.columns = [str(column) for column in result.columns]
+        self.row_count = len(result)
+        self.truncated = isinstance(result, QueryResult) and result.truncated
+
+    def rows(self, start: int = 0, stop: int = None) -> list:
+        if isinstance(self.result, QueryResult):
+            return list(zip(*(values[start:stop] for values in self.result.data)))
+        return list(self.result.iloc[start:stop].itertuples(index=False, name=None))
+
+    def iter_rows(self):
+        if isinstance(self.result, QueryResult):
+            return zip(*self.result.data)
+        return self.result.itertuples(index=False, name=None)
+
+    def frame(self):
+        """The result as a DataFrame with positional column labels, since names may repeat."""
+        frame = self.result.to_dataframe() if isinstance(self.result, QueryResult) else self.result
+        return frame.set_axis(range(len(self.columns)), axis=1)
+
+
+def column_stats(table: _Table) -> list:
+    """
+    Summarizes every column of a result in one line.
+
+    Args:
+    table (_Table): The result.
+
+    Returns:
+    list: "<column>: <n> distinct, <n> null, min <v>, max <v>, mean <v>" lines. Min and max
+        are given for numeric columns and columns of comparable values such as text dates,
+        the mean for numeric columns only.
+    """
+    frame = table.frame()
+    distinct = frame.nunique(dropna=True)
+    nulls = frame.isna().sum()
+    # Column-wise reductions over the numeric block, rather than one aggregation per column
+    numeric = frame.select_dtypes("number")
+    lows, highs, means = numeric.min(), numeric.max(), numeric.mean()
+    lines = []
+    for position, name in enumerate(table.columns):
+        parts = [f"{distinct[position]} distinct"]
+        if nulls[position]:
+            parts.append(f"{nulls[position]} null")
+        if position in numeric.columns:
+            if not math.isnan(lows[position]):
+                parts += [f"min {_format_stat(lows[position])}", f"max {_format_stat(highs[position])}",
+                          f"mean {_format_stat(means[position])}"]
+        elif distinct[position]:
+            values = frame[position].dropna()
+            try:
+                parts += [f"min {_format_stat(values.min())}", f"max {_format_stat(values.max())}"]
+            except (TypeError, ValueError):
+                # Values of mixed types cannot be compared
+                pass
+        lines.append(f"{name}: {', '.join(parts)}")
+    return lines
+
+
+def _truncation_note(table: _Table) -> list:
+    if not table.truncated:
+        return []
+    return [f"(The query returned more rows: the result was cut at {table.row_count} rows, "
+            f"and everything above describes those rows only.)"]
+
+
+def _render_digest(table: _Table, head: list, tail: list, order: str, stats: list) -> str:
+    shown = len(head) + len(tail)
+    lines = [" | ".join(table.columns), *map(_row_line, head)]
+    if table.row_count > shown:
+        lines.append(f"... ({table.row_count - shown} rows not shown) ...")
+    lines += map(_row_line, tail)
+    ordering = f"ordered by {order}" if order else "in result order"
+    lines.append(f"({table.row_count} rows x {len(table.columns)} columns, {ordering}. "
+                 f"Showing the first {len(head)} and last {len(tail)} rows.)")
+    if stats:
+        lines += ["Column summary:", *stats]
+    return "\n".join(lines + _truncation_note(table))
+
+
+def digest_result(result, max_tokens: int = RESULT_DIGEST_MAX_TOKENS, sql: str = None,
+                  rows: int = RESULT_DIGEST_ROWS, model: str = "gpt-3.5-turbo") -> str:
+    """
+    Renders a query result for an LLM prompt in at most `max_tokens` tokens.
+
+    Args:
+    result: A QueryResult, a pandas DataFrame, or the error message of a failed query, which is returned as is.
+    max_tokens (int): Token budget of the rendering.
+    sql (str): The query that produced the result, to say how the first and last rows are ordered.
+    rows (int): First and last rows shown when the whole result does not fit.
+    model (str): The model whose tokenizer counts tokens.
+
+    Returns:
+    str: The whole result as a header line, one line per row and its size if it fits, a digest otherwise.
+    """
+    if isinstance(result, str):
+        return result
+    table = _Table(result)
+    if not table.columns:
+        return "(no result)"
+
+    # Rows are measured in characters, so that only the rendering as a whole is tokenized
+    notes = [f"({table.row_count} rows x {len(table.columns)} columns)", *_truncation_note(table)]
+    lines = [" | ".join(table.columns)]
+    budget = max_tokens * CHARS_PER_TOKEN
+    used = sum(len(line) + 1 for line in lines + notes)
+    for row in table.iter_rows():
+        line = _row_line(row)
+        used += len(line) + 1
+        if used > budget:
+            break
+        lines.append(line)
+    else:
+        text = "\n".join(lines + notes)
+        if count_tokens(text, model) <= max_tokens:
+            return text
+
+    order = describe_order(sql)
+    stats = column_stats(table)
+    rows = max(1, min(rows, table.row_count // 2))
+    while True:
+        head = table.rows(0, rows)
+        tail = table.rows(max(rows, table.row_count - rows))
+        text = _render_digest(table, head, tail, order, stats)
+        if count_tokens(text, model) <= max_tokens:
+            return text
+        if rows > 1:
+            rows //= 2
+        elif stats:
+            # Even one row at each end is too much with every column summarized
+            stats = stats[:-1]
+        else:
+            return truncate_tokens(text, max_tokens, model)
@@ -0,0 +1,144 @@
+"""Helpers for streaming answers token by token.
+
+`timed_stream` wraps a stream of text chunks and records how long the stream took and
+its time to first token, as the tracing stages "<name>" and "<name>.first_token".
+`SQLBlockDetector` finds triple-backtick SQL blocks in streamed text as soon as their
+closing backticks arrive, so the SQL can run before the rest of the response is written.
+"""
+import re
+import time
+from typing import NamedTuple
+
+from sql_table_qa.tracing import record
+
+
+class StreamEvent(NamedTuple):
+    """
+    One step of a streamed answer.
+
+    kind is one of:
+    "sql_token": a piece of the SQL query being written (str),
+    "sql": the complete SQL query (str),
+    "result": the query result (DataFrame, or the error message if the query failed),
+    "answer_token": a piece of the answer being written (str),
+    "answer": the complete answer (str).
+    """
+    kind: str
+    content: object
+
+
+class StreamTimer:
+    """Times one stream: call `chunk` for every chunk and `finish` at the end."""
+
+    def __init__(self, name: str, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.chunks = 0
+
+    def chunk(self, text: str = ""):
+        """Notes that a chunk arrived. The first non-empty one sets the time to first token."""
+        if self.first_token is None and text:
+            self.first_token = time.perf_counter() - self.started
+            record(f"{self.name}.first_token", self.first_token, **self.attributes)
+        self.chunks += 1
+
+    def finish(self, error: BaseException = None, **attributes):
+        """Records the stream duration, with the time to first token and chunk count as attributes."""
+        error_name = type(error).__name__ if error is not None and not isinstance(error, GeneratorExit) else None
+        record(self.name, time.perf_counter() - self.started, error_name, chunks=self.chunks,
+               **({"ttft": self.first_token} if self.first_token is not None else {}),
+               **self.attributes, **attributes)
+
+
+def timed_stream(name: str, chunks, **attributes):
+    """
+    Passes text chunks through, recording the stream duration and time to first token.
+
+    Args:
+    name (str): The tracing stage, e.g. "llm.chat".
+    chunks: An iterable of text chunks.
+    **attributes: Attributes of the recorded stages.
+
+    Yields:
+    str: The chunks, unchanged.
+    """
+    timer = StreamTimer(name, **attributes)
+    error = None
+    try:
+        for chunk in chunks:
+            timer.chunk(chunk)
+            yield chunk
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        timer.finish(error)
+
+
+async def atimed_stream(name: str, chunks, **attributes):
+    """Same as `timed_stream`, for an async iterable of chunks."""
+    timer = StreamTimer(name, **attributes)
+    error = None
+    try:
+        async for chunk in chunks:
+            timer.chunk(chunk)
+            yield chunk
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        timer.finish(error)
+
+
+_FENCE = "```"
+_LANGUAGE_TAG = re.compile(r"^(?:sql|sqlite)?[ \t]*\n", re.IGNORECASE)
+
+
+class SQLBlockDetector:
+    """
+    Finds triple-backtick code blocks in text that arrives in pieces.
+
+    Backticks split across chunks are handled. A language tag such as "sql" after the
+    opening backticks is dropped.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.blocks = []
+        self._scanned = 0
+        self._block_start = None
+
+    @property
+    def in_block(self) -> bool:
+        """Whether an opened block has not been closed yet."""
+        return self._block_start is not None
+
+    def feed(self, chunk: str) -> list:
+        """
+        Adds a chunk of text.
+
+        Args:
+        chunk (str): The next piece of the response.
+
+        Returns:
+        list: The code blocks completed by this chunk, stripped.
+        """
+        self.text += chunk
+        completed = []
+        while True:
+            fence = self.text.find(_FENCE, self._scanned)
+            if fence < 0:
+                # A fence may be cut between this chunk and the next
+                self._scanned = max(self._scanned, len(self.text) - len(_FENCE) + 1)
+                return completed
+            self._scanned = fence + len(_FENCE)
+            if self._block_start is None:
+                self._block_start = self._scanned
+                continue
+            block = self.text[self._block_start:fence]
+            self._block_start = None
+            block = _LANGUAGE_TAG.sub("", block, count=1)
+            completed.append(block.strip())
+            self.blocks.append(completed[-1])
@@ -0,0 +1,46 @@
+"""Token counting for prompts, with tiktoken when it is installed and from the character count otherwise."""
+from functools import lru_cache
+
+from sql_table_qa.dbutils.query_result import CHARS_PER_TOKEN
+
+
+@lru_cache(maxsize=8)
+def get_tokenizer(model: str = "gpt-3.5-turbo"):
+    """
+    Returns the tiktoken encoding of a model, loaded once per process.
+
+    Args:
+    model (str): The OpenAI model name.
+
+    Returns:
+    The encoding, or None if tiktoken is not installed or cannot load it (it downloads encodings on first use).
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """Counts the tokens of a text, memoized since the same history is counted on every turn."""
+    tokenizer = get_tokenizer(model)
+    if tokenizer is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(tokenizer.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-3.5-turbo") -> str:
+    """Cuts a text down to at most `max_tokens` tokens, marking the cut with an ellipsis."""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    tokenizer = get_tokenizer(model)
+    if tokenizer is None:
+        return text[:max(0, max_tokens * CHARS_PER_TOKEN - 1)] + "…"
+    return tokenizer.decode(tokenizer.encode(text, disallowed_special=())[:max(0, max_tokens - 1)]) + "…"
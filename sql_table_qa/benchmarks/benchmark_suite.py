@@ -0,0 +1,354 @@
+"""Benchmarks of the database connector and the answer pipeline at several data scales.
+
+Each benchmark repeats one operation over a fixed workload: the reference SQL and the
+questions of the evaluation dataset, plus a few heavier aggregations. The timed pass runs
+without tracemalloc, which slows Python down; a separate pass under tracemalloc records
+the peak memory. The full pipeline is answered by the offline fake LLM, so everything
+runs without network access and gives the same answers every time.
+
+Results are appended to data/benchmark_history.jsonl, one line per benchmark and scale,
+and compared with the previous record of the same benchmark: a median latency or peak
+memory that grew by more than --threshold is reported as a regression. Scales other
+than 1 run on the databases built by sql_table_qa.benchmarks.synthetic_chinook, which
+are generated first if missing.
+
+Usage:
+    python -m sql_table_qa.benchmarks.benchmark_suite --scale 1 10
+    python -m sql_table_qa.benchmarks.benchmark_suite --scale 100 --only execute_sql pipeline --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+
+from CONSTANTS import DATABASE_PATH, ROOT_DIR
+from sql_table_qa.answerers.result_digest import digest_result
+from sql_table_qa.benchmarks.synthetic_chinook import default_scaled_path, generate
+from sql_table_qa.dbutils import schema_introspector
+from sql_table_qa.dbutils.chinook_descriptions import CHINOOK_DESCRIPTIONS
+from sql_table_qa.dbutils.database_connector import DatabaseConnector
+from sql_table_qa.dbutils.query_cache import QueryResultCache
+from sql_table_qa.dbutils.sql_analysis import analyze_sql
+from sql_table_qa.evaluators.batch_evaluator import load_dataset, percentile
+from sql_table_qa.tracing import tracer
+
+
+HISTORY_PATH = os.path.join(ROOT_DIR, "data", "benchmark_history.jsonl")
+
+# Queries whose cost grows with the scaled tables, on top of the evaluation dataset's
+SCALE_QUERIES = (
+    "SELECT g.Name, SUM(l.UnitPrice * l.Quantity) AS revenue FROM InvoiceLine l "
+    "JOIN Track t ON t.TrackId = l.TrackId JOIN Genre g ON g.GenreId = t.GenreId "
+    "GROUP BY g.Name ORDER BY revenue DESC",
+    "SELECT c.Country, COUNT(DISTINCT c.CustomerId) AS customers, SUM(i.Total) AS total FROM Invoice i "
+    "JOIN Customer c ON c.CustomerId = i.CustomerId GROUP BY c.Country ORDER BY total DESC",
+    "SELECT strftime('%Y-%m', InvoiceDate) AS month, COUNT(*) AS invoices, SUM(Total) AS total "
+    "FROM Invoice GROUP BY month ORDER BY month",
+    "SELECT p.Name, COUNT(*) AS tracks FROM Playlist p JOIN PlaylistTrack pt ON pt.PlaylistId = p.PlaylistId "
+    "GROUP BY p.PlaylistId ORDER BY tracks DESC LIMIT 10",
+    "SELECT InvoiceLineId, InvoiceId, TrackId, UnitPrice, Quantity FROM InvoiceLine WHERE Quantity = 1",
+)
+
+
+@dataclass
+class BenchmarkResult:
+    """Throughput, latency percentiles and peak memory of one benchmark at one scale."""
+    benchmark: str
+    scale: int
+    operations: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+    throughput: float = 0.0
+    mean: float = 0.0
+    p50: float = 0.0
+    p95: float = 0.0
+    p99: float = 0.0
+    peak_memory: int = 0
+    max_rss: int = 0
+    stages: dict = field(default_factory=dict)
+
+
+def _max_rss() -> int:
+    """The peak resident set size of the process so far, in bytes. 0 where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux and in bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def measure(name: str, operation, workload: list, scale: int, repeat: int = 3, warmup: int = 1) -> BenchmarkResult:
+    """
+    Runs `operation` over every item of `workload`, `repeat` times, and measures it.
+
+    Args:
+    name (str): The benchmark name.
+    operation (callable): Called with one workload item per operation. Exceptions count as errors.
+    workload (list): The items to run the operation on.
+    scale (int): The data scale, recorded with the result.
+    repeat (int): Timed passes over the workload.
+    warmup (int): Untimed passes before timing, to fill caches and load lazy state.
+
+    Returns:
+    BenchmarkResult: The measurements.
+    """
+    for _ in range(warmup):
+        for item in workload:
+            try:
+                operation(item)
+            except Exception:
+                pass
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for item in workload:
+            operation_started = time.perf_counter()
+            try:
+                operation(item)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - operation_started)
+    seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    try:
+        for item in workload:
+            try:
+                operation(item)
+            except Exception:
+                pass
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return BenchmarkResult(
+        benchmark=name, scale=scale, operations=len(latencies), errors=errors, seconds=seconds,
+        throughput=len(latencies) / seconds if seconds else 0.0,
+        mean=sum(latencies) / len(latencies) if latencies else 0.0,
+        p50=percentile(latencies, 0.5), p95=percentile(latencies, 0.95), p99=percentile(latencies, 0.99),
+        peak_memory=peak_memory, max_rss=_max_rss())
+
+
+class BenchmarkSuite:
+    """The benchmarks of one database. Each is a method returning (operation, workload)."""
+
+    BENCHMARKS = ("execute_sql", "execute_sql.cached", "validate_sql", "validate_sql.cold",
+                  "schema", "schema.introspect", "serialize.to_text", "serialize.digest", "serialize.to_dataframe", "pipeline")
+
+    def __init__(self, database_path: str = DATABASE_PATH, scale: int = 1, engine: str = None):
+        """
+        Initializes the suite.
+
+        Args:
+        database_path (str): The database to benchmark.
+        scale (int): Its scale relative to the original Chinook database.
+        engine (str): "sqlite", "duckdb" or "auto". Defaults to the connector default.
+        """
+        self.database_path = database_path
+        self.scale = scale
+        self.connector_kwargs = {"engine": engine} if engine else {}
+        evaluation = load_dataset("evaluation")
+        self.queries = [row["sql_query"] for row in evaluation] + list(SCALE_QUERIES)
+        self.questions = [row["question"] for row in evaluation]
+        self._results = None
+
+    def connector(self, **kwargs) -> DatabaseConnector:
+        return DatabaseConnector(self.database_path, **{"use_cache": False, **self.connector_kwargs, **kwargs})
+
+    def results(self) -> list:
+        """The results of the workload queries, computed once for the serialization benchmarks."""
+        if self._results is None:
+            connector = self.connector()
+            self._results = [connector.execute_sql(sql) for sql in self.queries]
+        return self._results
+
+    def execute_sql(self):
+        return self.connector().execute_sql, self.queries
+
+    def execute_sql_cached(self):
+        return self.connector(use_cache=True, cache=QueryResultCache()).execute_sql, self.queries
+
+    def validate_sql(self):
+        return self.connector().validate_sql, self.queries
+
+    def validate_sql_cold(self):
+        connector = self.connector()
+
+        def validate(sql):
+            analyze_sql.cache_clear()
+            return connector.validate_sql(sql)
+        return validate, self.queries
+
+    def schema(self):
+        connector = self.connector()
+
+        def describe(table):
+            connector.get_table_names_and_description()
+            connector.get_table_schema(table)
+            return connector.get_table_prompts([table])
+        return describe, list(connector.database_schema)
+
+    def schema_introspect(self):
+        pool = self.connector().pool
+
+        def introspect(_):
+            schema_introspector._introspection_cache.clear()
+            return schema_introspector.SchemaIntrospector(pool, CHINOOK_DESCRIPTIONS).get_table_prompts()
+        return introspect, [None]
+
+    def serialize_to_text(self):
+        return (lambda result: result.to_text()), self.results()
+
+    def serialize_digest(self):
+        return (lambda result: digest_result(result)), self.results()
+
+    def serialize_to_dataframe(self):
+        return (lambda result: result.to_dataframe()), self.results()
+
+    def pipeline(self):
+        from sql_table_qa.answerers.langchain_answerer.langchain_naive_answerer import LangchainNaiveAnswerer
+        from sql_table_qa.evaluators.fake_llm import FakeSQLChatModel
+
+        answerer = LangchainNaiveAnswerer(llm=FakeSQLChatModel.from_dataset(), use_question_cache=False,
+                                          connector=self.connector())
+        return answerer.call, self.questions
+
+    def run(self, name: str, repeat: int = 3) -> BenchmarkResult:
+        """
+        Runs one benchmark. The stages traced while it runs are summarized in `stages`.
+
+        Args:
+        name (str): One of BENCHMARKS.
+        repeat (int): Timed passes over the workload.
+
+        Returns:
+        BenchmarkResult: The measurements.
+        """
+        if name not in self.BENCHMARKS:
+            raise ValueError(f"Unknown benchmark: {name}")
+        operation, workload = getattr(self, name.replace(".", "_"))()
+        tracer.reset()
+        result = measure(name, operation, workload, self.scale, repeat=repeat)
+        result.stages = {stage: {"count": stats["count"], "p50": stats["p50"], "p95": stats["p95"]}
+                         for stage, stats in tracer.stage_stats().items()}
+        return result
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def load_history(path: str = HISTORY_PATH) -> list:
+    """Reads the recorded benchmark results, oldest first."""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def record(results: list, path: str = HISTORY_PATH) -> dict:
+    """
+    Appends results to the history file, tagged with the commit, time and machine they were measured on.
+
+    Args:
+    results (list): BenchmarkResults.
+    path (str): The history file.
+
+    Returns:
+    dict: The run metadata added to every record.
+    """
+    run = {
+        "run": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} {os.cpu_count()} cpus",
+    }
+    with open(path, "a") as f:
+        for result in results:
+            f.write(json.dumps({**run, **asdict(result)}) + "\n")
+    return run
+
+
+def find_regressions(results: list, history: list, threshold: float = 0.25) -> list:
+    """
+    Compares results with the latest recorded result of the same benchmark, scale and machine.
+
+    Args:
+    results (list): BenchmarkResults.
+    history (list): Recorded results, as returned by `load_history`.
+    threshold (float): Relative growth of the median latency or peak memory reported as a regression.
+
+    Returns:
+    list: One message per regression.
+    """
+    machine = f"{platform.system()} {platform.machine()} {os.cpu_count()} cpus"
+    latest = {(r["benchmark"], r["scale"]): r for r in history if r.get("machine") == machine}
+    regressions = []
+    for result in results:
+        previous = latest.get((result.benchmark, result.scale))
+        if previous is None:
+            continue
+        for metric in ("p50", "peak_memory"):
+            before, after = previous[metric], getattr(result, metric)
+            if before and after > before * (1 + threshold):
+                regressions.append(f"{result.benchmark} x{result.scale}: {metric} {before:.6g} -> {after:.6g} "
+                                   f"(+{after / before - 1:.0%} since {previous['commit'] or previous['run']})")
+    return regressions
+
+
+def format_results(results: list) -> str:
+    lines = [f"{'benchmark':24} {'scale':>6} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+             f"{'peak MB':>8} {'errors':>6}"]
+    for r in results:
+        lines.append(f"{r.benchmark:24} {r.scale:>6} {r.throughput:>10.1f} {r.p50 * 1000:>9.3f} "
+                     f"{r.p95 * 1000:>9.3f} {r.p99 * 1000:>9.3f} {r.peak_memory / 2 ** 20:>8.2f} {r.errors:>6}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, nargs="+", default=[1],
+                        help="Data scales to run at. 1 is the original database.")
+    parser.add_argument("--only", nargs="+", choices=BenchmarkSuite.BENCHMARKS, default=BenchmarkSuite.BENCHMARKS)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes over each workload.")
+    parser.add_argument("--engine", choices=["sqlite", "duckdb", "auto"], default=None)
+    parser.add_argument("--history", default=HISTORY_PATH, help="The results history file.")
+    parser.add_argument("--no-record", action="store_true", help="Do not append the results to the history.")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Relative slowdown or memory growth reported as a regression.")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions.")
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scale:
+        database_path = DATABASE_PATH if scale == 1 else generate(scale, default_scaled_path(scale))
+        suite = BenchmarkSuite(database_path, scale, engine=args.engine)
+        for name in args.only:
+            results.append(suite.run(name, repeat=args.repeat))
+            print(format_results(results[-1:]).splitlines()[-1], flush=True)
+    print()
+    print(format_results(results))
+
+    regressions = find_regressions(results, load_history(args.history), args.threshold)
+    if not args.no_record:
+        record(results, args.history)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Measures the cold-start and per-rerun cost of the Streamlit app.
+
+Startup: the import time of the app's modules, each in a fresh interpreter.
+Rerun: the setup app/app.py does on every Streamlit rerun (config, clients and both
+answerers), once rebuilding everything as the app used to and once looked up in the
+process-wide registry of sql_table_qa.resources. If Streamlit is installed, the app
+itself is also run and rerun headless with streamlit.testing.
+
+Nothing is sent to OpenAI. A placeholder OPENAI_API_KEY is set when none is configured,
+since the clients only need one to be constructed.
+
+Usage:
+    python -m sql_table_qa.benchmarks.startup_report
+    python -m sql_table_qa.benchmarks.startup_report --reruns 20 --import-runs 5
+"""
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+import time
+
+from CONSTANTS import ROOT_DIR
+from sql_table_qa import resources
+from sql_table_qa.evaluators.batch_evaluator import percentile
+
+
+STARTUP_MODULES = (
+    "CONSTANTS",
+    "sql_table_qa",
+    "sql_table_qa.resources",
+    "sql_table_qa.tracing",
+    "sql_table_qa.dbutils.database_connector",
+    "sql_table_qa.answerers.openai_answerer.openai_answerer",
+    "sql_table_qa.answerers.langchain_answerer.langchain_naive_answerer",
+)
+APP_PATH = os.path.join(ROOT_DIR, "app", "app.py")
+
+_IMPORT_TIMER = "import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+
+
+def import_seconds(module: str, runs: int = 3) -> float:
+    """The fastest of `runs` imports of a module, each in a fresh interpreter, in seconds."""
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", _IMPORT_TIMER.format(module=module)], cwd=ROOT_DIR,
+                                capture_output=True, text=True, check=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return min(timings)
+
+
+def app_setup():
+    """What app/app.py builds at the top of every run."""
+    resources.get_config()
+    resources.get_sql_answerer()
+    resources.get_general_answerer()
+
+
+def rerun_seconds(reruns: int, rebuild: bool) -> list:
+    """
+    Times the app setup over several reruns.
+
+    Args:
+    reruns (int): Number of reruns after the first run.
+    rebuild (bool): Build everything on every rerun instead of reusing the registry.
+
+    Returns:
+    list: Seconds per rerun.
+    """
+    resources.clear_resources()
+    app_setup()
+    timings = []
+    for _ in range(reruns):
+        if rebuild:
+            resources.clear_resources()
+        started = time.perf_counter()
+        app_setup()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def app_test_seconds(reruns: int) -> tuple:
+    """Runs the app headless with streamlit.testing and times its first run and reruns. None if not installed."""
+    if importlib.util.find_spec("streamlit") is None:
+        return None
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP_PATH, default_timeout=60)
+    started = time.perf_counter()
+    app.run()
+    first = time.perf_counter() - started
+    timings = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app.run()
+        timings.append(time.perf_counter() - started)
+    return first, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--import-runs", type=int, default=3, help="Fresh interpreters per module import.")
+    args = parser.parse_args()
+    os.environ.setdefault("OPENAI_API_KEY", resources.get_config().get("OPENAI_API_KEY") or "sk-startup-report")
+
+    print("Cold import (fastest of fresh interpreters):")
+    for module in STARTUP_MODULES:
+        print(f"  {module:68} {import_seconds(module, args.import_runs) * 1000:9.1f} ms")
+
+    print(f"\nPer-rerun app setup over {args.reruns} reruns:")
+    for label, rebuild in (("rebuilt every rerun", True), ("process-wide registry", False)):
+        timings = rerun_seconds(args.reruns, rebuild)
+        print(f"  {label:24} p50 {percentile(timings, 0.5) * 1000:10.3f} ms   max {max(timings) * 1000:10.3f} ms")
+    for key, stats in resources.resource_stats().items():
+        print(f"    {key:40} built in {stats['build_seconds'] * 1000:8.1f} ms, {stats['lookups']} lookups")
+
+    app_timings = app_test_seconds(args.reruns)
+    if app_timings is None:
+        print("\nStreamlit is not installed, skipping the headless app run.")
+    else:
+        first, timings = app_timings
+        print(f"\nHeadless app: first run {first * 1000:.1f} ms, "
+              f"rerun p50 {percentile(timings, 0.5) * 1000:.1f} ms, max {max(timings) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Builds scaled-up copies of the Chinook database for benchmarking.
+
+A database at scale N holds N copies of the customer-facing tables (Customer, Invoice,
+InvoiceLine, Playlist and PlaylistTrack) while the catalog (Artist, Album, Track, Genre,
+MediaType) and the employees stay as they are. Copy k of a row gets its key offset by
+k times the largest original key and every foreign key is remapped the same way, so the
+scaled database is referentially consistent. Copies are varied deterministically: last
+names are swapped between customers, invoice dates move by up to a month, and invoice
+lines and playlists point at other tracks, with unit prices and invoice totals
+recomputed to match. The same scale always produces the same database.
+
+Usage:
+    python -m sql_table_qa.benchmarks.synthetic_chinook --scale 10 100
+    python -m sql_table_qa.benchmarks.synthetic_chinook --scale 1000 --output /tmp/Chinook_x1000.db
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+from CONSTANTS import DATABASE_PATH, ROOT_DIR
+
+
+SCALES = (10, 100, 1000)
+SCALED_TABLES = ("Customer", "Invoice", "InvoiceLine", "Playlist", "PlaylistTrack")
+
+# Each statement reads the original rows only (key <= the original maximum), so running
+# them in this order never copies a copy. `k` is the copy number from the `copies` table
+# and `:customers`, `:invoices`... are the original maximum keys.
+_COPY_STATEMENTS = (
+    """
+    INSERT INTO Customer
+    SELECT c.CustomerId + copies.k * :customers, c.FirstName, other.LastName, c.Company, c.Address,
+           c.City, c.State, c.Country, c.PostalCode, c.Phone, c.Fax,
+           lower(c.FirstName) || '.' || lower(other.LastName) || copies.k || substr(c.Email, instr(c.Email, '@')),
+           c.SupportRepId
+    FROM copies
+    JOIN Customer AS c ON c.CustomerId <= :customers
+    JOIN customer_index AS position ON position.CustomerId = c.CustomerId
+    JOIN customer_index AS other_position
+      ON other_position.pos = (position.pos + copies.k * 7) % :customer_count
+    JOIN Customer AS other ON other.CustomerId = other_position.CustomerId
+    ORDER BY copies.k, c.CustomerId
+    """,
+    """
+    INSERT INTO Invoice
+    SELECT i.InvoiceId + copies.k * :invoices, i.CustomerId + copies.k * :customers,
+           datetime(i.InvoiceDate, ((i.InvoiceId * 31 + copies.k * 17) % 61 - 30) || ' days'),
+           i.BillingAddress, i.BillingCity, i.BillingState, i.BillingCountry, i.BillingPostalCode, 0
+    FROM copies JOIN Invoice AS i ON i.InvoiceId <= :invoices
+    ORDER BY copies.k, i.InvoiceId
+    """,
+    """
+    INSERT INTO InvoiceLine
+    SELECT l.InvoiceLineId + copies.k * :invoice_lines, l.InvoiceId + copies.k * :invoices,
+           track.TrackId, track.UnitPrice, l.Quantity
+    FROM copies
+    JOIN InvoiceLine AS l ON l.InvoiceLineId <= :invoice_lines
+    JOIN track_index AS position ON position.TrackId = l.TrackId
+    JOIN track_index AS other_position
+      ON other_position.pos = (position.pos + copies.k * 97) % :track_count
+    JOIN Track AS track ON track.TrackId = other_position.TrackId
+    ORDER BY copies.k, l.InvoiceLineId
+    """,
+    """
+    UPDATE Invoice
+    SET Total = (SELECT round(coalesce(sum(l.UnitPrice * l.Quantity), 0), 2)
+                 FROM InvoiceLine AS l WHERE l.InvoiceId = Invoice.InvoiceId)
+    WHERE InvoiceId > :invoices
+    """,
+    """
+    INSERT INTO Playlist
+    SELECT p.PlaylistId + copies.k * :playlists, p.Name || ' (' || (copies.k + 1) || ')'
+    FROM copies JOIN Playlist AS p ON p.PlaylistId <= :playlists
+    ORDER BY copies.k, p.PlaylistId
+    """,
+    """
+    INSERT INTO PlaylistTrack
+    SELECT pt.PlaylistId + copies.k * :playlists, other_position.TrackId
+    FROM copies
+    JOIN PlaylistTrack AS pt ON pt.PlaylistId <= :playlists
+    JOIN track_index AS position ON position.TrackId = pt.TrackId
+    JOIN track_index AS other_position
+      ON other_position.pos = (position.pos + copies.k * 131) % :track_count
+    ORDER BY copies.k, pt.PlaylistId, pt.TrackId
+    """,
+)
+
+
+def default_scaled_path(scale: int, database_path: str = DATABASE_PATH) -> str:
+    """The path a database at `scale` is written to by default, e.g. data/Chinook_x10.db."""
+    stem, extension = os.path.splitext(database_path)
+    return f"{stem}_x{scale}{extension}"
+
+
+def _original_keys(connection) -> dict:
+    (customers, customer_count), = connection.execute("SELECT max(CustomerId), count(*) FROM Customer")
+    (track_count,), = connection.execute("SELECT count(*) FROM Track")
+    return {
+        "customers": customers,
+        "customer_count": customer_count,
+        "invoices": connection.execute("SELECT max(InvoiceId) FROM Invoice").fetchone()[0],
+        "invoice_lines": connection.execute("SELECT max(InvoiceLineId) FROM InvoiceLine").fetchone()[0],
+        "playlists": connection.execute("SELECT max(PlaylistId) FROM Playlist").fetchone()[0],
+        "track_count": track_count,
+    }
+
+
+def generate(scale: int, output_path: str = None, database_path: str = DATABASE_PATH,
+             overwrite: bool = False) -> str:
+    """
+    Writes a copy of the Chinook database with its customer-facing tables scaled up `scale` times.
+
+    Args:
+    scale (int): Number of copies of the scaled tables, e.g. 10, 100 or 1000. 1 copies the database as is.
+    output_path (str): Where to write the database. Defaults to data/Chinook_x{scale}.db.
+    database_path (str): The original Chinook database.
+    overwrite (bool): Rebuild the database if it already exists.
+
+    Returns:
+    str: The path of the scaled database.
+    """
+    if scale < 1:
+        raise ValueError("scale must be >= 1.")
+    output_path = output_path or default_scaled_path(scale, database_path)
+    if os.path.exists(output_path) and not overwrite:
+        return output_path
+    partial_path = f"{output_path}.partial"
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+    source = sqlite3.connect(f"file:{database_path}?mode=ro", uri=True)
+    target = sqlite3.connect(partial_path, isolation_level=None)
+    try:
+        source.backup(target)
+        target.executescript("PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;")
+        keys = _original_keys(target)
+        target.execute("BEGIN")
+        target.execute("CREATE TEMP TABLE copies (k INTEGER PRIMARY KEY)")
+        target.executemany("INSERT INTO copies VALUES (?)", ((k,) for k in range(1, scale)))
+        # Zero-based positions, so that remapping works whatever the key values are
+        target.execute("CREATE TEMP TABLE customer_index (pos INTEGER PRIMARY KEY, CustomerId INTEGER UNIQUE)")
+        target.execute("INSERT INTO customer_index SELECT row_number() OVER (ORDER BY CustomerId) - 1, "
+                       "CustomerId FROM Customer")
+        target.execute("CREATE TEMP TABLE track_index (pos INTEGER PRIMARY KEY, TrackId INTEGER UNIQUE)")
+        target.execute("INSERT INTO track_index SELECT row_number() OVER (ORDER BY TrackId) - 1, TrackId FROM Track")
+        for statement in _COPY_STATEMENTS:
+            target.execute(statement, keys)
+        target.execute("COMMIT")
+        target.execute("VACUUM")
+    except BaseException:
+        target.close()
+        os.remove(partial_path)
+        raise
+    finally:
+        source.close()
+    target.close()
+    os.replace(partial_path, output_path)
+    return output_path
+
+
+def check_integrity(database_path: str) -> dict:
+    """
+    Checks that every foreign key of a (scaled) Chinook database resolves and that invoice
+    totals add up to their lines.
+
+    Args:
+    database_path (str): The database to check.
+
+    Returns:
+    dict: Row count per table.
+
+    Raises:
+    ValueError: If a foreign key is dangling or an invoice total is off.
+    """
+    connection = sqlite3.connect(f"file:{database_path}?mode=ro", uri=True)
+    try:
+        dangling = connection.execute("PRAGMA foreign_key_check").fetchmany(5)
+        if dangling:
+            raise ValueError(f"Dangling foreign keys in {database_path}: {dangling}")
+        (wrong_totals,), = connection.execute("""
+            SELECT count(*) FROM Invoice
+            WHERE abs(Total - (SELECT coalesce(sum(UnitPrice * Quantity), 0) FROM InvoiceLine
+                               WHERE InvoiceLine.InvoiceId = Invoice.InvoiceId)) > 0.005""")
+        if wrong_totals:
+            raise ValueError(f"{wrong_totals} invoice totals in {database_path} do not match their lines.")
+        tables = [name for name, in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")]
+        return {table: connection.execute(f'SELECT count(*) FROM "{table}"').fetchone()[0] for table in tables}
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, nargs="+", default=list(SCALES))
+    parser.add_argument("--database", default=DATABASE_PATH, help="The original Chinook database.")
+    parser.add_argument("--output", default=None, help="Output path. Only valid with a single scale.")
+    parser.add_argument("--overwrite", action="store_true", help="Rebuild databases that already exist.")
+    parser.add_argument("--no-check", action="store_true", help="Skip the foreign key and totals check.")
+    args = parser.parse_args()
+    if args.output and len(args.scale) > 1:
+        parser.error("--output can only be used with a single --scale.")
+
+    for scale in args.scale:
+        started = time.perf_counter()
+        path = generate(scale, args.output, args.database, overwrite=args.overwrite)
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(path) / 2 ** 20
+        print(f"x{scale}: {os.path.relpath(path, ROOT_DIR)} ({size:.1f} MB, {elapsed:.1f}s)")
+        if not args.no_check:
+            counts = check_integrity(path)
+            print("  " + ", ".join(f"{table}={counts[table]}" for table in SCALED_TABLES))
+
+
+if __name__ == "__main__":
+    main()
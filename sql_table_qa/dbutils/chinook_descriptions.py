@@ -0,0 +1,124 @@
+"""Hand-written descriptions of the Chinook tables and columns.
+They are merged into the introspected schema to give the LLM more context than the DDL alone."""
+
+CHINOOK_DESCRIPTIONS = {
+    "Album": {
+        "desc": "Stores album related data",
+        "columns": {
+            "AlbumId": {"dtype": "INTEGER", "desc": "Primary key of the album table."},
+            "Title": {"dtype": "NVARCHAR(160)", "desc": "Title of the album."},
+            "ArtistId": {"dtype": "INTEGER", "desc": "Foreign key that references the Artist table."}
+        }
+    },
+    "Artist": {
+        "desc": "Stores artist related data",
+        "columns": {
+            "ArtistId": {"dtype": "INTEGER", "desc": "Primary key of the artist table."},
+            "Name": {"dtype": "NVARCHAR(120)", "desc": "Name of the artist."}
+        }
+    },
+    "Customer": {
+        "desc": "Stores customer related data",
+        "columns": {
+            "CustomerId": {"dtype": "INTEGER", "desc": "Primary key of the customer table."},
+            "FirstName": {"dtype": "NVARCHAR(40)", "desc": "First name of the customer."},
+            "LastName": {"dtype": "NVARCHAR(20)", "desc": "Last name of the customer."},
+            "Company": {"dtype": "NVARCHAR(80)", "desc": "Customer's company, if any."},
+            "Address": {"dtype": "NVARCHAR(70)", "desc": "Customer's address."},
+            "City": {"dtype": "NVARCHAR(40)", "desc": "City of the customer."},
+            "State": {"dtype": "NVARCHAR(40)", "desc": "State of the customer."},
+            "Country": {"dtype": "NVARCHAR(40)", "desc": "Country of the customer."},
+            "PostalCode": {"dtype": "NVARCHAR(10)", "desc": "Postal code of the customer."},
+            "Phone": {"dtype": "NVARCHAR(24)", "desc": "Phone number of the customer."},
+            "Fax": {"dtype": "NVARCHAR(24)", "desc": "Fax number of the customer."},
+            "Email": {"dtype": "NVARCHAR(60)", "desc": "Email address of the customer."},
+            "SupportRepId": {"dtype": "INTEGER", "desc": "Foreign key that references the Support Employee."}
+        }
+    },
+    "Employee": {
+        "desc": "Stores employee related data",
+        "columns": {
+            "EmployeeId": {"dtype": "INTEGER", "desc": "Primary key of the employee table."},
+            "LastName": {"dtype": "NVARCHAR(20)", "desc": "Last name of the employee."},
+            "FirstName": {"dtype": "NVARCHAR(20)", "desc": "First name of the employee."},
+            "Title": {"dtype": "NVARCHAR(30)", "desc": "Title of the employee."},
+            "ReportsTo": {"dtype": "INTEGER", "desc": "Reports to which superior (EmployeeId)."},
+            "BirthDate": {"dtype": "DATETIME", "desc": "Birth date of the employee."},
+            "HireDate": {"dtype": "DATETIME", "desc": "Hire date of the employee."},
+            "Address": {"dtype": "NVARCHAR(70)", "desc": "Address of the employee."},
+            "City": {"dtype": "NVARCHAR(40)", "desc": "City of the employee."},
+            "State": {"dtype": "NVARCHAR(40)", "desc": "State of the employee."},
+            "Country": {"dtype": "NVARCHAR(40)", "desc": "Country of the employee."},
+            "PostalCode": {"dtype": "NVARCHAR(10)", "desc": "Postal code of the employee."},
+            "Phone": {"dtype": "NVARCHAR(24)", "desc": "Phone number of the employee."},
+            "Fax": {"dtype": "NVARCHAR(24)", "desc": "Fax number of the employee."},
+            "Email": {"dtype": "NVARCHAR(60)", "desc": "Email address of the employee."}
+        }
+    },
+    "Genre": {
+        "desc": "Stores different musical genre types",
+        "columns": {
+            "GenreId": {"dtype": "INTEGER", "desc": "Primary key of the genre table."},
+            "Name": {"dtype": "NVARCHAR(120)", "desc": "Name of the genre."}
+        }
+    },
+    "MediaType": {
+        "desc": "Stores types of media formats available",
+        "columns": {
+            "MediaTypeId": {"dtype": "INTEGER", "desc": "Primary key of the media type table."},
+            "Name": {"dtype": "NVARCHAR(120)", "desc": "Name of the media type."}
+        }
+    },
+    "Playlist": {
+        "desc": "Stores playlist data",
+        "columns": {
+            "PlaylistId": {"dtype": "INTEGER", "desc": "Primary key of the playlist table."},
+            "Name": {"dtype": "NVARCHAR(120)", "desc": "Name of the playlist."}
+        }
+    },
+    "PlaylistTrack": {
+        "desc": "Associative table linking playlists to tracks",
+        "columns": {
+            "PlaylistId": {"dtype": "INTEGER", "desc": "Foreign key referencing playlists."},
+            "TrackId": {"dtype": "INTEGER", "desc": "Foreign key referencing tracks."}
+        }
+    },
+    "Track": {
+        "desc": "Stores detailed information about each music track",
+        "columns": {
+            "TrackId": {"dtype": "INTEGER", "desc": "Primary key of the track table."},
+            "Name": {"dtype": "NVARCHAR(200)", "desc": "Name of the track."},
+            "AlbumId": {"dtype": "INTEGER", "desc": "Foreign key that references the Album table."},
+            "MediaTypeId": {"dtype": "INTEGER", "desc": "Foreign key that references the MediaType table."},
+            "GenreId": {"dtype": "INTEGER", "desc": "Foreign key that references the Genre table."},
+            "Composer": {"dtype": "NVARCHAR(220)", "desc": "Composer of the track."},
+            "Milliseconds": {"dtype": "INTEGER", "desc": "Length of the track in milliseconds."},
+            "Bytes": {"dtype": "INTEGER", "desc": "File size of the track in bytes."},
+            "UnitPrice": {"dtype": "NUMERIC(10,2)", "desc": "Price of the track."}
+        }
+    },
+    "Invoice": {
+        "desc": "Stores invoice data for customer purchases",
+        "columns": {
+            "InvoiceId": {"dtype": "INTEGER", "desc": "Primary key of the invoice table."},
+            "CustomerId": {"dtype": "INTEGER", "desc": "Foreign key that references the Customer table."},
+            "InvoiceDate": {"dtype": "DATETIME", "desc": "Date of the invoice."},
+            "BillingAddress": {"dtype": "NVARCHAR(70)", "desc": "Billing address."},
+            "BillingCity": {"dtype": "NVARCHAR(40)", "desc": "Billing city."},
+            "BillingState": {"dtype": "NVARCHAR(40)", "desc": "Billing state."},
+            "BillingCountry": {"dtype": "NVARCHAR(40)", "desc": "Billing country."},
+            "BillingPostalCode": {"dtype": "NVARCHAR(10)", "desc": "Billing postal code."},
+            "Total": {"dtype": "NUMERIC(10,2)", "desc": "Total amount of the invoice."}
+        }
+    },
+    "InvoiceLine": {
+        "desc": "Stores line items of an invoice",
+        "columns": {
+            "InvoiceLineId": {"dtype": "INTEGER", "desc": "Primary key of the invoice line table."},
+            "InvoiceId": {"dtype": "INTEGER", "desc": "Foreign key that references the Invoice table."},
+            "TrackId": {"dtype": "INTEGER", "desc": "Foreign key that references the Track table."},
+            "UnitPrice": {"dtype": "NUMERIC(10,2)", "desc": "Price per unit."},
+            "Quantity": {"dtype": "INTEGER", "desc": "Quantity of the item."}
+        }
+    }
+}
@@ -0,0 +1,100 @@
+"""Declarative definitions of the rollups materialized next to the Chinook database.
+
+Each rollup groups the rows of `source` by its `dimensions` and stores its `measures`.
+Measures must be SUM, COUNT, MIN or MAX so that they can be re-aggregated: a query
+is answered from a rollup when it joins the same tables the same way and only groups
+and filters on the rollup dimensions. The first table of `source` is the fact table;
+rows appended to it are folded into the rollup without rebuilding it."""
+
+_INVOICE_MEASURES = {
+    "total": "SUM(Invoice.Total)",
+    "total_count": "COUNT(Invoice.Total)",
+    "min_total": "MIN(Invoice.Total)",
+    "max_total": "MAX(Invoice.Total)",
+    "invoice_count": "COUNT(*)",
+}
+
+_INVOICE_LINE_MEASURES = {
+    "revenue": "SUM(InvoiceLine.UnitPrice * InvoiceLine.Quantity)",
+    "quantity": "SUM(InvoiceLine.Quantity)",
+    "quantity_count": "COUNT(InvoiceLine.Quantity)",
+    "unit_price": "SUM(InvoiceLine.UnitPrice)",
+    "unit_price_count": "COUNT(InvoiceLine.UnitPrice)",
+    "line_count": "COUNT(*)",
+}
+
+CHINOOK_ROLLUPS = {
+    "rollup_invoice_location_month": {
+        "desc": "Invoice totals by billing location and month.",
+        "source": "Invoice",
+        "dimensions": {
+            "billing_country": "Invoice.BillingCountry",
+            "billing_state": "Invoice.BillingState",
+            "billing_city": "Invoice.BillingCity",
+            "invoice_year": "strftime('%Y', Invoice.InvoiceDate)",
+            "invoice_month": "strftime('%Y-%m', Invoice.InvoiceDate)",
+        },
+        "measures": _INVOICE_MEASURES,
+    },
+    "rollup_invoice_customer": {
+        "desc": "Invoice totals by customer country, support rep and year.",
+        "source": "Invoice JOIN Customer ON Customer.CustomerId = Invoice.CustomerId",
+        "dimensions": {
+            "customer_id": "Customer.CustomerId",
+            "first_name": "Customer.FirstName",
+            "last_name": "Customer.LastName",
+            "country": "Customer.Country",
+            "support_rep_id": "Customer.SupportRepId",
+            "invoice_year": "strftime('%Y', Invoice.InvoiceDate)",
+        },
+        "measures": _INVOICE_MEASURES,
+    },
+    "rollup_invoice_support_rep": {
+        "desc": "Invoice totals by support rep and month.",
+        "source": "Invoice JOIN Customer ON Customer.CustomerId = Invoice.CustomerId "
+                  "JOIN Employee ON Employee.EmployeeId = Customer.SupportRepId",
+        "dimensions": {
+            "employee_id": "Employee.EmployeeId",
+            "first_name": "Employee.FirstName",
+            "last_name": "Employee.LastName",
+            "invoice_year": "strftime('%Y', Invoice.InvoiceDate)",
+            "invoice_month": "strftime('%Y-%m', Invoice.InvoiceDate)",
+        },
+        "measures": _INVOICE_MEASURES,
+    },
+    "rollup_sales_genre": {
+        "desc": "Track sales by genre.",
+        "source": "InvoiceLine JOIN Track ON Track.TrackId = InvoiceLine.TrackId "
+                  "JOIN Genre ON Genre.GenreId = Track.GenreId",
+        "dimensions": {
+            "genre_id": "Genre.GenreId",
+            "genre": "Genre.Name",
+        },
+        "measures": _INVOICE_LINE_MEASURES,
+    },
+    "rollup_sales_genre_country_month": {
+        "desc": "Track sales by genre, billing country and month.",
+        "source": "InvoiceLine JOIN Invoice ON Invoice.InvoiceId = InvoiceLine.InvoiceId "
+                  "JOIN Track ON Track.TrackId = InvoiceLine.TrackId "
+                  "JOIN Genre ON Genre.GenreId = Track.GenreId",
+        "dimensions": {
+            "genre_id": "Genre.GenreId",
+            "genre": "Genre.Name",
+            "billing_country": "Invoice.BillingCountry",
+            "invoice_year": "strftime('%Y', Invoice.InvoiceDate)",
+            "invoice_month": "strftime('%Y-%m', Invoice.InvoiceDate)",
+        },
+        "measures": _INVOICE_LINE_MEASURES,
+    },
+    "rollup_sales_artist": {
+        "desc": "Track sales by artist.",
+        "source": "InvoiceLine JOIN Track ON Track.TrackId = InvoiceLine.TrackId "
+                  "JOIN Album ON Album.AlbumId = Track.AlbumId "
+                  "JOIN Artist ON Artist.ArtistId = Album.ArtistId",
+        "dimensions": {
+            "artist_id": "Artist.ArtistId",
+            "artist": "Artist.Name",
+        },
+        "measures": _INVOICE_LINE_MEASURES,
+    },
+}
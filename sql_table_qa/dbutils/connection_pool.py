@@ -0,0 +1,215 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from queue import Empty, LifoQueue
+
+
+DEFAULT_PRAGMAS = {
+    # Memory-map up to 256MB of the database file so reads skip the page cache copy.
+    "mmap_size": 256 * 1024 * 1024,
+    # Negative values are KiB: 64MB page cache per connection.
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+class PoolTimeoutError(TimeoutError):
+    """Raised when no connection could be checked out of the pool in time."""
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of read-only SQLite connections.
+
+    Each connection is opened with a `mode=ro` URI and `PRAGMA query_only`,
+    so nothing borrowed from the pool can write to the database.
+    Connections are created lazily up to `size` and handed out LIFO so
+    that the warmest page caches get reused first.
+    """
+
+    def __init__(self, database_path: str, size: int = 4, timeout: float = 10.0,
+                 pragmas: dict = None, wal: bool = False):
+        """
+        Initializes a new pool. No connection is opened until the first checkout.
+
+        Args:
+        database_path (str): Path to the SQLite database file.
+        size (int): Maximum number of connections kept open at the same time.
+        timeout (float): Default number of seconds to wait for a free connection.
+        pragmas (dict): Per-connection pragmas, merged over DEFAULT_PRAGMAS.
+        wal (bool): Switch the database to WAL journaling so readers never block on writers.
+        """
+        if size < 1:
+            raise ValueError("Pool size must be at least 1.")
+        self.database_path = str(database_path)
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        self.wal = wal
+        self._idle = LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_time = 0.0
+        self._closed = False
+        if wal:
+            self._enable_wal()
+
+    def _enable_wal(self):
+        """WAL mode is persistent in the database file and needs a writable handle to set once."""
+        connection = sqlite3.connect(self.database_path)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+        finally:
+            connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        uri = f"{Path(self.database_path).resolve().as_uri()}?mode=ro"
+        # Connections migrate between threads through the pool, but only one thread uses each at a time.
+        connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        connection.execute("PRAGMA query_only = ON")
+        for pragma, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {pragma} = {value}")
+        return connection
+
+    def acquire(self, timeout: float = None) -> sqlite3.Connection:
+        """
+        Checks out a connection, opening a new one if the pool is not full yet.
+
+        Args:
+        timeout (float): Seconds to wait for a free connection. Defaults to the pool timeout.
+
+        Returns:
+        sqlite3.Connection: A read-only connection. Must be given back with `release`.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Connection pool is closed.")
+            self._checkouts += 1
+            try:
+                connection = self._idle.get_nowait()
+            except Empty:
+                connection = None
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+                    self._waits += 1
+            else:
+                create = False
+            if connection is not None:
+                self._in_use += 1
+                return connection
+
+        if create:
+            try:
+                connection = self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        else:
+            started = time.monotonic()
+            try:
+                connection = self._idle.get(timeout=timeout)
+            except Empty:
+                with self._lock:
+                    self._timeouts += 1
+                    self._wait_time += time.monotonic() - started
+                raise PoolTimeoutError(
+                    f"No database connection became available within {timeout} seconds.")
+            with self._lock:
+                self._wait_time += time.monotonic() - started
+        with self._lock:
+            self._in_use += 1
+        return connection
+
+    def release(self, connection: sqlite3.Connection):
+        """
+        Returns a connection to the pool.
+
+        Args:
+        connection (sqlite3.Connection): A connection previously obtained from `acquire`.
+        """
+        if connection.in_transaction:
+            connection.rollback()
+        # Checked and returned under one lock, so that `close` cannot drain the pool in between
+        with self._lock:
+            self._in_use -= 1
+            if not self._closed:
+                self._idle.put_nowait(connection)
+                return
+            self._created -= 1
+        connection.close()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """Context manager that checks out a connection and always gives it back."""
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def stats(self) -> dict:
+        """
+        Returns counters describing how the pool is being used.
+
+        Returns:
+        dict: size, open/idle/in-use connections, checkouts, waits, timeouts and total wait seconds.
+        """
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": self._created,
+                "idle": self._idle.qsize(),
+                "in_use": self._in_use,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "wait_seconds": self._wait_time,
+            }
+
+    def close(self):
+        """Closes all idle connections. Connections still checked out are closed on release."""
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    connection = self._idle.get_nowait()
+                except Empty:
+                    break
+                self._created -= 1
+                connection.close()
+
+
+_shared_pools = {}
+_shared_pools_lock = threading.Lock()
+
+
+def get_shared_pool(database_path: str, **pool_kwargs) -> ConnectionPool:
+    """
+    Returns the process-wide pool for a database file, creating it on first use.
+    Pool options only take effect for the call that creates the pool.
+
+    Args:
+    database_path (str): Path to the SQLite database file.
+    **pool_kwargs: Extra keyword arguments forwarded to ConnectionPool.
+
+    Returns:
+    ConnectionPool: The pool shared by every connector pointed at this file.
+    """
+    key = str(Path(database_path).resolve())
+    with _shared_pools_lock:
+        pool = _shared_pools.get(key)
+        if pool is None or pool._closed:
+            pool = ConnectionPool(key, **pool_kwargs)
+            _shared_pools[key] = pool
+        return pool
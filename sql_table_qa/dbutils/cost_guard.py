@@ -0,0 +1,360 @@
+"""Keeps runaway LLM-written queries from monopolising the database.
+
+Before a query runs, `CostGuard.check` reads its `EXPLAIN QUERY PLAN` and rejects plans
+that scan large tables without an index, join tables without a join predicate, or would
+visit more rows than allowed. Plain projections that only fail the scan check are rewritten
+with a LIMIT instead, since SQLite then stops scanning early. While a query runs, an
+`ExecutionBudget` interrupts it once it exceeds a wall-clock or VM-step budget.
+Both raise `QueryTooExpensiveError`, whose message is written to be fed back to the LLM.
+"""
+import heapq
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+from sqlglot import exp
+
+from sql_table_qa.dbutils.sql_analysis import SQLAnalysis
+
+
+_LOOP = re.compile(r"^(SCAN|SEARCH) (\S+)(?: AS \S+)?(.*)$")
+# Rows an index lookup is assumed to return when SQLite does not say it is unique
+_INDEX_FANOUT = 10
+
+
+class QueryTooExpensiveError(ValueError):
+    """
+    Raised when a query is rejected by the cost guard or interrupted by its execution budget.
+
+    `reason` is one of "full_scan", "missing_join_predicate", "estimated_rows",
+    "timeout" or "vm_steps". `str(error)` explains the problem and how to fix it.
+    """
+
+    def __init__(self, reason: str, message: str, hint: str, details: dict = None):
+        super().__init__(f"Query too expensive: {message} {hint}")
+        self.reason = reason
+        self.message = message
+        self.hint = hint
+        self.details = details or {}
+
+    def to_dict(self) -> dict:
+        return {"error": "query_too_expensive", "reason": self.reason, "message": self.message,
+                "hint": self.hint, "details": self.details}
+
+
+@dataclass
+class PlanStep:
+    """One line of `EXPLAIN QUERY PLAN` output."""
+    id: int
+    parent: int
+    detail: str
+
+
+class _Watchdog:
+    """A single daemon thread that calls `interrupt()` on connections past their deadline."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._deadlines = []
+        self._thread = None
+
+    def watch(self, deadline: float, budget: "ExecutionBudget"):
+        with self._condition:
+            heapq.heappush(self._deadlines, (deadline, id(budget), budget))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="sql-watchdog")
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._deadlines:
+                    self._condition.wait()
+                deadline, _, budget = self._deadlines[0]
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                heapq.heappop(self._deadlines)
+            budget._on_deadline()
+
+
+_watchdog = _Watchdog()
+
+
+class ExecutionBudget:
+    """
+    Interrupts the query running on a connection once it takes longer than `timeout`
+    seconds or more than `max_vm_steps` SQLite virtual machine steps.
+
+    The budget is checked from a progress handler every `interval` VM steps, with a
+    watchdog calling `connection.interrupt()` as a backstop for long single steps.
+    """
+
+    def __init__(self, timeout: float = None, max_vm_steps: int = None, interval: int = 1000):
+        self.timeout = timeout
+        self.max_vm_steps = max_vm_steps
+        self.interval = interval
+        self.exceeded = None
+        self.steps = 0
+        self._connection = None
+        self._started = None
+        self._lock = threading.Lock()
+
+    def start(self, connection: sqlite3.Connection):
+        """Starts counting time and steps for the queries run on `connection`."""
+        if self.timeout is None and self.max_vm_steps is None:
+            return
+        self._connection = connection
+        self._started = time.monotonic()
+        connection.set_progress_handler(self._progress, self.interval)
+        if self.timeout is not None:
+            # The progress handler normally fires first; the watchdog gives it some slack
+            _watchdog.watch(self._started + self.timeout * 1.5 + 0.1, self)
+
+    def stop(self):
+        """Removes the progress handler. Call it before the connection goes back to the pool."""
+        with self._lock:
+            connection, self._connection = self._connection, None
+        if connection is not None:
+            connection.set_progress_handler(None, 0)
+
+    def _progress(self) -> int:
+        self.steps += self.interval
+        if self.max_vm_steps is not None and self.steps > self.max_vm_steps:
+            self.exceeded = "vm_steps"
+            return 1
+        if self.timeout is not None and time.monotonic() - self._started > self.timeout:
+            self.exceeded = "timeout"
+            return 1
+        return 0
+
+    def _on_deadline(self):
+        with self._lock:
+            if self._connection is not None:
+                self.exceeded = self.exceeded or "timeout"
+                self._connection.interrupt()
+
+    def raise_if_exceeded(self, error: Exception):
+        """Turns the "interrupted" error of a query stopped by this budget into a QueryTooExpensiveError."""
+        if self.exceeded is None or not isinstance(error, sqlite3.OperationalError):
+            return
+        if self.exceeded == "vm_steps":
+            message = f"the query was stopped after {self.max_vm_steps:,} SQLite VM steps."
+        else:
+            message = f"the query was stopped after running for {self.timeout:g} seconds."
+        raise QueryTooExpensiveError(
+            self.exceeded, message,
+            "Filter on indexed columns, avoid joining large tables without a join condition, "
+            "or aggregate a smaller subset of the data.",
+            {"timeout": self.timeout, "max_vm_steps": self.max_vm_steps, "steps": self.steps}) from error
+
+
+class CostGuard:
+    """
+    Checks query plans against configurable limits and hands out execution budgets.
+    """
+
+    def __init__(self, max_scan_rows: int = 1_000_000, max_estimated_rows: int = 50_000_000,
+                 max_cartesian_rows: int = 100_000, timeout: float = 10.0, max_vm_steps: int = None,
+                 progress_interval: int = 1000, rewrite_unbounded: bool = True):
+        """
+        Initializes the guard. Any limit set to None is not enforced.
+
+        Args:
+        max_scan_rows (int): Largest table that may be scanned in full without an index.
+        max_estimated_rows (int): Largest number of rows the plan may visit, estimated
+            from table row counts and the nesting of its loops.
+        max_cartesian_rows (int): Largest cross product allowed between two joined tables
+            without a join predicate.
+        timeout (float): Wall-clock seconds a query may run.
+        max_vm_steps (int): SQLite virtual machine steps a query may take.
+        progress_interval (int): VM steps between two checks of the execution budget.
+        rewrite_unbounded (bool): Add a LIMIT to plain projections that fail the scan check
+            instead of rejecting them.
+        """
+        self.max_scan_rows = max_scan_rows
+        self.max_estimated_rows = max_estimated_rows
+        self.max_cartesian_rows = max_cartesian_rows
+        self.timeout = timeout
+        self.max_vm_steps = max_vm_steps
+        self.progress_interval = progress_interval
+        self.rewrite_unbounded = rewrite_unbounded
+
+    def budget(self) -> ExecutionBudget:
+        """Returns a fresh execution budget for one query."""
+        return ExecutionBudget(self.timeout, self.max_vm_steps, self.progress_interval)
+
+    @staticmethod
+    def explain(connection: sqlite3.Connection, sql: str) -> list:
+        """
+        Returns the query plan SQLite picked for a statement.
+
+        Returns:
+        list: PlanStep objects in the order SQLite reports them.
+        """
+        rows = connection.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+        return [PlanStep(row[0], row[1], row[3]) for row in rows]
+
+    def check(self, connection: sqlite3.Connection, sql: str, analysis: SQLAnalysis,
+              row_counts: dict, row_limit: int = None) -> str:
+        """
+        Checks the plan of a query against the limits.
+
+        Args:
+        connection (sqlite3.Connection): Connection to plan the query on.
+        sql (str): The query.
+        analysis (SQLAnalysis): The analysis of the query.
+        row_counts (dict): Number of rows of each table.
+        row_limit (int): LIMIT to add when an unbounded projection is rewritten.
+
+        Returns:
+        str: The SQL to run, which is `sql` unless it was rewritten.
+
+        Raises:
+        QueryTooExpensiveError: If the plan exceeds a limit.
+        """
+        statement = analysis.statement
+        if statement is None or not isinstance(statement, exp.Query):
+            return sql
+        plan = self.explain(connection, sql)
+        aliases = {table.alias_or_name: table.name for table in statement.find_all(exp.Table)}
+        # A plan that stops after LIMIT rows never visits most of what it could combine or scan
+        stops_early = self._stops_early(statement, plan)
+        if not stops_early:
+            self._check_join_predicates(statement, row_counts)
+
+        estimated = self._estimate_rows(plan, 0, aliases, row_counts)
+        if self.max_estimated_rows is not None and estimated > self.max_estimated_rows and not stops_early:
+            raise QueryTooExpensiveError(
+                "estimated_rows",
+                f"its plan would visit about {estimated:,} rows (limit {self.max_estimated_rows:,}).",
+                "Join on indexed key columns, filter earlier, or split the question into smaller queries.",
+                {"estimated_rows": estimated, "plan": [step.detail for step in plan]})
+
+        scans = self._large_scans(plan, aliases, row_counts)
+        if scans and not stops_early:
+            if self.rewrite_unbounded and row_limit is not None and self._is_plain_projection(statement):
+                return statement.copy().limit(row_limit).sql(dialect="sqlite")
+            table, rows = scans[0]
+            raise QueryTooExpensiveError(
+                "full_scan",
+                f"it reads all {rows:,} rows of {table} without using an index "
+                f"(limit {self.max_scan_rows:,}).",
+                "Add a selective WHERE condition on an indexed column or a LIMIT.",
+                {"table": table, "rows": rows, "plan": [step.detail for step in plan]})
+        return sql
+
+    def _check_join_predicates(self, statement: exp.Expression, row_counts: dict):
+        if self.max_cartesian_rows is None:
+            return
+        for select in statement.find_all(exp.Select):
+            source = select.args.get("from")
+            if source is None or not select.args.get("joins"):
+                continue
+            where = select.args.get("where")
+            joined = [source.this]
+            for join in select.args["joins"]:
+                table = join.this
+                if not (join.args.get("on") or join.args.get("using")) \
+                        and not self._has_equality(where, table.alias_or_name):
+                    size = self._size(table, row_counts) * max(self._size(t, row_counts) for t in joined)
+                    if size > self.max_cartesian_rows:
+                        raise QueryTooExpensiveError(
+                            "missing_join_predicate",
+                            f"{table.alias_or_name} is joined without a join condition, "
+                            f"producing up to {size:,} row combinations.",
+                            "Add an ON clause matching the foreign key, e.g. JOIN b ON b.a_id = a.id.",
+                            {"table": table.alias_or_name, "combinations": size})
+                joined.append(table)
+
+    @staticmethod
+    def _has_equality(where: exp.Expression, alias: str) -> bool:
+        if where is None:
+            return False
+        for eq in where.find_all(exp.EQ):
+            left, right = eq.this, eq.expression
+            if isinstance(left, exp.Column) and isinstance(right, exp.Column):
+                tables = {left.table, right.table}
+                # Unqualified columns may belong to the joined table, so give them the benefit of the doubt
+                if alias in tables or "" in tables:
+                    return True
+        return False
+
+    @staticmethod
+    def _size(source: exp.Expression, row_counts: dict) -> int:
+        return row_counts.get(source.name, 1) if isinstance(source, exp.Table) else 1
+
+    def _estimate_rows(self, plan: list, parent: int, aliases: dict, row_counts: dict) -> int:
+        """
+        Sums the rows visited by each loop of a plan. Sibling loops are nested, so each
+        multiplies the rows of the loops before it; correlated subqueries run once per outer row.
+        """
+        loops, total = 1, 0
+        for step in plan:
+            if step.parent != parent:
+                continue
+            match = _LOOP.match(step.detail)
+            if match:
+                loops *= self._loop_rows(match, aliases, row_counts)
+                total += loops
+            inner = self._estimate_rows(plan, step.id, aliases, row_counts)
+            total += inner * loops if step.detail.startswith("CORRELATED") else inner
+        return total
+
+    @staticmethod
+    def _loop_rows(match: re.Match, aliases: dict, row_counts: dict) -> int:
+        kind, name, rest = match.groups()
+        rows = row_counts.get(aliases.get(name, name))
+        if rows is None:
+            # A subquery or CTE; its own loops are counted separately
+            return 1
+        if kind == "SCAN":
+            return max(rows, 1)
+        if "PRIMARY KEY" in rest or "rowid=" in rest:
+            return 1
+        if "AUTOMATIC" in rest:
+            # SQLite builds a temporary index first, reading the whole table once
+            return _INDEX_FANOUT
+        return min(rows, _INDEX_FANOUT)
+
+    def _large_scans(self, plan: list, aliases: dict, row_counts: dict) -> list:
+        if self.max_scan_rows is None:
+            return []
+        scans = []
+        for step in plan:
+            match = _LOOP.match(step.detail)
+            if match and match.group(1) == "SCAN" and "INDEX" not in match.group(3):
+                table = aliases.get(match.group(2), match.group(2))
+                rows = row_counts.get(table, 0)
+                if rows > self.max_scan_rows:
+                    scans.append((table, rows))
+        return scans
+
+    @staticmethod
+    def _stops_early(statement: exp.Expression, plan: list) -> bool:
+        """
+        A LIMIT lets SQLite stop scanning, unless it has to sort, group, deduplicate or
+        aggregate first. An ORDER BY served by an index still stops early. With a WHERE or
+        HAVING filter, the LIMIT waits for rows that pass it, which may never come: only a
+        plan whose loops after the first are index lookups is then bounded.
+        """
+        if statement.args.get("limit") is None or statement.args.get("distinct"):
+            return False
+        if any("TEMP B-TREE" in step.detail for step in plan):
+            return False
+        if statement.find(exp.AggFunc) is not None:
+            return False
+        if statement.args.get("where") is None and statement.args.get("having") is None:
+            return True
+        loops = [match for match in map(_LOOP.match, (step.detail for step in plan)) if match]
+        return all(match.group(1) == "SEARCH" and "AUTOMATIC" not in match.group(3) for match in loops[1:])
+
+    @staticmethod
+    def _is_plain_projection(statement: exp.Expression) -> bool:
+        return (isinstance(statement, exp.Select)
+                and not any(statement.args.get(arg) for arg in ("limit", "group", "order", "distinct", "having"))
+                and statement.find(exp.AggFunc) is None)
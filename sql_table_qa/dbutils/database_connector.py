@@ -1,11 +1,30 @@
 import os
 import sqlite3
-import sqlparse
-import sqlglot
 import json
+import sqlglot
 import inspect
+import logging
+import time
+from functools import partial
+
+from CONSTANTS import (
+    ROOT_DIR, DATABASE_PATH, DB_POOL_SIZE, DB_POOL_TIMEOUT, MAX_RESULT_ROWS, MAX_RESULT_BYTES,
+    QUERY_TIMEOUT, QUERY_MAX_SCAN_ROWS, QUERY_ENGINE, DUCKDB_MIN_ROWS)
+from sql_table_qa.dbutils.chinook_descriptions import CHINOOK_DESCRIPTIONS
+from sql_table_qa.dbutils.connection_pool import ConnectionPool, get_shared_pool
+from sql_table_qa.dbutils.cost_guard import CostGuard
+from sql_table_qa.dbutils.engines import (
+    DuckDBEngine, EngineError, EngineRouter, SQLiteEngine, duckdb_available, get_shared_duckdb_engine)
+from sql_table_qa.dbutils.query_cache import (
+    QueryResultCache, estimate_rows_size, get_shared_cache)
+from sql_table_qa.dbutils.query_result import QueryResult
+from sql_table_qa.dbutils.result_stream import QueryPage, ResultStream
+from sql_table_qa.dbutils.rollups import RollupStore, default_rollup_path
+from sql_table_qa.dbutils.schema_introspector import SchemaIntrospector
+from sql_table_qa.dbutils.sql_analysis import SQLAnalysis, analyze_sql
+from sql_table_qa.tracing import span
 
-from CONSTANTS import ROOT_DIR, GLOBAL_CONNECTION
+logger = logging.getLogger(__name__)
 
 
 class DatabaseConnector:
@@ -17,136 +36,89 @@ class DatabaseConnector:
     that can connect to different data sources.
     """
 
-    def __init__(self):
+    def __init__(self, database_path: str = DATABASE_PATH, pool: ConnectionPool = None,
+                 pool_size: int = DB_POOL_SIZE, pool_timeout: float = DB_POOL_TIMEOUT,
+                 pragmas: dict = None, wal: bool = False, cache: QueryResultCache = None, use_cache: bool = True,
+                 max_rows: int = MAX_RESULT_ROWS, max_bytes: int = MAX_RESULT_BYTES,
+                 descriptions: dict = None, cost_guard: CostGuard = None, use_cost_guard: bool = True,
+                 rollups: RollupStore = None, use_rollups: bool = True, engine: str = QUERY_ENGINE,
+                 duckdb_engine: DuckDBEngine = None, router: EngineRouter = None):
         """
         Initializes a new instance of the DatabaseConnector class.
+
+        Args:
+        database_path (str): Path to the SQLite database file.
+        pool (ConnectionPool): A pool to borrow connections from.
+            Defaults to the process-wide read-only pool for `database_path`.
+        pool_size (int): Number of connections in the shared pool, if it has to be created.
+        pool_timeout (float): Seconds to wait for a free connection, if the pool has to be created.
+        pragmas (dict): Extra per-connection pragmas, if the pool has to be created.
+        wal (bool): Switch the database to WAL journaling, so that readers never wait for
+            writers, if the pool has to be created.
+        cache (QueryResultCache): A cache for query results.
+            Defaults to the process-wide cache for `database_path`.
+        use_cache (bool): Set to False to always hit the database.
+        max_rows (int): Hard cap on the rows `execute_sql` loads. Larger results are truncated.
+        max_bytes (int): Hard cap on the estimated bytes `execute_sql` loads.
+        descriptions (dict): Human descriptions of tables and columns merged into the
+            introspected schema. Defaults to the Chinook descriptions.
+        cost_guard (CostGuard): Checks query plans and interrupts long-running queries.
+            Defaults to a guard configured from QUERY_TIMEOUT and QUERY_MAX_SCAN_ROWS.
+        use_cost_guard (bool): Set to False to run queries without plan checks or time limits.
+        rollups (RollupStore): Precomputed aggregates that queries are routed to when they can answer them.
+            Defaults to the rollups next to `database_path`, if they have been built.
+        use_rollups (bool): Set to False to always query the base tables.
+        engine (str): "sqlite" runs every query on SQLite. "duckdb" runs every query that
+            translates on DuckDB. "auto" sends heavy aggregations to DuckDB when it is installed.
+        duckdb_engine (DuckDBEngine): The DuckDB engine to use.
+            Defaults to the process-wide engine for `database_path`, created on first use.
+        router (EngineRouter): Decides which queries go to DuckDB in "auto" mode.
         """
-        self.database_name = "Chinook"
+        if engine not in ("sqlite", "duckdb", "auto"):
+            raise ValueError(f"Unknown engine: {engine}")
+        self.database_name = os.path.splitext(os.path.basename(database_path))[0]
         self.sql_flavor = "sqlite"
-        self.connection = GLOBAL_CONNECTION
-        self.database_schema = {
-            "Album": {
-                "desc": "Stores album related data",
-                "columns": {
-                    "AlbumId": {"dtype": "INTEGER", "desc": "Primary key of the album table."},
-                    "Title": {"dtype": "NVARCHAR(160)", "desc": "Title of the album."},
-                    "ArtistId": {"dtype": "INTEGER", "desc": "Foreign key that references the Artist table."}
-                }
-            },
-            "Artist": {
-                "desc": "Stores artist related data",
-                "columns": {
-                    "ArtistId": {"dtype": "INTEGER", "desc": "Primary key of the artist table."},
-                    "Name": {"dtype": "NVARCHAR(120)", "desc": "Name of the artist."}
-                }
-            },
-            "Customer": {
-                "desc": "Stores customer related data",
-                "columns": {
-                    "CustomerId": {"dtype": "INTEGER", "desc": "Primary key of the customer table."},
-                    "FirstName": {"dtype": "NVARCHAR(40)", "desc": "First name of the customer."},
-                    "LastName": {"dtype": "NVARCHAR(20)", "desc": "Last name of the customer."},
-                    "Company": {"dtype": "NVARCHAR(80)", "desc": "Customer's company, if any."},
-                    "Address": {"dtype": "NVARCHAR(70)", "desc": "Customer's address."},
-                    "City": {"dtype": "NVARCHAR(40)", "desc": "City of the customer."},
-                    "State": {"dtype": "NVARCHAR(40)", "desc": "State of the customer."},
-                    "Country": {"dtype": "NVARCHAR(40)", "desc": "Country of the customer."},
-                    "PostalCode": {"dtype": "NVARCHAR(10)", "desc": "Postal code of the customer."},
-                    "Phone": {"dtype": "NVARCHAR(24)", "desc": "Phone number of the customer."},
-                    "Fax": {"dtype": "NVARCHAR(24)", "desc": "Fax number of the customer."},
-                    "Email": {"dtype": "NVARCHAR(60)", "desc": "Email address of the customer."},
-                    "SupportRepId": {"dtype": "INTEGER", "desc": "Foreign key that references the Support Employee."}
-                }
-            },
-            "Employee": {
-                "desc": "Stores employee related data",
-                "columns": {
-                    "EmployeeId": {"dtype": "INTEGER", "desc": "Primary key of the employee table."},
-                    "LastName": {"dtype": "NVARCHAR(20)", "desc": "Last name of the employee."},
-                    "FirstName": {"dtype": "NVARCHAR(20)", "desc": "First name of the employee."},
-                    "Title": {"dtype": "NVARCHAR(30)", "desc": "Title of the employee."},
-                    "ReportsTo": {"dtype": "INTEGER", "desc": "Reports to which superior (EmployeeId)."},
-                    "BirthDate": {"dtype": "DATETIME", "desc": "Birth date of the employee."},
-                    "HireDate": {"dtype": "DATETIME", "desc": "Hire date of the employee."},
-                    "Address": {"dtype": "NVARCHAR(70)", "desc": "Address of the employee."},
-                    "City": {"dtype": "NVARCHAR(40)", "desc": "City of the employee."},
-                    "State": {"dtype": "NVARCHAR(40)", "desc": "State of the employee."},
-                    "Country": {"dtype": "NVARCHAR(40)", "desc": "Country of the employee."},
-                    "PostalCode": {"dtype": "NVARCHAR(10)", "desc": "Postal code of the employee."},
-                    "Phone": {"dtype": "NVARCHAR(24)", "desc": "Phone number of the employee."},
-                    "Fax": {"dtype": "NVARCHAR(24)", "desc": "Fax number of the employee."},
-                    "Email": {"dtype": "NVARCHAR(60)", "desc": "Email address of the employee."}
-                }
-            },
-            "Genre": {
-                "desc": "Stores different musical genre types",
-                "columns": {
-                    "GenreId": {"dtype": "INTEGER", "desc": "Primary key of the genre table."},
-                    "Name": {"dtype": "NVARCHAR(120)", "desc": "Name of the genre."}
-                }
-            },
-            "MediaType": {
-                "desc": "Stores types of media formats available",
-                "columns": {
-                    "MediaTypeId": {"dtype": "INTEGER", "desc": "Primary key of the media type table."},
-                    "Name": {"dtype": "NVARCHAR(120)", "desc": "Name of the media type."}
-                }
-            },
-            "Playlist": {
-                "desc": "Stores playlist data",
-                "columns": {
-                    "PlaylistId": {"dtype": "INTEGER", "desc": "Primary key of the playlist table."},
-                    "Name": {"dtype": "NVARCHAR(120)", "desc": "Name of the playlist."}
-                }
-            },
-            "PlaylistTrack": {
-                "desc": "Associative table linking playlists to tracks",
-                "columns": {
-                    "PlaylistId": {"dtype": "INTEGER", "desc": "Foreign key referencing playlists."},
-                    "TrackId": {"dtype": "INTEGER", "desc": "Foreign key referencing tracks."}
-                }
-            },
-            "Track": {
-                "desc": "Stores detailed information about each music track",
-                "columns": {
-                    "TrackId": {"dtype": "INTEGER", "desc": "Primary key of the track table."},
-                    "Name": {"dtype": "NVARCHAR(200)", "desc": "Name of the track."},
-                    "AlbumId": {"dtype": "INTEGER", "desc": "Foreign key that references the Album table."},
-                    "MediaTypeId": {"dtype": "INTEGER", "desc": "Foreign key that references the MediaType table."},
-                    "GenreId": {"dtype": "INTEGER", "desc": "Foreign key that references the Genre table."},
-                    "Composer": {"dtype": "NVARCHAR(220)", "desc": "Composer of the track."},
-                    "Milliseconds": {"dtype": "INTEGER", "desc": "Length of the track in milliseconds."},
-                    "Bytes": {"dtype": "INTEGER", "desc": "File size of the track in bytes."},
-                    "UnitPrice": {"dtype": "NUMERIC(10,2)", "desc": "Price of the track."}
-                }
-            },
-            "Invoice": {
-                "desc": "Stores invoice data for customer purchases",
-                "columns": {
-                    "InvoiceId": {"dtype": "INTEGER", "desc": "Primary key of the invoice table."},
-                    "CustomerId": {"dtype": "INTEGER", "desc": "Foreign key that references the Customer table."},
-                    "InvoiceDate": {"dtype": "DATETIME", "desc": "Date of the invoice."},
-                    "BillingAddress": {"dtype": "NVARCHAR(70)", "desc": "Billing address."},
-                    "BillingCity": {"dtype": "NVARCHAR(40)", "desc": "Billing city."},
-                    "BillingState": {"dtype": "NVARCHAR(40)", "desc": "Billing state."},
-                    "BillingCountry": {"dtype": "NVARCHAR(40)", "desc": "Billing country."},
-                    "BillingPostalCode": {"dtype": "NVARCHAR(10)", "desc": "Billing postal code."},
-                    "Total": {"dtype": "NUMERIC(10,2)", "desc": "Total amount of the invoice."}
-                }
-            },
-            "InvoiceLine": {
-                "desc": "Stores line items of an invoice",
-                "columns": {
-                    "InvoiceLineId": {"dtype": "INTEGER", "desc": "Primary key of the invoice line table."},
-                    "InvoiceId": {"dtype": "INTEGER", "desc": "Foreign key that references the Invoice table."},
-                    "TrackId": {"dtype": "INTEGER", "desc": "Foreign key that references the Track table."},
-                    "UnitPrice": {"dtype": "NUMERIC(10,2)", "desc": "Price per unit."},
-                    "Quantity": {"dtype": "INTEGER", "desc": "Quantity of the item."}
-                }
-            }
-        }
+        self.database_path = database_path
+        self.pool = pool or get_shared_pool(
+            database_path, size=pool_size, timeout=pool_timeout, pragmas=pragmas, wal=wal)
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.cache = (cache or get_shared_cache(database_path)) if use_cache else None
+        self.cost_guard = (cost_guard or CostGuard(max_scan_rows=QUERY_MAX_SCAN_ROWS, timeout=QUERY_TIMEOUT)
+                           ) if use_cost_guard else None
+        budget = self.cost_guard.budget if self.cost_guard is not None else None
+        self.engine = SQLiteEngine(self.pool, budget=budget)
+        self.engine_mode = engine if engine == "sqlite" or duckdb_engine or duckdb_available() else "sqlite"
+        self.router = router or EngineRouter(min_rows=0 if engine == "duckdb" else DUCKDB_MIN_ROWS)
+        self._duckdb_engine = duckdb_engine
+        # Last `PRAGMA data_version` seen on each pooled connection, to notice commits
+        # made by other processes within the file mtime resolution.
+        self._data_versions = {}
+        self.schema = SchemaIntrospector(
+            self.pool, CHINOOK_DESCRIPTIONS if descriptions is None else descriptions)
+        if rollups is None and use_rollups and os.path.exists(default_rollup_path(database_path)):
+            rollups = RollupStore(database_path, schema=self.schema)
+        self.rollups = rollups if use_rollups else None
+        self.rollup_engine = SQLiteEngine(self.rollups.pool, budget=budget) if self.rollups is not None else None
+
+    @property
+    def duckdb_engine(self) -> DuckDBEngine:
+        """The DuckDB engine, created on first use. None if DuckDB is not used."""
+        if self._duckdb_engine is None and self.engine_mode != "sqlite":
+            self._duckdb_engine = get_shared_duckdb_engine(self.database_path, timeout=QUERY_TIMEOUT)
+        return self._duckdb_engine
+
+    @property
+    def database_schema(self) -> dict:
+        """The introspected schema merged with the human descriptions, cached per schema_version."""
+        return self.schema.get_schema()
 
-    def execute_sql(self, sql: str) -> list:
+    @property
+    def schema_version(self) -> int:
+        """The SQLite `PRAGMA schema_version` the cached schema corresponds to."""
+        return self.schema.schema_version
+
+    def execute_sql(self, sql: str) -> QueryResult:
         """
         Executes an SQL statement on the Chinook database and get back the results.
 
@@ -154,16 +126,269 @@ class DatabaseConnector:
         sql (str): The SQL statement to execute.
 
         Returns:
-        list: A list of tuples representing the result of the SQL query.
-        """
-        if self._is_modifying_sql(sql):
-            raise ValueError("Modifying SQL statements are not allowed.")
-        cursor = self.connection.cursor()
-        cursor.execute(sql)
-        result = cursor.fetchall()
-        cursor.close()
+        QueryResult: The column names, column types and column-oriented values of the result.
+        Iterating over it yields row tuples.
+
+        Raises:
+        QueryTooExpensiveError: If the query plan exceeds the cost guard limits or the
+            query runs out of time. The message explains how to make the query cheaper.
+        """
+        with span("sql.execute") as execute_span:
+            with span("sql.analyze"):
+                analysis = self.analyze_sql(sql)
+                analysis.check_allowed()
+            key = analysis.normalized_sql
+            if self.cache is None or not analysis.is_cacheable:
+                result = self._fetch_routed(sql, analysis)
+                execute_span.set(cache_hit=False, rows=result.row_count)
+                return result
+            version = self._database_version()
+            cached = self.cache.get(key, version)
+            if cached is not None:
+                source_sql, shared = cached
+                execute_span.set(cache_hit=True, rows=shared.row_count)
+                return shared.copy(None if source_sql == sql else self._column_names(sql, shared))
+            started = time.perf_counter()
+            result = self._fetch_routed(sql, analysis)
+            # Callers get their own copy: the cached one is read-only and shared
+            shared = result.frozen()
+            self.cache.put(key, (sql, shared), result.estimate_size(), version,
+                           cost=time.perf_counter() - started)
+            execute_span.set(cache_hit=False, rows=result.row_count)
+            return shared.copy()
+
+    def _column_names(self, sql: str, cached: QueryResult) -> list:
+        """
+        The column names SQLite gives `sql`. Texts that normalize to the same query can still
+        label their columns differently, e.g. "COUNT(*)" and "count(*)".
+        """
+        try:
+            names = self.engine.column_names(sql)
+        except sqlite3.Error:
+            return None
+        return names if len(names) == len(cached.columns) else None
+
+    def _fetch_routed(self, sql: str, analysis: SQLAnalysis) -> QueryResult:
+        """Answers the query from a rollup when one can, else from the base tables on the best engine."""
+        rewrite = self.rollups.rewrite(analysis) if self.rollups is not None else None
+        if rewrite is None or not self.rollups.ensure_fresh():
+            return self._fetch_base(sql, analysis)
+        with span("sql.rollup", rollup=rewrite.rollup) as rollup_span:
+            result = self._fetch_all(rewrite.rewritten_sql, engine=self.rollup_engine)
+            columns = self.rollups.verified_columns(rewrite)
+            if columns is None:
+                # First use of this rewrite: check it against the base tables
+                base = self._fetch_base(sql, analysis)
+                rollup_span.set(verified=True)
+                if not self.rollups.confirm(rewrite, base, result):
+                    return base
+                columns = base.columns
+        return QueryResult(columns, result.data, result.types, result.truncated)
+
+    def _fetch_base(self, sql: str, analysis: SQLAnalysis) -> QueryResult:
+        if self.engine_mode != "sqlite":
+            row_counts = self._row_counts()
+            # The cost guard plans on SQLite, so it is asked before DuckDB runs anything.
+            # A query it bounds with a LIMIT runs on SQLite, which applies the rewrite.
+            if self.router.prefers_duckdb(analysis, row_counts) and self._check_cost(sql, row_counts) == sql:
+                result = self._fetch_duckdb(sql, analysis)
+                if result is not None:
+                    return result
+        return self._fetch_all(sql)
+
+    def _check_cost(self, sql: str, row_counts: dict) -> str:
+        """Runs the cost guard on a pooled connection. Returns the SQL to run, see CostGuard.check."""
+        with self.pool.connection() as connection:
+            return self._prepare(connection, sql, row_counts)
+
+    def _fetch_duckdb(self, sql: str, analysis: SQLAnalysis) -> QueryResult:
+        """Runs the query on DuckDB, with the column names SQLite would give. None if DuckDB cannot run it."""
+        with span("sql.fetch.duckdb") as fetch_span:
+            try:
+                result = self.duckdb_engine.execute(sql, max_rows=self.max_rows, max_bytes=self.max_bytes,
+                                                    analysis=analysis, columns=self.engine.column_names(sql))
+            except EngineError as e:
+                logger.info("Running on SQLite instead of DuckDB (%s): %s", e, sql)
+                fetch_span.set(fallback=1)
+                return None
+            fetch_span.set(rows=result.row_count, bytes=result.estimate_size())
+        if result.truncated:
+            logger.warning("Result truncated to %d rows: %s", result.row_count, sql)
         return result
 
+    def _fetch_all(self, sql: str, engine: SQLiteEngine = None) -> QueryResult:
+        with span("sql.fetch") as fetch_span:
+            with self._stream(sql, max_rows=self.max_rows, max_bytes=self.max_bytes, engine=engine) as stream:
+                rows = stream.fetch_all()
+            fetch_span.set(rows=stream.row_count, bytes=stream.byte_count or estimate_rows_size(rows))
+        if stream.truncated:
+            logger.warning("Result truncated to %d rows (%d bytes): %s",
+                           stream.row_count, stream.byte_count, sql)
+        return QueryResult.from_rows(stream.columns, rows, truncated=stream.truncated)
+
+    def _stream(self, sql: str, batch_size: int = 500, max_rows: int = None,
+                max_bytes: int = None, engine: SQLiteEngine = None) -> ResultStream:
+        if engine is not None and engine is not self.engine:
+            # Rollup tables are small and not described by the schema, so only the time budget applies
+            return engine.stream(sql, batch_size=batch_size, max_rows=max_rows, max_bytes=max_bytes)
+        if self.cost_guard is None:
+            return self.engine.stream(sql, batch_size=batch_size, max_rows=max_rows,
+                                      max_bytes=max_bytes, prepare=self._prepare)
+        # Row counts come from the schema, which may need a pooled connection of its own,
+        # so they are read before the stream borrows one.
+        return self.engine.stream(sql, batch_size=batch_size, max_rows=max_rows, max_bytes=max_bytes,
+                                  prepare=partial(self._prepare, row_counts=self._row_counts()))
+
+    def _row_counts(self) -> dict:
+        return {name: table["row_count"] for name, table in self.database_schema.items()}
+
+    def _prepare(self, connection, sql: str, row_counts: dict = None) -> str:
+        self._check_data_version(connection)
+        if self.cost_guard is None or row_counts is None:
+            return sql
+        with span("sql.cost_check") as check_span:
+            checked = self.cost_guard.check(connection, sql, self.analyze_sql(sql), row_counts,
+                                            row_limit=self.max_rows + 1 if self.max_rows else None)
+            check_span.set(rewritten=checked != sql)
+        return checked
+
+    def execute_sql_stream(self, sql: str, batch_size: int = 500, max_rows: int = None,
+                           max_bytes: int = None) -> ResultStream:
+        """
+        Executes an SQL statement and streams the result in batches instead of loading it at once.
+
+        Args:
+        sql (str): The SQL statement to execute.
+        batch_size (int): Number of rows per batch.
+        max_rows (int): Stop after this many rows. Defaults to the connector row cap.
+        max_bytes (int): Stop after roughly this many bytes. Defaults to the connector byte cap.
+
+        Returns:
+        ResultStream: An iterator of row batches. Its `truncated` flag is set if a cap was hit.
+        """
+        self.analyze_sql(sql).check_allowed()
+        return self._stream(sql, batch_size=batch_size,
+                            max_rows=self.max_rows if max_rows is None else max_rows,
+                            max_bytes=self.max_bytes if max_bytes is None else max_bytes)
+
+    def execute_sql_page(self, sql: str, page: int = 0, page_size: int = 50) -> QueryPage:
+        """
+        Executes an SQL statement and returns one page of the result.
+        Use this to look at large results a few rows at a time.
+
+        Args:
+        sql (str): The SQL statement to execute.
+        page (int): Zero-based page number.
+        page_size (int): Number of rows per page.
+
+        Returns:
+        QueryPage: The rows of the page, the column names, and whether more rows follow.
+        """
+        self.analyze_sql(sql).check_allowed()
+        if page < 0 or page_size < 1:
+            raise ValueError("page must be >= 0 and page_size must be >= 1.")
+        offset = page * page_size
+        paged_sql = self._paginate(sql, page_size + 1, offset)
+        with self._stream(paged_sql or sql, batch_size=page_size + 1,
+                          max_bytes=self.max_bytes) as stream:
+            if paged_sql is None:
+                self._skip_rows(stream, offset)
+                stream.max_rows = page_size + 1
+            rows = stream.fetch_all()
+            columns = stream.columns
+        return QueryPage(rows=rows[:page_size], columns=columns, page=page, page_size=page_size,
+                         has_more=len(rows) > page_size or stream.truncated,
+                         truncated=stream.truncated and len(rows) <= page_size)
+
+    def _paginate(self, sql: str, limit: int, offset: int):
+        """Pushes LIMIT/OFFSET into a single SELECT so SQLite stops early. None if not possible."""
+        statement = self.analyze_sql(sql).statement
+        if not isinstance(statement, sqlglot.exp.Query):
+            return None
+        inner = statement.sql(dialect=self.sql_flavor)
+        return f"SELECT * FROM ({inner}) LIMIT {limit} OFFSET {offset}"
+
+    @staticmethod
+    def _skip_rows(stream: ResultStream, count: int):
+        while count > 0 and stream._cursor is not None:
+            skipped = stream._cursor.fetchmany(min(count, stream.batch_size))
+            if not skipped:
+                break
+            count -= len(skipped)
+
+    def _database_version(self) -> tuple:
+        """Cheap fingerprint of the database files that changes whenever a write lands."""
+        version = []
+        for path in (self.database_path, f"{self.database_path}-wal"):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            version.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(version)
+
+    def _check_data_version(self, connection):
+        if self.cache is None:
+            return
+        data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+        previous = self._data_versions.get(id(connection))
+        self._data_versions[id(connection)] = data_version
+        if previous is not None and previous != data_version:
+            self.cache.invalidate()
+
+    def get_cache_stats(self) -> dict:
+        """
+        Returns hit/miss/eviction counters of the query result cache.
+
+        Returns:
+        dict: Cache counters, or an empty dict if caching is disabled.
+        """
+        return self.cache.stats() if self.cache is not None else {}
+
+    def get_rollup_stats(self) -> dict:
+        """
+        Returns how many queries were answered from rollups and how often the rollups were refreshed.
+
+        Returns:
+        dict: Rollup counters, or an empty dict if no rollups are used.
+        """
+        return self.rollups.stats() if self.rollups is not None else {}
+
+    def get_engine_stats(self) -> dict:
+        """
+        Returns usage counters of the query engines.
+
+        Returns:
+        dict: {"mode": engine mode, "duckdb": DuckDB counters if it was used}.
+        """
+        stats = {"mode": self.engine_mode}
+        if self._duckdb_engine is not None:
+            stats["duckdb"] = self._duckdb_engine.stats()
+        return stats
+
+    def get_pool_stats(self) -> dict:
+        """
+        Returns usage counters of the connection pool behind this connector.
+
+        Returns:
+        dict: size, open/idle/in-use connections, checkouts, waits, timeouts and total wait seconds.
+        """
+        return self.pool.stats()
+
+    def analyze_sql(self, sql: str) -> SQLAnalysis:
+        """
+        Parses an SQL statement once and reports its validity, statement type,
+        normalized form and referenced tables and columns. Results are memoized,
+        so validating and then executing the same SQL only parses it once.
+
+        Args:
+        sql (str): The SQL statement to analyze.
+
+        Returns:
+        SQLAnalysis: The analysis of the statement.
+        """
+        return analyze_sql(sql, self.sql_flavor)
+
     def _is_modifying_sql(self, sql: str) -> bool:
         """
         Checks if an SQL statement is a modifying statement.
@@ -174,11 +399,7 @@ class DatabaseConnector:
         Returns:
         bool: True if the SQL statement is a modifying statement, False otherwise.
         """
-        parsed = sqlparse.parse(sql)
-        for statement in parsed:
-            if statement.get_type() in ('INSERT', 'UPDATE', 'DELETE', 'DROP', 'ALTER', 'CREATE'):
-                return True
-        return False
+        return self.analyze_sql(sql).is_modifying
 
     def validate_sql(self, sql: str) -> bool:
         """
@@ -190,14 +411,8 @@ class DatabaseConnector:
         Returns:
         bool: True if the SQL statement is valid, False otherwise.
         """
-        try:
-            parsed = sqlglot.transpile(sql)
-            if parsed:  # If the SQL statement is parsed successfully, it's valid
-                return True
-            else:
-                return False
-        except sqlglot.errors.ParseError as e:  # If parsing fails, the SQL is invalid
-            return False
+        with span("sql.validate"):
+            return self.analyze_sql(sql).is_valid
 
     def get_table_schema(self, table_name: str) -> dict:
         """
@@ -207,10 +422,26 @@ class DatabaseConnector:
         table_name (str): The name of the table whose schema is to be returned.
 
         Returns:
-        dict: A dictionary containing column names and data types of the table.
+        dict: A dictionary containing the description, columns with data types and descriptions,
+        primary key, foreign keys, indexes and row count of the table.
         """
         return self.database_schema.get(table_name, f"No schema found for table: {table_name}")
 
+    def get_table_prompts(self, table_names: list = None) -> dict:
+        """
+        Returns prompt-ready CREATE TABLE statements annotated with descriptions.
+
+        Args:
+        table_names (list): Only return these tables. Defaults to all tables.
+
+        Returns:
+        dict: A dictionary mapping table names to their annotated DDL.
+        """
+        prompts = self.schema.get_table_prompts()
+        if table_names is None:
+            return prompts
+        return {name: prompts[name] for name in table_names if name in prompts}
+
     def get_table_names_and_description(self) -> list:
         """
         Returns the name and description of all tables in the Chinook dataset.
@@ -0,0 +1,520 @@
+"""Execution engines behind the DatabaseConnector.
+
+Queries are written in the SQLite dialect. `SQLiteEngine` runs them as they are on the
+pooled read-only connections. `DuckDBEngine` transpiles them with sqlglot and runs them on
+DuckDB's vectorized, multi-threaded executor, over a copy of the SQLite tables that is
+attached, ingested into DuckDB or exported to Parquet. `EngineRouter` decides per query:
+aggregations and scans over large tables go to DuckDB, everything else stays on SQLite.
+Both engines return the same QueryResult shape.
+"""
+import importlib.util
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.optimizer.annotate_types import annotate_types
+from sqlglot.optimizer.qualify import qualify
+
+from sql_table_qa.dbutils.connection_pool import ConnectionPool
+from sql_table_qa.dbutils.cost_guard import QueryTooExpensiveError
+from sql_table_qa.dbutils.query_cache import estimate_rows_size
+from sql_table_qa.dbutils.query_result import QueryResult
+from sql_table_qa.dbutils.result_stream import ResultStream
+from sql_table_qa.dbutils.schema_introspector import _quote
+from sql_table_qa.dbutils.sql_analysis import SQLAnalysis
+
+logger = logging.getLogger(__name__)
+
+# SQLite functions whose modifiers or semantics sqlglot does not carry over to DuckDB
+_SQLITE_ONLY_FUNCTIONS = {"DATE", "DATETIME", "TIME", "JULIANDAY", "UNIXEPOCH", "PRINTF", "FORMAT",
+                          "TYPEOF", "GLOB", "CHAR", "INSTR", "ZEROBLOB", "RANDOMBLOB", "LIKELIHOOD"}
+# Prefix of the tables a load fills before they replace the tables queries read
+_STAGING_PREFIX = "_load_"
+
+
+class EngineError(RuntimeError):
+    """Raised when an engine cannot run a query that SQLite could still run."""
+
+
+def duckdb_available() -> bool:
+    return importlib.util.find_spec("duckdb") is not None
+
+
+class QueryEngine(ABC):
+    """Runs SQLite-dialect SQL and returns a QueryResult."""
+
+    name = ""
+    dialect = ""
+
+    @abstractmethod
+    def execute(self, sql: str, max_rows: int = None, max_bytes: int = None) -> QueryResult:
+        """
+        Runs a query.
+
+        Args:
+        sql (str): The query, in the SQLite dialect.
+        max_rows (int): Keep at most this many rows. The result is marked truncated if more exist.
+        max_bytes (int): Keep at most roughly this many bytes.
+
+        Returns:
+        QueryResult: The result.
+        """
+
+    def stats(self) -> dict:
+        return {}
+
+    def close(self):
+        pass
+
+
+class SQLiteEngine(QueryEngine):
+    """Runs queries on a pool of read-only SQLite connections, streaming rows in batches."""
+
+    name = "sqlite"
+    dialect = "sqlite"
+
+    def __init__(self, pool: ConnectionPool, budget=None):
+        """
+        Args:
+        pool (ConnectionPool): The pool to borrow connections from.
+        budget (callable): Returns a fresh ExecutionBudget per query, or None.
+        """
+        self.pool = pool
+        self.budget = budget
+
+    def stream(self, sql: str, batch_size: int = 500, max_rows: int = None, max_bytes: int = None,
+               prepare=None) -> ResultStream:
+        """Runs a query and streams its rows. See ResultStream for `prepare`."""
+        return ResultStream(self.pool, sql, batch_size=batch_size, max_rows=max_rows, max_bytes=max_bytes,
+                            prepare=prepare, budget=self.budget() if self.budget is not None else None)
+
+    def execute(self, sql: str, max_rows: int = None, max_bytes: int = None, prepare=None) -> QueryResult:
+        with self.stream(sql, max_rows=max_rows, max_bytes=max_bytes, prepare=prepare) as stream:
+            rows = stream.fetch_all()
+        return QueryResult.from_rows(stream.columns, rows, truncated=stream.truncated)
+
+    def column_names(self, sql: str) -> list:
+        """Returns the names SQLite gives the result columns of a query, without running it."""
+        with self.pool.connection() as connection:
+            # SQLite stops before reading anything under LIMIT 0
+            cursor = connection.execute(f"SELECT * FROM ({sql.strip().rstrip(';')}\n) LIMIT 0")
+            names = [column[0] for column in cursor.description]
+        # The subquery renames repeated names to "name:1", "name:2"...
+        seen = set()
+        for index, name in enumerate(names):
+            base, _, suffix = name.rpartition(":")
+            if base in seen and suffix.isdigit():
+                names[index] = base
+            seen.add(names[index])
+        return names
+
+    def stats(self) -> dict:
+        return self.pool.stats()
+
+
+def _duckdb_type(declared: str) -> str:
+    """Maps a declared SQLite column type to a DuckDB type, following SQLite's affinity rules."""
+    declared = (declared or "").upper()
+    if "INT" in declared:
+        return "BIGINT"
+    if any(marker in declared for marker in ("CHAR", "CLOB", "TEXT", "DATE", "TIME")):
+        # Dates stay text, as SQLite stores them, so results compare equal
+        return "VARCHAR"
+    if "BLOB" in declared or not declared:
+        return "BLOB"
+    return "DOUBLE"
+
+
+class DuckDBEngine(QueryEngine):
+    """
+    Runs SQLite-dialect queries on DuckDB.
+
+    The SQLite tables are made available to DuckDB in one of three ways:
+    "attach" reads the SQLite file in place through DuckDB's sqlite extension,
+    "ingest" copies the tables into an in-memory DuckDB database, and
+    "parquet" also exports the copy to Parquet files that later processes load instead
+    of re-reading SQLite. "auto" attaches if the extension is available and ingests otherwise.
+    Copies are reloaded in the background whenever the SQLite file changes, into staging
+    tables that replace the previous copy in one transaction. Until then, `execute` raises
+    EngineError so that queries run on SQLite.
+    """
+
+    name = "duckdb"
+    dialect = "duckdb"
+
+    def __init__(self, database_path: str, mode: str = "auto", parquet_dir: str = None,
+                 threads: int = None, timeout: float = None, memory_limit: str = None):
+        """
+        Opens DuckDB. Tables are loaded in the background on first use.
+
+        Args:
+        database_path (str): Path to the SQLite database.
+        mode (str): "auto", "attach", "ingest" or "parquet".
+        parquet_dir (str): Where "parquet" mode writes its files. Defaults to <database>.parquet/.
+        threads (int): DuckDB worker threads. Defaults to DuckDB's choice (all cores).
+        timeout (float): Seconds after which a query is interrupted.
+        memory_limit (str): DuckDB memory limit, e.g. "2GB".
+        """
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("DuckDBEngine needs the duckdb package: pip install duckdb") from e
+        if mode not in ("auto", "attach", "ingest", "parquet"):
+            raise ValueError(f"Unknown DuckDB mode: {mode}")
+        self._duckdb = duckdb
+        self.database_path = str(database_path)
+        self.mode = mode
+        self.parquet_dir = parquet_dir or f"{os.path.splitext(self.database_path)[0]}.parquet"
+        self.timeout = timeout
+        self._connection = duckdb.connect(":memory:")
+        if threads:
+            self._connection.execute(f"SET threads = {int(threads)}")
+        if memory_limit:
+            self._connection.execute(f"SET memory_limit = '{memory_limit}'")
+        # Held while loading; the loader lock guards starting the background load
+        self._lock = threading.Lock()
+        self._loader_lock = threading.Lock()
+        self._loader = None
+        self._loaded_version = None
+        self._failed_version = None
+        self._loaded_mode = None
+        # Declared SQLite column types, used to keep SQLite's integer division when transpiling
+        self._schema = {}
+        self._queries = 0
+        self._failures = 0
+        self._loads = 0
+        self._load_seconds = 0.0
+
+    def _source_version(self) -> tuple:
+        version = []
+        for path in (self.database_path, f"{self.database_path}-wal"):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            version.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(version)
+
+    def ensure_loaded(self, wait: bool = False) -> bool:
+        """
+        Brings DuckDB's copy of the tables up to date with the SQLite file.
+
+        A stale copy no longer matches SQLite, so it must not be queried. It is reloaded in a
+        background thread, and queries run on SQLite until the new copy is swapped in.
+
+        Args:
+        wait (bool): Load in the calling thread and return once the copy is current.
+
+        Returns:
+        bool: True if the copy is current.
+        """
+        version = self._source_version()
+        if version == self._loaded_version:
+            return True
+        if wait:
+            self._load_version(version, retry=True)
+            return version == self._loaded_version
+        with self._loader_lock:
+            if version != self._failed_version and (self._loader is None or not self._loader.is_alive()):
+                self._loader = threading.Thread(target=self._load_version, args=(version,),
+                                                name="duckdb-load", daemon=True)
+                self._loader.start()
+        return False
+
+    def _load_version(self, version: tuple, retry: bool = False):
+        with self._lock:
+            if version == self._loaded_version or (version == self._failed_version and not retry):
+                return
+            started = time.perf_counter()
+            cursor = self._connection.cursor()
+            source = sqlite3.connect(f"file:{os.path.abspath(self.database_path)}?mode=ro", uri=True)
+            try:
+                tables = [row[0] for row in source.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+                schema = {table: {row[1]: row[2] or "" for row in source.execute(
+                    f"PRAGMA table_info({_quote(table)})")} for table in tables}
+                mode = self._load(cursor, source, schema, version)
+            except (sqlite3.Error, self._duckdb.Error, EngineError, OSError):
+                # Queries keep running on SQLite, and the next change of the file is tried again
+                logger.exception("Loading the tables into DuckDB failed")
+                self._failed_version = version
+                return
+            finally:
+                source.close()
+                cursor.close()
+            self._schema = schema
+            self._loaded_mode = mode
+            self._loaded_version = version
+            self._loads += 1
+            self._load_seconds += time.perf_counter() - started
+            logger.info("Loaded %d tables into DuckDB (%s) in %.2fs", len(tables), mode,
+                        time.perf_counter() - started)
+
+    def _load(self, cursor, source: sqlite3.Connection, schema: dict, version: tuple) -> str:
+        """Makes a new copy of the tables available to DuckDB and swaps it in. Returns the mode used."""
+        if self.mode in ("auto", "attach") and self._attach(cursor):
+            self._swap(cursor, [f"CREATE VIEW {_quote(table)} AS SELECT * FROM chinook.{_quote(table)}"
+                                for table in schema])
+            return "attach"
+        if self.mode == "attach":
+            raise EngineError("The DuckDB sqlite extension is not available.")
+        if self.mode == "parquet" and self._parquet_is_current(version):
+            self._swap(cursor, [f"CREATE VIEW {_quote(table)} AS SELECT * FROM "
+                                f"read_parquet('{self._parquet_path(table)}')" for table in schema])
+            return "parquet"
+        for table, columns in schema.items():
+            self._ingest(cursor, source, table, columns)
+        self._swap(cursor, [f"ALTER TABLE {_quote(_STAGING_PREFIX + table)} RENAME TO {_quote(table)}"
+                            for table in schema])
+        if self.mode == "parquet":
+            self._export_parquet(cursor, list(schema), version)
+            return "parquet"
+        return "ingest"
+
+    def _swap(self, cursor, statements: list):
+        """
+        Replaces the tables and views queries read with those `statements` create, in one
+        transaction, so that a query sees either the previous copy or the new one.
+        """
+        existing = cursor.execute(
+            "SELECT table_name, table_type FROM information_schema.tables "
+            "WHERE table_catalog = current_database() AND table_schema = 'main'").fetchall()
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            for name, kind in existing:
+                if not name.startswith(_STAGING_PREFIX):
+                    cursor.execute(f"DROP {'VIEW' if kind == 'VIEW' else 'TABLE'} {_quote(name)}")
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute("COMMIT")
+        except self._duckdb.Error:
+            cursor.execute("ROLLBACK")
+            raise
+
+    def _attach(self, cursor) -> bool:
+        try:
+            cursor.execute("LOAD sqlite")
+        except self._duckdb.Error:
+            try:
+                cursor.execute("INSTALL sqlite")
+                cursor.execute("LOAD sqlite")
+            except self._duckdb.Error:
+                logger.info("DuckDB sqlite extension unavailable, ingesting tables instead")
+                return False
+        # The attached file is read in place, so later loads only recreate the views over it
+        cursor.execute(f"ATTACH IF NOT EXISTS '{self.database_path}' AS chinook (TYPE sqlite, READ_ONLY)")
+        return True
+
+    def _ingest(self, cursor, source: sqlite3.Connection, table: str, columns: dict, batch_size: int = 100_000):
+        """Copies a table into the staging table `_STAGING_PREFIX + table`."""
+        import pandas as pd
+
+        staging = _quote(_STAGING_PREFIX + table)
+        definition = ", ".join(f"{_quote(column)} {_duckdb_type(declared)}" for column, declared in columns.items())
+        cursor.execute(f"CREATE OR REPLACE TABLE {staging} ({definition})")
+        for chunk in pd.read_sql_query(f"SELECT * FROM {_quote(table)}", source, chunksize=batch_size):
+            cursor.register("_ingest_chunk", chunk)
+            try:
+                cursor.execute(f"INSERT INTO {staging} SELECT * FROM _ingest_chunk")
+            finally:
+                cursor.unregister("_ingest_chunk")
+
+    def _parquet_path(self, table: str) -> str:
+        return os.path.join(self.parquet_dir, f"{table}.parquet")
+
+    def _parquet_is_current(self, version: tuple) -> bool:
+        try:
+            with open(os.path.join(self.parquet_dir, "_source_version.json")) as f:
+                return tuple(map(tuple, json.load(f))) == version
+        except (FileNotFoundError, ValueError):
+            return False
+
+    def _export_parquet(self, cursor, tables: list, version: tuple):
+        Path(self.parquet_dir).mkdir(parents=True, exist_ok=True)
+        for table in tables:
+            cursor.execute(f"COPY {_quote(table)} TO '{self._parquet_path(table)}' (FORMAT PARQUET)")
+        with open(os.path.join(self.parquet_dir, "_source_version.json"), "w") as f:
+            json.dump(version, f)
+
+    def transpile(self, analysis: SQLAnalysis) -> str:
+        """
+        Translates a SQLite query to DuckDB SQL.
+
+        Raises:
+        EngineError: If the query uses SQLite behaviour that does not translate reliably.
+        """
+        statement = analysis.statement
+        if statement is None or not isinstance(statement, exp.Query):
+            raise EngineError("Only single queries run on DuckDB.")
+        for function in statement.find_all(exp.Func):
+            name = function.name.upper() if isinstance(function, exp.Anonymous) else function.sql_name()
+            if isinstance(function, exp.Anonymous) or name in _SQLITE_ONLY_FUNCTIONS:
+                raise EngineError(f"{name} has no reliable DuckDB translation.")
+        schema = {table: {column: declared or "TEXT" for column, declared in columns.items()}
+                  for table, columns in self._schema.items()}
+        try:
+            statement = qualify(statement.copy(), schema=schema, dialect="sqlite")
+            statement = annotate_types(statement, schema=schema)
+        except sqlglot.errors.SqlglotError as e:
+            raise EngineError(str(e)) from e
+        if statement.find(exp.Glob) is not None:
+            raise EngineError("GLOB has no reliable DuckDB translation.")
+        # SQLite's LIKE ignores the case of ASCII letters, DuckDB's does not
+        for like in list(statement.find_all(exp.Like)):
+            pattern = like.expression
+            if not pattern.is_string or not pattern.name.isascii():
+                raise EngineError("LIKE only translates to DuckDB with an ASCII literal pattern.")
+            like.replace(exp.ILike(this=like.this.copy(), expression=pattern.copy()))
+        for select in list(statement.find_all(exp.Select)):
+            self._wrap_bare_columns(select)
+        # SQLite divides integers as integers, DuckDB's / always returns a double
+        for division in list(statement.find_all(exp.Div)):
+            if division.left.is_type(*exp.DataType.INTEGER_TYPES) and division.right.is_type(*exp.DataType.INTEGER_TYPES):
+                division.replace(exp.IntDiv(this=division.left.copy(), expression=division.right.copy()))
+        return statement.sql(dialect="duckdb")
+
+    @staticmethod
+    def _wrap_bare_columns(select: exp.Select):
+        """
+        SQLite lets aggregate queries select columns that are neither grouped nor aggregated,
+        taking them from the row of the single MIN/MAX if there is one, else from any row.
+        DuckDB needs those spelled out as ARG_MIN/ARG_MAX or ANY_VALUE.
+        """
+        group = select.args.get("group")
+        aggregates = [node for projection in select.expressions for node in projection.find_all(exp.AggFunc)]
+        if group is None and not aggregates:
+            return
+        grouped = {expression.sql() for expression in group.expressions} if group else set()
+        extreme = aggregates[0] if len(aggregates) == 1 and isinstance(aggregates[0], (exp.Min, exp.Max)) else None
+        parts = list(select.expressions) + (list(select.args["order"].expressions) if select.args.get("order") else [])
+        for part in parts:
+            for column in list(part.find_all(exp.Column)):
+                if not column.table:
+                    continue
+                node, bare = column, True
+                while node is not part.parent and node is not None:
+                    if isinstance(node, exp.AggFunc) or node.sql() in grouped:
+                        bare = False
+                        break
+                    node = node.parent
+                if not bare:
+                    continue
+                if extreme is not None:
+                    picker = exp.ArgMax if isinstance(extreme, exp.Max) else exp.ArgMin
+                    column.replace(picker(this=column.copy(), expression=extreme.this.copy()))
+                else:
+                    column.replace(exp.AnyValue(this=column.copy()))
+
+    def execute(self, sql: str, max_rows: int = None, max_bytes: int = None, analysis: SQLAnalysis = None,
+                columns: list = None) -> QueryResult:
+        """
+        Transpiles and runs a SQLite query on DuckDB. See QueryEngine.execute.
+
+        Args:
+        analysis (SQLAnalysis): The analysis of `sql`, if already available.
+        columns (list): Column names to report, e.g. the names SQLite gives the result columns.
+
+        Raises:
+        EngineError: If the tables are still loading, the query could not be translated or DuckDB rejected it.
+        QueryTooExpensiveError: If the query ran out of time.
+        """
+        from sql_table_qa.dbutils.sql_analysis import analyze_sql
+
+        if not self.ensure_loaded():
+            raise EngineError("DuckDB is still loading the tables.")
+        duckdb_sql = self.transpile(analysis or analyze_sql(sql))
+        if max_rows is not None:
+            duckdb_sql = f"SELECT * FROM ({duckdb_sql}) LIMIT {int(max_rows) + 1}"
+        cursor = self._connection.cursor()
+        timer = None
+        if self.timeout is not None:
+            timer = threading.Timer(self.timeout, cursor.interrupt)
+            timer.daemon = True
+            timer.start()
+        try:
+            cursor.execute(duckdb_sql)
+            names = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        except self._duckdb.InterruptException as e:
+            raise QueryTooExpensiveError(
+                "timeout", f"the query was stopped after running for {self.timeout:g} seconds.",
+                "Filter on fewer rows or aggregate a smaller subset of the data.",
+                {"timeout": self.timeout, "engine": self.name}) from e
+        except self._duckdb.Error as e:
+            self._failures += 1
+            raise EngineError(str(e).splitlines()[0]) from e
+        finally:
+            if timer is not None:
+                timer.cancel()
+            cursor.close()
+        self._queries += 1
+        truncated = max_rows is not None and len(rows) > max_rows
+        rows = rows[:max_rows] if truncated else rows
+        if max_bytes is not None and estimate_rows_size(rows) > max_bytes:
+            kept, size = [], 0
+            for row in rows:
+                size += estimate_rows_size([row])
+                if size > max_bytes:
+                    break
+                kept.append(row)
+            rows, truncated = kept, True
+        if columns is not None and len(columns) == len(names):
+            names = columns
+        return QueryResult.from_rows(names, rows, truncated=truncated)
+
+    def stats(self) -> dict:
+        return {"mode": self._loaded_mode, "queries": self._queries, "failures": self._failures,
+                "loads": self._loads, "load_seconds": self._load_seconds,
+                "loading": self._loader is not None and self._loader.is_alive()}
+
+    def close(self):
+        loader = self._loader
+        if loader is not None:
+            loader.join()
+        self._connection.close()
+
+
+class EngineRouter:
+    """
+    Picks the engine for a query: aggregations, DISTINCT, window functions and sorts
+    over at least `min_rows` source rows go to DuckDB, point lookups and small queries stay on SQLite.
+    """
+
+    def __init__(self, min_rows: int = 100_000):
+        self.min_rows = min_rows
+
+    def prefers_duckdb(self, analysis: SQLAnalysis, row_counts: dict) -> bool:
+        statement = analysis.statement
+        if statement is None or not isinstance(statement, exp.Query):
+            return False
+        analytical = (statement.find(exp.AggFunc, exp.Group, exp.Window, exp.Distinct) is not None
+                      or (statement.args.get("order") is not None and statement.args.get("limit") is None))
+        if not analytical:
+            return False
+        row_counts = {table.lower(): rows for table, rows in row_counts.items()}
+        return sum(row_counts.get(table.lower(), 0) for table in analysis.tables) >= self.min_rows
+
+
+_shared_duckdb_engines = {}
+_shared_duckdb_engines_lock = threading.Lock()
+
+
+def get_shared_duckdb_engine(database_path: str, **engine_kwargs) -> DuckDBEngine:
+    """
+    Returns the process-wide DuckDB engine for a database file, creating it on first use.
+    Engine options only take effect for the call that creates it.
+    """
+    key = str(Path(database_path).resolve())
+    with _shared_duckdb_engines_lock:
+        engine = _shared_duckdb_engines.get(key)
+        if engine is None:
+            engine = DuckDBEngine(key, **engine_kwargs)
+            _shared_duckdb_engines[key] = engine
+        return engine
@@ -0,0 +1,194 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from sql_table_qa.dbutils.sql_analysis import analyze_sql
+
+
+def normalize_sql(sql: str, dialect: str = "sqlite") -> str:
+    """
+    Canonicalizes an SQL statement so that formatting differences map to the same cache key.
+    See sql_analysis._canonical_statement for what is normalized away.
+
+    Args:
+    sql (str): The SQL statement to normalize.
+    dialect (str): The sqlglot dialect to parse with.
+
+    Returns:
+    str: The canonical SQL, or the stripped input if it cannot be parsed.
+    """
+    return analyze_sql(sql, dialect).normalized_sql
+
+
+def estimate_rows_size(rows: list) -> int:
+    """Approximates the memory held by a list of result tuples, in bytes."""
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for value in row:
+            size += sys.getsizeof(value)
+    return size
+
+
+class _CacheEntry:
+    __slots__ = ("value", "version", "size", "created", "cost")
+
+    def __init__(self, value, version, size: int, cost: float):
+        self.value = value
+        self.version = version
+        self.size = size
+        self.created = time.monotonic()
+        self.cost = cost
+
+
+class QueryResultCache:
+    """
+    A thread-safe LRU cache of query results with TTL expiry and a memory cap.
+
+    Every entry is stamped with the database version it was computed against,
+    and lookups with a different version invalidate the whole cache.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 600.0,
+                 max_bytes: int = 64 * 1024 * 1024):
+        """
+        Initializes an empty cache.
+
+        Args:
+        max_entries (int): Maximum number of cached results.
+        ttl_seconds (float): Seconds after which an entry expires. None disables expiry.
+        max_bytes (int): Maximum estimated size of all cached results, in bytes.
+            Results larger than this are never cached.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+        self._saved_seconds = 0.0
+
+    def get(self, key: str, version=None):
+        """
+        Looks up a cached result.
+
+        Args:
+        key (str): The normalized SQL.
+        version: The current database version. A change clears the cache.
+
+        Returns:
+        The cached result, or None on a miss.
+        """
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            if self.ttl_seconds is not None and time.monotonic() - entry.created > self.ttl_seconds:
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            self._saved_seconds += entry.cost
+            return entry.value
+
+    def put(self, key: str, value, size: int, version=None, cost: float = 0.0):
+        """
+        Stores a result, evicting least recently used entries to stay within the limits.
+
+        Args:
+        key (str): The normalized SQL.
+        value: The result to cache.
+        size (int): Estimated size of the result in bytes.
+        version: The database version the result was computed against.
+        cost (float): Seconds it took to compute the result, credited on every hit.
+        """
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_version(version)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _CacheEntry(value, version, size, cost)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+
+    def invalidate(self):
+        """Drops every cached result."""
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> dict:
+        """
+        Returns counters describing cache effectiveness.
+
+        Returns:
+        dict: entries, bytes, hits, misses, evictions, expirations, invalidations
+            and the SQLite seconds saved by hits.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+                "saved_seconds": self._saved_seconds,
+            }
+
+    def _check_version(self, version):
+        if version is not None and version != self._version:
+            if self._version is not None:
+                self._clear()
+            self._version = version
+
+    def _clear(self):
+        if self._entries:
+            self._invalidations += 1
+        self._entries.clear()
+        self._bytes = 0
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+def get_shared_cache(database_path: str, **cache_kwargs) -> QueryResultCache:
+    """
+    Returns the process-wide result cache for a database file, creating it on first use.
+    Cache options only take effect for the call that creates the cache.
+
+    Args:
+    database_path (str): Path to the SQLite database file.
+    **cache_kwargs: Extra keyword arguments forwarded to QueryResultCache.
+
+    Returns:
+    QueryResultCache: The cache shared by every connector pointed at this file.
+    """
+    key = os.path.realpath(database_path)
+    with _shared_caches_lock:
+        cache = _shared_caches.get(key)
+        if cache is None:
+            cache = QueryResultCache(**cache_kwargs)
+            _shared_caches[key] = cache
+        return cache
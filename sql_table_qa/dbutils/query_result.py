@@ -0,0 +1,178 @@
+import sys
+
+
+# Rough characters-per-token ratio of English/CSV text for OpenAI tokenizers.
+CHARS_PER_TOKEN = 4
+
+_TYPE_NAMES = {
+    int: "INTEGER",
+    float: "REAL",
+    str: "TEXT",
+    bytes: "BLOB",
+    bool: "INTEGER",
+}
+
+
+class QueryResult:
+    """
+    A query result stored column by column.
+
+    Carries the column names from `cursor.description`, the SQLite storage
+    class of each column (inferred from the values, since SQLite does not
+    report result types) and one list of values per column. Row access is
+    still supported so that code treating results as a list of tuples keeps working.
+    """
+
+    __slots__ = ("columns", "types", "data", "truncated", "_rows")
+
+    def __init__(self, columns: list, data: list, types: list = None, truncated: bool = False):
+        """
+        Initializes a result from column-oriented data.
+
+        Args:
+        columns (list): Column names, in select order. Names may repeat.
+        data (list): One list of values per column.
+        types (list): SQLite storage class per column. Inferred if not given.
+        truncated (bool): Whether the result was cut short by a row or byte cap.
+        """
+        self.columns = list(columns)
+        self.data = data
+        self.types = types if types is not None else [self._infer_type(values) for values in data]
+        self.truncated = truncated
+        self._rows = None
+
+    @classmethod
+    def from_rows(cls, columns: list, rows: list, truncated: bool = False) -> "QueryResult":
+        """
+        Builds a result from the list of tuples returned by a cursor.
+
+        Args:
+        columns (list): Column names.
+        rows (list): Result rows as tuples.
+        truncated (bool): Whether the result was cut short.
+
+        Returns:
+        QueryResult: The column-oriented result.
+        """
+        if rows:
+            data = [list(values) for values in zip(*rows)]
+        else:
+            data = [[] for _ in columns]
+        result = cls(columns, data, truncated=truncated)
+        result._rows = rows
+        return result
+
+    @staticmethod
+    def _infer_type(values: list) -> str:
+        for value in values:
+            if value is not None:
+                return _TYPE_NAMES.get(type(value), type(value).__name__.upper())
+        return "NULL"
+
+    @property
+    def row_count(self) -> int:
+        return len(self.data[0]) if self.data else 0
+
+    @property
+    def rows(self) -> list:
+        """The result as a list of row tuples, built on first access."""
+        if self._rows is None:
+            self._rows = list(zip(*self.data)) if self.data else []
+        return self._rows
+
+    def frozen(self) -> "QueryResult":
+        """
+        Returns a copy whose values are held in tuples, so that it can be shared between callers.
+
+        Returns:
+        QueryResult: The read-only copy.
+        """
+        return QueryResult(self.columns, tuple(tuple(values) for values in self.data), tuple(self.types),
+                           self.truncated)
+
+    def copy(self, columns: list = None) -> "QueryResult":
+        """
+        Returns a new result over the same values, with its own column names.
+
+        Args:
+        columns (list): Column names of the copy. Defaults to the names of this result.
+
+        Returns:
+        QueryResult: The copy.
+        """
+        return QueryResult(self.columns if columns is None else columns, self.data, self.types, self.truncated)
+
+    def column(self, name: str) -> list:
+        """Returns the values of the first column with the given name."""
+        return self.data[self.columns.index(name)]
+
+    def to_dataframe(self):
+        """
+        Converts the result to a pandas DataFrame without going through rows.
+
+        Returns:
+        pd.DataFrame: One DataFrame column per result column.
+        """
+        import pandas as pd
+        frame = pd.DataFrame(dict(enumerate(self.data)), columns=range(len(self.columns)))
+        frame.columns = self.columns
+        return frame
+
+    def to_text(self, max_tokens: int = 1000) -> str:
+        """
+        Renders the result as a compact pipe-separated table for an LLM prompt.
+        Rows are added until the token budget is used up, and a note says how many were left out.
+
+        Args:
+        max_tokens (int): Approximate token budget of the rendering.
+
+        Returns:
+        str: A header line followed by one line per row.
+        """
+        if not self.columns:
+            return "(no result)"
+        budget = max_tokens * CHARS_PER_TOKEN
+        lines = [" | ".join(self.columns)]
+        used = len(lines[0])
+        shown = 0
+        for row in self.rows:
+            line = " | ".join("NULL" if value is None else str(value) for value in row)
+            if used + len(line) + 1 > budget and shown:
+                break
+            lines.append(line)
+            used += len(line) + 1
+            shown += 1
+        if shown < self.row_count:
+            lines.append(f"... ({self.row_count - shown} more rows not shown)")
+        if self.truncated:
+            lines.append(f"(result truncated at {self.row_count} rows)")
+        return "\n".join(lines)
+
+    def estimate_size(self) -> int:
+        """Approximates the memory held by the result values, in bytes."""
+        size = sys.getsizeof(self.data)
+        for values in self.data:
+            size += sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values)
+        return size
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __getitem__(self, index):
+        return self.rows[index]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, QueryResult):
+            return self.columns == other.columns and [list(v) for v in self.data] == [list(v) for v in other.data]
+        if isinstance(other, (list, tuple)):
+            return self.rows == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"QueryResult(columns={self.columns}, rows={self.row_count}, truncated={self.truncated})"
+
+    def __str__(self) -> str:
+        return self.to_text()
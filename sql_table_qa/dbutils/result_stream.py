@@ -0,0 +1,151 @@
+from dataclasses import dataclass
+
+from sql_table_qa.dbutils.connection_pool import ConnectionPool
+from sql_table_qa.dbutils.cost_guard import ExecutionBudget
+from sql_table_qa.dbutils.query_cache import estimate_rows_size
+from sql_table_qa.dbutils.query_result import QueryResult
+
+
+@dataclass
+class QueryPage:
+    """One page of a query result."""
+    rows: list
+    columns: list
+    page: int
+    page_size: int
+    has_more: bool
+    truncated: bool = False
+
+    @property
+    def offset(self) -> int:
+        return self.page * self.page_size
+
+    def to_result(self) -> QueryResult:
+        """Returns the rows of this page as a column-oriented QueryResult."""
+        return QueryResult.from_rows(self.columns, self.rows, truncated=self.truncated)
+
+
+class ResultStream:
+    """
+    Iterates over a query result in `fetchmany` batches.
+
+    A pooled connection is held until the stream is exhausted or closed,
+    so use it as a context manager or iterate it to the end.
+    Iteration stops early, with `truncated` set, once `max_rows` rows
+    or roughly `max_bytes` bytes have been produced.
+    """
+
+    def __init__(self, pool: ConnectionPool, sql: str, batch_size: int = 500,
+                 max_rows: int = None, max_bytes: int = None, prepare=None,
+                 budget: ExecutionBudget = None):
+        """
+        Executes the query and prepares to stream its rows.
+
+        Args:
+        pool (ConnectionPool): The pool to borrow a connection from.
+        sql (str): The SQL statement to execute.
+        batch_size (int): Number of rows fetched from SQLite per batch.
+        max_rows (int): Stop after this many rows. None means no limit.
+        max_bytes (int): Stop once the estimated size of the rows exceeds this. None means no limit.
+        prepare (callable): Called with the borrowed connection and the SQL before the query runs.
+            Returns the SQL to run, which lets it check or rewrite the query.
+        budget (ExecutionBudget): Interrupts the query if it runs for too long. It is started
+            before the query runs and stopped when the stream is closed.
+        """
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.row_count = 0
+        self.byte_count = 0
+        self.truncated = False
+        self._pool = pool
+        self._cursor = None
+        self._connection = None
+        self._budget = budget
+        self._connection = pool.acquire()
+        try:
+            if prepare is not None:
+                sql = prepare(self._connection, sql)
+            if budget is not None:
+                budget.start(self._connection)
+            self._cursor = self._connection.cursor()
+            self._cursor.execute(sql)
+        except Exception as e:
+            self._fail(e)
+        description = self._cursor.description or ()
+        self.columns = [column[0] for column in description]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> list:
+        if self._cursor is None:
+            raise StopIteration
+        size = self.batch_size
+        if self.max_rows is not None:
+            size = min(size, self.max_rows - self.row_count)
+            if size <= 0:
+                self._stop_if_more_rows()
+                raise StopIteration
+        try:
+            batch = self._cursor.fetchmany(size)
+        except Exception as e:
+            self._fail(e)
+        if not batch:
+            self.close()
+            raise StopIteration
+        if self.max_bytes is not None:
+            batch = self._take_within_byte_budget(batch)
+        self.row_count += len(batch)
+        return batch
+
+    def _take_within_byte_budget(self, batch: list) -> list:
+        for index, row in enumerate(batch):
+            row_size = estimate_rows_size([row])
+            if self.byte_count + row_size > self.max_bytes:
+                self.truncated = True
+                self.close()
+                return batch[:index]
+            self.byte_count += row_size
+        return batch
+
+    def _stop_if_more_rows(self):
+        try:
+            more = self._cursor.fetchone() is not None
+        except Exception as e:
+            self._fail(e)
+        self.truncated = more
+        self.close()
+
+    def _fail(self, error: Exception):
+        self.close()
+        if self._budget is not None:
+            self._budget.raise_if_exceeded(error)
+        raise error
+
+    def fetch_all(self) -> list:
+        """Collects every remaining row, honouring the row and byte limits."""
+        rows = []
+        for batch in self:
+            rows.extend(batch)
+        return rows
+
+    def close(self):
+        """Releases the cursor and gives the connection back to the pool."""
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+        if self._connection is not None:
+            if self._budget is not None:
+                self._budget.stop()
+            self._pool.release(self._connection)
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,552 @@
+"""Materialized rollups in a sidecar SQLite file, and rewriting of queries to use them.
+
+Rollups are declared like CHINOOK_ROLLUPS and built by
+
+    python -m sql_table_qa.dbutils.rollups refresh
+
+A query is answered from a rollup when, after qualifying its columns with sqlglot,
+it joins the same tables on the same keys as the rollup, only groups and filters on
+rollup dimensions, and only aggregates rollup measures. The first time a query is
+routed, its rollup result is compared with the result on the base tables and the
+rewrite is dropped if they differ. Rollups are refreshed in a background thread when the
+`data_version` of the source database changes, and queries read the base tables until
+the refresh is done: rows appended to a rollup's fact table are aggregated and appended
+to it, any other change rebuilds it.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.optimizer.qualify import qualify
+
+from CONSTANTS import DATABASE_PATH
+from sql_table_qa.dbutils.chinook_rollups import CHINOOK_ROLLUPS
+from sql_table_qa.dbutils.connection_pool import ConnectionPool, get_shared_pool
+from sql_table_qa.dbutils.query_result import QueryResult
+from sql_table_qa.dbutils.schema_introspector import SchemaIntrospector, _quote
+from sql_table_qa.dbutils.sql_analysis import SQLAnalysis
+
+logger = logging.getLogger(__name__)
+
+_META_TABLE = "_rollup_meta"
+
+
+def default_rollup_path(database_path: str) -> str:
+    """The sidecar file next to a database, e.g. data/Chinook.rollups.db for data/Chinook.db."""
+    return f"{os.path.splitext(database_path)[0]}.rollups.db"
+
+
+class _NotRewritable(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class RollupRewrite:
+    """A query and its equivalent on a rollup table."""
+    sql: str
+    rollup: str
+    rewritten_sql: str
+
+
+@dataclass
+class _CompiledRollup:
+    name: str
+    definition: dict
+    fact_table: str
+    tables: frozenset
+    joins: frozenset
+    # Canonical expression SQL -> rollup column
+    dimensions: dict
+    # (aggregate function, canonical argument SQL) -> rollup column
+    measures: dict
+    digest: str
+    # Source table -> columns the rollup reads from it
+    columns: dict = None
+
+    def select_sql(self, where: str = None) -> str:
+        dimensions = self.definition["dimensions"]
+        columns = [f"{expression} AS {_quote(name)}" for name, expression in dimensions.items()]
+        columns += [f"{expression} AS {_quote(name)}" for name, expression in self.definition["measures"].items()]
+        sql = f"SELECT {', '.join(columns)} FROM {self.definition['source']}"
+        if where:
+            sql += f" WHERE {where}"
+        return f"{sql} GROUP BY {', '.join(dimensions.values())}"
+
+
+def _canonical(expression: exp.Expression) -> str:
+    return expression.sql(dialect="sqlite")
+
+
+def _qualified(statement: exp.Expression, schema: dict) -> tuple:
+    """
+    Qualifies every column of a single SELECT with the real name of its table.
+
+    Returns:
+    tuple: (statement, set of tables, set of canonical join keys).
+    """
+    if not isinstance(statement, exp.Select) or statement.args.get("with"):
+        raise _NotRewritable("not a plain SELECT")
+    statement = qualify(statement, schema=schema, dialect="sqlite")
+    if len(list(statement.find_all(exp.Select))) > 1:
+        raise _NotRewritable("subqueries")
+    aliases = {table.alias_or_name: table.name for table in statement.find_all(exp.Table)}
+    if len(set(aliases.values())) != len(aliases):
+        raise _NotRewritable("self join")
+    for column in statement.find_all(exp.Column):
+        if column.table in aliases:
+            column.set("table", exp.to_identifier(aliases[column.table], quoted=True))
+    joins = set()
+    for join in statement.args.get("joins") or []:
+        if join.side or join.kind not in ("", "INNER") or join.args.get("using") or not join.args.get("on"):
+            raise _NotRewritable("only inner joins with ON conditions are supported")
+        for condition in join.args["on"].flatten() if isinstance(join.args["on"], exp.And) else [join.args["on"]]:
+            if not isinstance(condition, exp.EQ):
+                raise _NotRewritable("join condition is not an equality")
+            joins.add(tuple(sorted((_canonical(condition.this), _canonical(condition.expression)))))
+    return statement, frozenset(aliases.values()), frozenset(joins)
+
+
+def _aggregate_key(node: exp.AggFunc) -> tuple:
+    argument = node.this
+    if isinstance(argument, exp.Distinct):
+        return None
+    if isinstance(argument, exp.Star) or (isinstance(node, exp.Count) and isinstance(argument, exp.Literal)):
+        return type(node).__name__.upper(), "*"
+    return type(node).__name__.upper(), _canonical(argument)
+
+
+def _compile(name: str, definition: dict, schema: dict) -> _CompiledRollup:
+    rollup = _CompiledRollup(name, definition, "", frozenset(), frozenset(), {}, {},
+                             hashlib.sha1(json.dumps(definition, sort_keys=True).encode()).hexdigest())
+    statement, tables, joins = _qualified(sqlglot.parse_one(rollup.select_sql(), read="sqlite"), schema)
+    rollup.tables, rollup.joins = tables, joins
+    rollup.fact_table = statement.args["from"].this.name
+    rollup.columns = {}
+    for column in statement.find_all(exp.Column):
+        if column.table in tables:
+            rollup.columns.setdefault(column.table, set()).add(column.name)
+    for projection in statement.expressions:
+        column = projection.alias
+        if column in definition["dimensions"]:
+            rollup.dimensions[_canonical(projection.this)] = column
+        else:
+            key = _aggregate_key(projection.this) if isinstance(projection.this, exp.AggFunc) else None
+            if key is None or key[0] not in ("SUM", "COUNT", "MIN", "MAX"):
+                raise ValueError(f"Rollup {name}: measure {column} must be a SUM, COUNT, MIN or MAX.")
+            rollup.measures[key] = column
+    return rollup
+
+
+def _row_hash(*values) -> int:
+    return zlib.crc32(repr(values).encode())
+
+
+def results_equivalent(left: QueryResult, right: QueryResult) -> bool:
+    """
+    Compares two results as multisets of rows, ignoring column names
+    and the rounding error of summing floats in a different order.
+    """
+    if len(left.columns) != len(right.columns) or left.row_count != right.row_count:
+        return False
+
+    def sort_key(row):
+        return tuple((value is None, isinstance(value, str),
+                      round(value, 6) if isinstance(value, float) else value) for value in row)
+
+    for row_left, row_right in zip(sorted(left.rows, key=sort_key), sorted(right.rows, key=sort_key)):
+        for a, b in zip(row_left, row_right):
+            if isinstance(a, (int, float)) and isinstance(b, (int, float)) and not isinstance(a, bool):
+                if not math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9):
+                    return False
+            elif a != b:
+                return False
+    return True
+
+
+class RollupStore:
+    """
+    The rollups of one database: builds and refreshes them in the sidecar file,
+    and rewrites queries to read from them.
+    """
+
+    def __init__(self, database_path: str = DATABASE_PATH, definitions: dict = None, path: str = None,
+                 schema: SchemaIntrospector = None, max_rewrites: int = 1024, refresh_interval: float = 1.0):
+        """
+        Initializes the store. Nothing is built until `refresh` is called.
+
+        Args:
+        database_path (str): Path to the source SQLite database.
+        definitions (dict): Rollup definitions shaped like CHINOOK_ROLLUPS.
+        path (str): Path of the sidecar file. Defaults to `default_rollup_path(database_path)`.
+        schema (SchemaIntrospector): Schema of the source database, used to qualify columns.
+        max_rewrites (int): Number of rewrite decisions remembered per SQL text.
+        refresh_interval (float): Least seconds between the end of one background refresh
+            and the start of the next, so that a stream of writes does not keep the rollups
+            rebuilding.
+        """
+        self.database_path = database_path
+        self.definitions = CHINOOK_ROLLUPS if definitions is None else definitions
+        self.path = path or default_rollup_path(database_path)
+        self.schema = schema or SchemaIntrospector(get_shared_pool(database_path))
+        self.max_rewrites = max_rewrites
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        # Serializes refreshes, which take long enough that `_lock` must not be held meanwhile
+        self._refresh_lock = threading.Lock()
+        self._refreshing = None
+        self._refreshed_at = -math.inf
+        self._compiled = None
+        self._compiled_version = None
+        self._rewrites = OrderedDict()
+        # SQL text -> column names of the base result, once the rewrite was checked
+        self._verified = {}
+        self._rejected = set()
+        self._source = None
+        self._data_version = None
+        self._routed = 0
+        self._mismatches = 0
+        self._refreshes = {"full": 0, "incremental": 0}
+
+    @property
+    def pool(self) -> ConnectionPool:
+        """The read-only pool over the sidecar file."""
+        return get_shared_pool(self.path)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def refresh(self, full: bool = False) -> dict:
+        """
+        Brings every rollup up to date with the source database.
+
+        Args:
+        full (bool): Rebuild every rollup instead of only the stale ones.
+
+        Returns:
+        dict: {rollup: "fresh", "incremental" or "full"}.
+        """
+        with self._refresh_lock:
+            compiled = self._compile()
+            writer = sqlite3.connect(self.path, uri=True, isolation_level=None)
+            try:
+                writer.create_function("rollup_row_hash", -1, _row_hash, deterministic=True)
+                writer.execute("ATTACH DATABASE ? AS source", (f"file:{os.path.abspath(self.database_path)}?mode=ro",))
+                writer.execute(f"CREATE TABLE IF NOT EXISTS {_META_TABLE} (rollup TEXT NOT NULL, "
+                               "source_table TEXT NOT NULL, row_count INTEGER, max_rowid INTEGER, checksum INTEGER, "
+                               "digest TEXT NOT NULL, refreshed REAL NOT NULL, PRIMARY KEY (rollup, source_table))")
+                columns = {}
+                for rollup in compiled.values():
+                    for table, names in rollup.columns.items():
+                        columns.setdefault(table, set()).update(names)
+                columns = {table: sorted(names) for table, names in columns.items()}
+                fingerprints = {table: self._fingerprint(writer, table, names) for table, names in columns.items()}
+                actions = {}
+                for rollup in compiled.values():
+                    actions[rollup.name] = self._refresh_rollup(writer, rollup, fingerprints, columns, full)
+                self._drop_undefined(writer, compiled)
+            finally:
+                writer.close()
+            with self._lock:
+                for action in actions.values():
+                    if action != "fresh":
+                        self._refreshes[action] += 1
+            return actions
+
+    @staticmethod
+    def _fingerprint(writer, table: str, columns: list, max_rowid: int = None) -> tuple:
+        """Row count, largest rowid and a checksum of the columns the rollups read from a table."""
+        where = f" WHERE rowid <= {int(max_rowid)}" if max_rowid is not None else ""
+        hashed = ", ".join(_quote(column) for column in columns)
+        return tuple(writer.execute(f"SELECT COUNT(*), MAX(rowid), COALESCE(SUM(rollup_row_hash({hashed})), 0) "
+                                    f"FROM source.{_quote(table)}{where}").fetchone())
+
+    def _refresh_rollup(self, writer, rollup: _CompiledRollup, fingerprints: dict, columns: dict,
+                        full: bool) -> str:
+        stored = {row[0]: (row[1:4], row[4]) for row in writer.execute(
+            f"SELECT source_table, row_count, max_rowid, checksum, digest FROM {_META_TABLE} WHERE rollup = ?",
+            (rollup.name,))}
+        current = {table: fingerprints[table] for table in rollup.tables}
+        table_exists = writer.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                      (rollup.name,)).fetchone() is not None
+        rebuild = (full or not table_exists or set(stored) != set(current)
+                   or any(digest != rollup.digest for _, digest in stored.values()))
+        if not rebuild and all(stored[table][0] == current[table] for table in current):
+            return "fresh"
+
+        action = "full"
+        writer.execute("BEGIN IMMEDIATE")
+        try:
+            fact = rollup.fact_table
+            incremental = not rebuild and all(stored[table][0] == current[table] for table in current if table != fact)
+            fact_before = stored[fact][0] if fact in stored else None
+            # Rows up to the previous largest rowid must be untouched for the new rows to be folded in
+            if incremental and fact_before[1] is not None and \
+                    self._fingerprint(writer, fact, columns[fact], fact_before[1]) == fact_before:
+                writer.execute(f"INSERT INTO {_quote(rollup.name)} " + rollup.select_sql(
+                    f"{_quote(fact)}.rowid > {int(fact_before[1])}"))
+                action = "incremental"
+            else:
+                writer.execute(f"DROP TABLE IF EXISTS {_quote(rollup.name)}")
+                writer.execute(f"CREATE TABLE {_quote(rollup.name)} AS {rollup.select_sql()}")
+            writer.execute(f"DELETE FROM {_META_TABLE} WHERE rollup = ?", (rollup.name,))
+            now = time.time()
+            writer.executemany(f"INSERT INTO {_META_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               [(rollup.name, table, *current[table], rollup.digest, now) for table in current])
+            writer.execute("COMMIT")
+        except BaseException:
+            writer.execute("ROLLBACK")
+            raise
+        logger.info("Refreshed rollup %s (%s)", rollup.name, action)
+        return action
+
+    @staticmethod
+    def _drop_undefined(writer, compiled: dict):
+        stale = [row[0] for row in writer.execute(f"SELECT DISTINCT rollup FROM {_META_TABLE}")
+                 if row[0] not in compiled]
+        for name in stale:
+            writer.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+            writer.execute(f"DELETE FROM {_META_TABLE} WHERE rollup = ?", (name,))
+
+    def ensure_fresh(self, wait: bool = False) -> bool:
+        """
+        Checks that the rollups reflect the current source database.
+
+        If the source changed since the rollups were last refreshed, a refresh starts in a
+        background thread, one at a time and at most once per `refresh_interval`, and the
+        rollups are reported stale until it has finished, so that queries never wait for it.
+
+        Args:
+        wait (bool): Refresh in the calling thread instead, if the rollups are stale.
+
+        Returns:
+        bool: True if the rollups are up to date and can be read.
+        """
+        with self._lock:
+            try:
+                if self._source is None:
+                    self._source = sqlite3.connect(f"file:{os.path.abspath(self.database_path)}?mode=ro",
+                                                   uri=True, check_same_thread=False)
+                version = self._source.execute("PRAGMA data_version").fetchone()[0]
+            except sqlite3.Error:
+                logger.exception("Could not read the data version of %s", self.database_path)
+                return False
+            if version == self._data_version:
+                return True
+            if wait:
+                running = self._refreshing
+            elif self._refreshing is None and time.monotonic() - self._refreshed_at >= self.refresh_interval:
+                self._refreshing = threading.Thread(target=self._refresh_to, args=(version,),
+                                                    name="rollup-refresh", daemon=True)
+                self._refreshing.start()
+                return False
+            else:
+                return False
+        if running is not None:
+            running.join()
+        self._refresh_to(version)
+        with self._lock:
+            return self._data_version == version
+
+    def _refresh_to(self, version: int):
+        """Refreshes the rollups and marks them fresh as of the source `data_version` read before."""
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Could not refresh the rollups in %s", self.path)
+        else:
+            with self._lock:
+                self._data_version = version
+        finally:
+            with self._lock:
+                if self._refreshing is threading.current_thread():
+                    self._refreshing = None
+                self._refreshed_at = time.monotonic()
+
+    def wait_for_refresh(self, timeout: float = None) -> bool:
+        """
+        Waits for the background refresh, if one is running.
+
+        Returns:
+        bool: True if no refresh is running anymore.
+        """
+        with self._lock:
+            running = self._refreshing
+        if running is not None:
+            running.join(timeout)
+            return not running.is_alive()
+        return True
+
+    def _compile(self) -> dict:
+        version = self.schema.schema_version
+        with self._lock:
+            if self._compiled is None or version != self._compiled_version:
+                schema = self._qualify_schema()
+                self._compiled = {name: _compile(name, definition, schema)
+                                  for name, definition in self.definitions.items()}
+                self._compiled_version = version
+                self._rewrites.clear()
+            return self._compiled
+
+    def _qualify_schema(self) -> dict:
+        return {table: {column: info["dtype"] or "TEXT" for column, info in table_info["columns"].items()}
+                for table, table_info in self.schema.get_schema().items()}
+
+    def rewrite(self, analysis: SQLAnalysis) -> RollupRewrite:
+        """
+        Rewrites a query to read from a rollup, if one can answer it.
+
+        Args:
+        analysis (SQLAnalysis): The analysis of the query.
+
+        Returns:
+        RollupRewrite: The rewritten query, or None if no rollup can answer it.
+        """
+        sql = analysis.sql
+        compiled = self._compile()
+        with self._lock:
+            if sql in self._rejected:
+                return None
+            if sql in self._rewrites:
+                self._rewrites.move_to_end(sql)
+                return self._rewrites[sql]
+        rewrite = self._find_rewrite(analysis, compiled)
+        with self._lock:
+            self._rewrites[sql] = rewrite
+            while len(self._rewrites) > self.max_rewrites:
+                self._rewrites.popitem(last=False)
+        return rewrite
+
+    def _find_rewrite(self, analysis: SQLAnalysis, compiled: dict) -> RollupRewrite:
+        statement = analysis.statement
+        if statement is None or not analysis.is_read_only or statement.find(exp.AggFunc) is None:
+            return None
+        try:
+            statement, tables, joins = _qualified(statement.copy(), self._qualify_schema())
+        except (_NotRewritable, sqlglot.errors.SqlglotError):
+            return None
+        candidates = sorted((rollup for rollup in compiled.values()
+                             if rollup.tables == tables and rollup.joins == joins),
+                            key=lambda rollup: len(rollup.dimensions))
+        for rollup in candidates:
+            rewritten = self._rewrite_for(statement, rollup)
+            if rewritten is not None:
+                return RollupRewrite(analysis.sql, rollup.name, rewritten.sql(dialect="sqlite"))
+        return None
+
+    @staticmethod
+    def _rewrite_for(statement: exp.Select, rollup: _CompiledRollup) -> exp.Select:
+        rewritten = statement.copy()
+        rewritten.set("from", exp.From(this=exp.to_table(rollup.name)))
+        rewritten.set("joins", None)
+        unsupported = []
+
+        def replace_aggregate(node):
+            if not isinstance(node, exp.AggFunc):
+                return node
+            replacement = RollupStore._rollup_aggregate(node, rollup)
+            if replacement is None:
+                unsupported.append(node)
+                return node
+            return replacement
+
+        def replace_dimension(node):
+            column = rollup.dimensions.get(_canonical(node)) if isinstance(node, (exp.Column, exp.Func)) else None
+            return exp.column(column, quoted=True) if column else node
+
+        rewritten = rewritten.transform(replace_aggregate)
+        if unsupported:
+            return None
+        rewritten = rewritten.transform(replace_dimension)
+        # Any column still bound to a source table is neither a dimension nor inside a measure
+        if any(column.table in rollup.tables for column in rewritten.find_all(exp.Column)):
+            return None
+        return rewritten
+
+    @staticmethod
+    def _rollup_aggregate(node: exp.AggFunc, rollup: _CompiledRollup) -> exp.Expression:
+        key = _aggregate_key(node)
+        if key is None:
+            return None
+        function, argument = key
+        measures = rollup.measures
+        if function in ("SUM", "MIN", "MAX") and key in measures:
+            return sqlglot.parse_one(f'{function}("{measures[key]}")', read="sqlite")
+        if function in ("MIN", "MAX") and argument in rollup.dimensions:
+            return sqlglot.parse_one(f'{function}("{rollup.dimensions[argument]}")', read="sqlite")
+        if function == "COUNT" and key in measures:
+            # COUNT is 0, not NULL, when no row matches
+            return sqlglot.parse_one(f'COALESCE(SUM("{measures[key]}"), 0)', read="sqlite")
+        if function == "AVG" and ("SUM", argument) in measures and ("COUNT", argument) in measures:
+            return sqlglot.parse_one(f'CAST(SUM("{measures[("SUM", argument)]}") AS REAL) / '
+                                     f'SUM("{measures[("COUNT", argument)]}")', read="sqlite")
+        return None
+
+    def verified_columns(self, rewrite: RollupRewrite) -> list:
+        """The column names of the base query, if its rewrite was already checked. Else None."""
+        with self._lock:
+            self._routed += 1
+            return self._verified.get(rewrite.sql)
+
+    def confirm(self, rewrite: RollupRewrite, base: QueryResult, rolled_up: QueryResult) -> bool:
+        """
+        Compares the result of a rewrite with the result on the base tables.
+        Rewrites that do not match are never used again.
+
+        Returns:
+        bool: True if the results are equivalent.
+        """
+        equivalent = not base.truncated and not rolled_up.truncated and results_equivalent(base, rolled_up)
+        with self._lock:
+            if equivalent:
+                self._verified[rewrite.sql] = list(base.columns)
+            else:
+                self._mismatches += 1
+                self._rejected.add(rewrite.sql)
+                self._rewrites.pop(rewrite.sql, None)
+        if not equivalent:
+            logger.warning("Rollup %s does not reproduce the result of: %s", rewrite.rollup, rewrite.sql)
+        return equivalent
+
+    def stats(self) -> dict:
+        """
+        Returns routing and refresh counters.
+
+        Returns:
+        dict: routed queries, verified and rejected rewrites, and full and incremental refreshes.
+        """
+        with self._lock:
+            return {"routed": self._routed, "verified": len(self._verified), "rejected": len(self._rejected),
+                    "mismatches": self._mismatches, "full_refreshes": self._refreshes["full"],
+                    "incremental_refreshes": self._refreshes["incremental"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and refresh the rollups of a database.")
+    parser.add_argument("command", choices=["refresh"])
+    parser.add_argument("--database", default=DATABASE_PATH, help="Source SQLite database.")
+    parser.add_argument("--path", default=None, help="Sidecar file. Defaults to <database>.rollups.db.")
+    parser.add_argument("--full", action="store_true", help="Rebuild every rollup.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = RollupStore(args.database, path=args.path)
+    started = time.perf_counter()
+    actions = store.refresh(full=args.full)
+    for name, action in actions.items():
+        print(f"{name}: {action}")
+    print(f"Refreshed {store.path} in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import threading
+import time
+
+from sql_table_qa.dbutils.connection_pool import ConnectionPool
+
+
+# Raw introspection results shared by every introspector, keyed on (database path, schema_version).
+# Row counts are not part of them, since they change without the schema changing.
+_introspection_cache = {}
+_introspection_cache_lock = threading.Lock()
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+class SchemaIntrospector:
+    """
+    Reads the schema of any SQLite database from sqlite_master and the table pragmas.
+
+    The schema is introspected once per `PRAGMA schema_version` and kept in memory
+    together with prompt-ready DDL for every table, so schema lookups and prompt
+    building never go back to the database unless the schema has changed. Row counts
+    are recounted when `PRAGMA data_version` shows that another connection committed,
+    so they follow data-only changes too.
+    """
+
+    def __init__(self, pool: ConnectionPool, descriptions: dict = None, check_interval: float = 5.0):
+        """
+        Initializes the introspector. Nothing is read until the schema is first requested.
+
+        Args:
+        pool (ConnectionPool): The pool to borrow a connection from.
+        descriptions (dict): Optional human descriptions, shaped like
+            {table: {"desc": str, "columns": {column: {"desc": str}}}}.
+        check_interval (float): Seconds during which the cached schema and row counts
+            are trusted without checking schema_version and data_version again.
+        """
+        self.pool = pool
+        self.descriptions = descriptions or {}
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._schema_version = None
+        self._checked_at = 0.0
+        self._raw = {}
+        self._row_counts = {}
+        # Last `PRAGMA data_version` seen on each pooled connection
+        self._data_versions = {}
+        self._schema = {}
+        self._prompts = {}
+
+    @property
+    def schema_version(self) -> int:
+        """The `PRAGMA schema_version` the cached schema was read at."""
+        self._refresh()
+        return self._schema_version
+
+    def get_schema(self) -> dict:
+        """
+        Returns the schema of every table.
+
+        Returns:
+        dict: {table: {"desc", "columns", "primary_key", "foreign_keys", "indexes", "row_count"}},
+            where "columns" maps column names to {"dtype", "desc", "nullable", "default", "pk"}.
+        """
+        self._refresh()
+        return self._schema
+
+    def get_table_prompts(self) -> dict:
+        """
+        Returns prompt-ready DDL per table, annotated with descriptions and row counts.
+
+        Returns:
+        dict: {table: CREATE TABLE statement with comments}.
+        """
+        self._refresh()
+        return self._prompts
+
+    def invalidate(self):
+        """Forces the next lookup to check schema_version and data_version."""
+        with self._lock:
+            self._checked_at = 0.0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._schema_version is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._schema_version is not None and now - self._checked_at < self.check_interval:
+                return
+            with self.pool.connection() as connection:
+                version = connection.execute("PRAGMA schema_version").fetchone()[0]
+                data_changed = self._data_changed(connection)
+                if version != self._schema_version:
+                    self._raw = self._introspect_cached(connection, version)
+                    self._row_counts = self._count_rows(connection, self._raw)
+                    self._schema_version = version
+                    self._build()
+                elif data_changed:
+                    self._row_counts = self._count_rows(connection, self._raw)
+                    self._build()
+            self._checked_at = now
+
+    def _data_changed(self, connection) -> bool:
+        """Whether another connection committed since `connection` was last checked."""
+        data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+        previous = self._data_versions.get(id(connection))
+        self._data_versions[id(connection)] = data_version
+        return previous is not None and previous != data_version
+
+    def _build(self):
+        self._schema = self._merge_descriptions(self._raw, self._row_counts)
+        self._prompts = {table: self._render_table(table, info) for table, info in self._schema.items()}
+
+    def _introspect_cached(self, connection, version: int) -> dict:
+        key = (self.pool.database_path, version)
+        with _introspection_cache_lock:
+            raw = _introspection_cache.get(key)
+        if raw is None:
+            raw = self._introspect(connection)
+            with _introspection_cache_lock:
+                _introspection_cache[key] = raw
+        return raw
+
+    @staticmethod
+    def _introspect(connection) -> dict:
+        tables = [row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+        schema = {}
+        for table in tables:
+            quoted = _quote(table)
+            columns = {}
+            primary_key = []
+            for _, name, dtype, notnull, default, pk in connection.execute(f"PRAGMA table_info({quoted})"):
+                columns[name] = {"dtype": dtype, "nullable": not notnull, "default": default, "pk": bool(pk)}
+                if pk:
+                    primary_key.append((pk, name))
+            foreign_keys = [
+                {"column": row[3], "references_table": row[2], "references_column": row[4]}
+                for row in connection.execute(f"PRAGMA foreign_key_list({quoted})")
+            ]
+            indexes = []
+            for _, index_name, unique, origin, _partial in connection.execute(f"PRAGMA index_list({quoted})"):
+                index_columns = [row[2] for row in connection.execute(f"PRAGMA index_info({_quote(index_name)})")]
+                indexes.append({"name": index_name, "columns": index_columns,
+                                "unique": bool(unique), "origin": origin})
+            schema[table] = {
+                "columns": columns,
+                "primary_key": [name for _, name in sorted(primary_key)],
+                "foreign_keys": foreign_keys,
+                "indexes": indexes,
+            }
+        return schema
+
+    @staticmethod
+    def _count_rows(connection, raw: dict) -> dict:
+        return {table: connection.execute(f"SELECT COUNT(*) FROM {_quote(table)}").fetchone()[0] for table in raw}
+
+    def _merge_descriptions(self, raw: dict, row_counts: dict) -> dict:
+        schema = {}
+        for table, info in raw.items():
+            described = self.descriptions.get(table, {})
+            described_columns = described.get("columns", {})
+            columns = {}
+            for column, column_info in info["columns"].items():
+                desc = described_columns.get(column, {}).get("desc", "")
+                columns[column] = {"dtype": column_info["dtype"], "desc": desc,
+                                   **{k: v for k, v in column_info.items() if k != "dtype"}}
+            schema[table] = {"desc": described.get("desc", ""), **info, "columns": columns,
+                             "row_count": row_counts[table]}
+        return schema
+
+    @staticmethod
+    def _render_table(table: str, info: dict) -> str:
+        header = f"CREATE TABLE {_quote(table)} ("
+        comment = " ".join(part for part in (info["desc"], f"({info['row_count']} rows)") if part)
+        lines = [f"{header}  -- {comment}"]
+        definitions = []
+        for column, column_info in info["columns"].items():
+            definition = f"\t{_quote(column)} {column_info['dtype']}"
+            if not column_info["nullable"]:
+                definition += " NOT NULL"
+            definitions.append((definition, column_info["desc"]))
+        if info["primary_key"]:
+            definitions.append((f"\tPRIMARY KEY ({', '.join(map(_quote, info['primary_key']))})", ""))
+        for fk in info["foreign_keys"]:
+            definitions.append((f"\tFOREIGN KEY({_quote(fk['column'])}) REFERENCES "
+                                f"{_quote(fk['references_table'])} ({_quote(fk['references_column'])})", ""))
+        for index, (definition, desc) in enumerate(definitions):
+            separator = "," if index < len(definitions) - 1 else ""
+            lines.append(f"{definition}{separator}  -- {desc}" if desc else f"{definition}{separator}")
+        lines.append(")")
+        return "\n".join(lines)
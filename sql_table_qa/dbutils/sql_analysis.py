@@ -0,0 +1,164 @@
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+
+
+# Statement types that can only read. Anything else is rejected, including statements
+# sqlglot only recognises as a generic Command (ATTACH, VACUUM, EXPLAIN...).
+READ_ONLY_STATEMENTS = (exp.Select, exp.Union, exp.Intersect, exp.Except, exp.Values)
+MODIFYING_NODES = (exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop,
+                   exp.AlterTable, exp.Transaction, exp.Commit, exp.Rollback)
+# Commands that only describe another statement
+READ_ONLY_COMMANDS = {"EXPLAIN"}
+# Node types a parsed statement can have. sqlglot parses some invalid text as a bare
+# expression instead of failing, e.g. "SELEC x" as the alias "SELEC AS x".
+STATEMENT_NODES = (*READ_ONLY_STATEMENTS, *MODIFYING_NODES, exp.Query, exp.DML, exp.DDL, exp.Command,
+                   exp.Describe, exp.Set, exp.Use, exp.Pragma)
+# Pragmas that only report on the schema or the database file
+READ_ONLY_PRAGMAS = {
+    "table_info", "table_xinfo", "table_list", "index_list", "index_info", "index_xinfo",
+    "foreign_key_list", "collation_list", "function_list", "database_list",
+    "schema_version", "data_version", "user_version", "page_count", "page_size",
+}
+# Read-only pragmas whose parenthesized argument names a table or index. For any other
+# pragma, "PRAGMA name(value)" sets the value like "PRAGMA name = value".
+ARGUMENT_PRAGMAS = {"table_info", "table_xinfo", "table_list", "index_list", "index_info", "index_xinfo",
+                    "foreign_key_list"}
+_NONDETERMINISTIC_MARKERS = ("RANDOM(", "RANDOMBLOB(", "'NOW'", "CURRENT_TIMESTAMP", "CURRENT_DATE",
+                             "CURRENT_TIME", "CHANGES(", "LAST_INSERT_ROWID(")
+_PRAGMA = re.compile(r"^\s*PRAGMA\s+(?:\w+\.)?(\w+)\s*(=|\()?", re.IGNORECASE)
+
+
+class InvalidSQLError(ValueError):
+    """Raised for SQL that cannot be run: unparsable, modifying, or more than one statement."""
+
+
+@dataclass(frozen=True)
+class SQLAnalysis:
+    """
+    Everything the connector needs to know about an SQL text, from a single sqlglot parse.
+
+    The parsed `statements` are shared by every caller of `analyze_sql` for the same text:
+    call `.copy()` on them before transforming them.
+    """
+    sql: str
+    is_valid: bool
+    error: str = None
+    statement_types: tuple = ()
+    is_read_only: bool = False
+    is_modifying: bool = False
+    normalized_sql: str = ""
+    is_cacheable: bool = False
+    tables: frozenset = frozenset()
+    columns: frozenset = frozenset()
+    statements: tuple = field(default=(), compare=False, repr=False)
+
+    @property
+    def statement(self) -> exp.Expression:
+        """The single parsed statement, or None for invalid or multi-statement SQL."""
+        return self.statements[0] if len(self.statements) == 1 else None
+
+    def check_allowed(self):
+        """
+        Raises InvalidSQLError unless the SQL is a single read-only statement.
+        """
+        if self.is_modifying:
+            raise InvalidSQLError("Modifying SQL statements are not allowed.")
+        if len(self.statement_types) > 1:
+            raise InvalidSQLError("Only one SQL statement can be executed at a time.")
+        if not self.is_read_only:
+            if not self.statement_types:
+                raise InvalidSQLError(f"Could not parse the SQL statement: {self.error}")
+            raise InvalidSQLError(f"{self.statement_types[0]} statements are not supported: only queries can be run.")
+
+
+@lru_cache(maxsize=2048)
+def analyze_sql(sql: str, dialect: str = "sqlite") -> SQLAnalysis:
+    """
+    Parses an SQL text once and derives its validity, statement types, normalized form
+    and referenced tables and columns. Results are memoized on (sql, dialect).
+
+    Args:
+    sql (str): The SQL text.
+    dialect (str): The sqlglot dialect to parse with.
+
+    Returns:
+    SQLAnalysis: The analysis, shared between callers.
+    """
+    pragma = _PRAGMA.match(sql)
+    if pragma:
+        # sqlglot keeps PRAGMA arguments opaque, so the allow-list works on the text
+        name = pragma.group(1).lower()
+        setter = pragma.group(2) == "=" or (pragma.group(2) == "(" and name not in ARGUMENT_PRAGMAS)
+        read_only = name in READ_ONLY_PRAGMAS and not setter and ";" not in sql.strip().rstrip(";")
+        return SQLAnalysis(sql=sql, is_valid=True, statement_types=("PRAGMA",), is_read_only=read_only,
+                           is_modifying=setter, normalized_sql=" ".join(sql.split()).rstrip(";"))
+    try:
+        statements = tuple(s for s in sqlglot.parse(sql, read=dialect) if s is not None)
+    except sqlglot.errors.SqlglotError as e:
+        # SQLite accepts some syntax sqlglot does not. Plain queries are still let through,
+        # the pooled connections being read-only, but never cached.
+        text = sql.strip().rstrip(";")
+        plain_query = re.match(r"(SELECT|WITH)\b", text, re.IGNORECASE) is not None and ";" not in text
+        return SQLAnalysis(sql=sql, is_valid=False, error=str(e).splitlines()[0],
+                           statement_types=("SELECT",) if plain_query else (), is_read_only=plain_query,
+                           normalized_sql=sql.strip())
+    if not statements:
+        return SQLAnalysis(sql=sql, is_valid=False, error="Empty SQL statement.")
+
+    if not all(isinstance(s, STATEMENT_NODES) for s in statements):
+        text = " ".join(sql.split())[:80]
+        return SQLAnalysis(sql=sql, is_valid=False, error=f"{text!r} is not an SQL statement.")
+
+    types = tuple(_statement_type(s) for s in statements)
+    modifying = any(isinstance(node, MODIFYING_NODES) for s in statements for node in s.walk()) or any(
+        isinstance(s, exp.Command) and _statement_type(s) not in READ_ONLY_COMMANDS for s in statements)
+    read_only = (len(statements) == 1 and isinstance(statements[0], READ_ONLY_STATEMENTS) and not modifying)
+    normalized = ";\n".join(_canonical_statement(s.copy(), dialect) for s in statements)
+    cte_names = {cte.alias_or_name for s in statements for cte in s.find_all(exp.CTE)}
+    tables = frozenset(t.name for s in statements for t in s.find_all(exp.Table)
+                       if t.name and t.name not in cte_names)
+    columns = frozenset(c.name for s in statements for c in s.find_all(exp.Column) if c.name)
+    upper = normalized.upper()
+    return SQLAnalysis(
+        sql=sql,
+        is_valid=True,
+        statement_types=types,
+        is_read_only=read_only,
+        is_modifying=modifying,
+        normalized_sql=normalized,
+        is_cacheable=read_only and not any(marker in upper for marker in _NONDETERMINISTIC_MARKERS),
+        tables=tables,
+        columns=columns,
+        statements=statements,
+    )
+
+
+def _statement_type(statement: exp.Expression) -> str:
+    """The node type of a statement, or the keyword of a generic Command such as "EXPLAIN"."""
+    if isinstance(statement, exp.Command):
+        return statement.name.upper()
+    return type(statement).__name__.upper()
+
+
+def _canonical_statement(statement: exp.Expression, dialect: str) -> str:
+    """
+    Whitespace, keyword and identifier casing, comments, trailing semicolons and table
+    alias names are normalized away. Column aliases are kept since they name the result columns.
+    """
+    statement = normalize_identifiers(statement, dialect=dialect)
+    aliases = {}
+    for table in statement.find_all(exp.Table):
+        alias = table.alias
+        if alias and alias not in aliases:
+            aliases[alias] = f"_t{len(aliases)}"
+            table.set("alias", exp.TableAlias(this=exp.to_identifier(aliases[alias])))
+    if aliases:
+        for column in statement.find_all(exp.Column):
+            if column.table in aliases:
+                column.set("table", exp.to_identifier(aliases[column.table]))
+    return statement.sql(dialect=dialect, normalize=True, comments=False)
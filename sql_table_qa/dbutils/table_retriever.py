@@ -0,0 +1,259 @@
+"""Picks the tables relevant to a question so only their DDL goes into the query-writing prompt.
+
+Run as a module to report recall against the `tables_needed` column of the evaluation dataset
+and of data/table_retrieval_heldout.csv, paraphrased questions kept out of any tuning:
+    python -m sql_table_qa.dbutils.table_retriever
+"""
+import csv
+import math
+import os
+import re
+import threading
+from collections import Counter, deque
+
+from CONSTANTS import ROOT_DIR
+
+
+_STOP_WORDS = {
+    "a", "an", "the", "of", "in", "on", "by", "for", "to", "and", "or", "is", "are", "was", "were",
+    "what", "which", "who", "whom", "much", "has", "have", "that",
+    "from", "with", "their", "its", "it", "this", "there", "does", "do", "table", "stores", "related",
+    "data", "key", "primary", "foreign", "references", "name", "id", "ever", "all", "single",
+}
+
+
+def tokenize(text: str) -> list:
+    """Splits text into lowercase, lightly stemmed word tokens. CamelCase identifiers are split too."""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", str(text))
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        if token in _STOP_WORDS or len(token) < 2:
+            continue
+        tokens.append(_stem(token))
+    return tokens
+
+
+def _stem(token: str) -> str:
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    if token.endswith("s") and not token.endswith("ss") and len(token) > 3:
+        return token[:-1]
+    return token
+
+
+class TableRetriever:
+    """
+    A BM25 index over tables, built entirely offline from the connector's schema.
+
+    Each table is indexed as a document made of its name, column names, the
+    table and column descriptions, and a sample of distinct text values.
+    A question retrieves the top-k tables, plus the tables needed to join them and
+    the tables each of them references or is referenced by along foreign keys.
+    A question whose best table scores below `min_score` retrieves every table.
+    The index is rebuilt when the schema version changes.
+    """
+
+    def __init__(self, connector, k: int = 3, sample_values: int = 25, k1: float = 1.2, b: float = 0.75,
+                 synonyms: dict = None, min_score: float = 2.0):
+        """
+        Initializes the retriever. The index is built on first use.
+
+        Args:
+        connector (DatabaseConnector): Source of the schema and sample values.
+        k (int): Number of tables retrieved by score, before adding join tables.
+        sample_values (int): Distinct values sampled from each text column. 0 disables sampling.
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 document length normalization.
+        synonyms (dict): Question word expansions, e.g. {"song": ["track"]}. None by default,
+            so that the index is built from the schema alone.
+        min_score (float): BM25 score the best table must reach for the question to be
+            narrowed down. Below it, every table is returned.
+        """
+        self.connector = connector
+        self.k = k
+        self.sample_values = sample_values
+        self.k1 = k1
+        self.b = b
+        self.synonyms = synonyms or {}
+        self.min_score = min_score
+        self._lock = threading.Lock()
+        self._schema_version = None
+        self._term_frequencies = {}
+        self._idf = {}
+        self._lengths = {}
+        self._average_length = 0.0
+        self._graph = {}
+
+    def _ensure_index(self):
+        version = self.connector.schema_version
+        if version == self._schema_version:
+            return
+        with self._lock:
+            if version != self._schema_version:
+                self._build_index(self.connector.database_schema)
+                self._schema_version = version
+
+    def _build_index(self, schema: dict):
+        documents = {table: self._table_tokens(table, info) for table, info in schema.items()}
+        self._term_frequencies = {table: Counter(tokens) for table, tokens in documents.items()}
+        self._lengths = {table: len(tokens) for table, tokens in documents.items()}
+        self._average_length = sum(self._lengths.values()) / max(len(documents), 1)
+        document_frequency = Counter()
+        for frequencies in self._term_frequencies.values():
+            document_frequency.update(frequencies.keys())
+        total = len(documents)
+        self._idf = {term: math.log(1 + (total - count + 0.5) / (count + 0.5))
+                     for term, count in document_frequency.items()}
+        self._graph = {table: set() for table in schema}
+        for table, info in schema.items():
+            for fk in info.get("foreign_keys", []):
+                if fk["references_table"] in self._graph:
+                    self._graph[table].add(fk["references_table"])
+                    self._graph[fk["references_table"]].add(table)
+
+    def _table_tokens(self, table: str, info: dict) -> list:
+        # The table name is repeated so that naming the entity outweighs incidental column matches
+        tokens = tokenize(table) * 3 + tokenize(info.get("desc", ""))
+        for column, column_info in info["columns"].items():
+            tokens += tokenize(column) + tokenize(column_info.get("desc", ""))
+            dtype = str(column_info.get("dtype", "")).upper()
+            if self.sample_values and ("CHAR" in dtype or "TEXT" in dtype):
+                tokens += self._sample_tokens(table, column)
+        return tokens
+
+    def _sample_tokens(self, table: str, column: str) -> list:
+        sql = (f'SELECT DISTINCT "{column}" FROM "{table}" '
+               f'WHERE "{column}" IS NOT NULL LIMIT {self.sample_values}')
+        try:
+            values = self.connector.execute_sql(sql).column(column)
+        except Exception:
+            return []
+        return [token for value in values for token in tokenize(value)]
+
+    def score(self, question: str) -> dict:
+        """
+        Scores every table against a question with BM25.
+
+        Args:
+        question (str): The user question.
+
+        Returns:
+        dict: A dictionary mapping table names to scores, highest first.
+        """
+        self._ensure_index()
+        terms = tokenize(question)
+        terms += [_stem(extra) for term in terms for extra in self.synonyms.get(term, [])]
+        scores = {}
+        for table, frequencies in self._term_frequencies.items():
+            length_norm = 1 - self.b + self.b * self._lengths[table] / (self._average_length or 1)
+            score = 0.0
+            for term in terms:
+                frequency = frequencies.get(term)
+                if frequency:
+                    score += self._idf[term] * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+            scores[table] = score
+        return dict(sorted(scores.items(), key=lambda item: item[1], reverse=True))
+
+    def retrieve(self, question: str, k: int = None) -> list:
+        """
+        Returns the tables relevant to a question, including the tables needed to join them
+        and their foreign-key neighbours. Falls back to every table if the question matches
+        no table well.
+
+        Args:
+        question (str): The user question.
+        k (int): Number of tables retrieved by score. Defaults to the retriever's k.
+
+        Returns:
+        list: Table names.
+        """
+        k = self.k if k is None else k
+        scores = self.score(question)
+        # Tables the question names outright always make it in, the best scores fill the rest
+        question_terms = set(tokenize(question))
+        top = [table for table in scores if set(tokenize(table)) and set(tokenize(table)) <= question_terms]
+        for table, score in scores.items():
+            if len(top) >= k or score <= 0:
+                break
+            if table not in top:
+                top.append(table)
+        if not top or next(iter(scores.values())) < self.min_score:
+            # A weak best match says little about which tables are needed
+            return list(scores)
+        selected = list(top)
+        for table in top[1:]:
+            for hop in self._join_path(top[0], table):
+                if hop not in selected:
+                    selected.append(hop)
+        # A question about one table often needs a table it references or is referenced by
+        for table in top:
+            for neighbour in sorted(self._graph.get(table, ())):
+                if neighbour not in selected:
+                    selected.append(neighbour)
+        return selected
+
+    def _join_path(self, start: str, end: str) -> list:
+        """Shortest foreign-key path between two tables, by breadth-first search."""
+        previous = {start: None}
+        queue = deque([start])
+        while queue:
+            table = queue.popleft()
+            if table == end:
+                break
+            for neighbour in sorted(self._graph.get(table, ())):
+                if neighbour not in previous:
+                    previous[neighbour] = table
+                    queue.append(neighbour)
+        if end not in previous:
+            return []
+        path = []
+        while end is not None:
+            path.append(end)
+            end = previous[end]
+        return path[::-1]
+
+    def evaluate_recall(self, dataset_path: str = None, k: int = None) -> dict:
+        """
+        Measures how many of the tables each evaluation question needs are retrieved.
+
+        Args:
+        dataset_path (str): CSV with `question` and comma-separated `tables_needed` columns.
+            Defaults to data/evaluation_dataset.csv.
+        k (int): Number of tables retrieved by score. Defaults to the retriever's k.
+
+        Returns:
+        dict: Mean recall, share of questions with all tables retrieved,
+            mean number of tables retrieved, and per-question details.
+        """
+        dataset_path = dataset_path or os.path.join(ROOT_DIR, "data", "evaluation_dataset.csv")
+        with open(dataset_path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        details = []
+        for row in rows:
+            needed = {table.strip() for table in row["tables_needed"].split(",") if table.strip()}
+            retrieved = self.retrieve(row["question"], k)
+            recall = len(needed & set(retrieved)) / len(needed) if needed else 1.0
+            details.append({"question": row["question"], "needed": sorted(needed),
+                            "retrieved": retrieved, "recall": recall})
+        count = max(len(details), 1)
+        return {
+            "recall": sum(d["recall"] for d in details) / count,
+            "complete": sum(d["recall"] == 1.0 for d in details) / count,
+            "mean_tables": sum(len(d["retrieved"]) for d in details) / count,
+            "questions": details,
+        }
+
+
+if __name__ == "__main__":
+    from sql_table_qa.dbutils.database_connector import DatabaseConnector
+
+    retriever = TableRetriever(DatabaseConnector())
+    for dataset_path in (None, os.path.join(ROOT_DIR, "data", "table_retrieval_heldout.csv")):
+        report = retriever.evaluate_recall(dataset_path)
+        print(os.path.basename(dataset_path or "evaluation_dataset.csv"))
+        for detail in report["questions"]:
+            if detail["recall"] < 1.0:
+                print(f"{detail['recall']:.2f}  {detail['question']}  needed={detail['needed']} "
+                      f"retrieved={detail['retrieved']}")
+        print(f"recall={report['recall']:.3f} complete={report['complete']:.3f} "
+              f"mean_tables={report['mean_tables']:.2f}")
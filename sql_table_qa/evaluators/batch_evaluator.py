@@ -0,0 +1,379 @@
+"""Runs an answerer over the evaluation datasets concurrently and logs the results to mlflow.
+
+Execution accuracy is computed locally by running the generated SQL and comparing its first
+row with `sql_detailed_answer`. The LLM judges from llm_evaluators only score the answers
+that cannot be checked that way: unanswerable questions and queries whose result did not match.
+
+Usage:
+    python -m sql_table_qa.evaluators.batch_evaluator --fake-llm --no-mlflow
+    python -m sql_table_qa.evaluators.batch_evaluator --answerer langchain --concurrency 8
+"""
+import argparse
+import ast
+import asyncio
+import csv
+import math
+import os
+import random
+import re
+import time
+from dataclasses import asdict, dataclass
+
+from CONSTANTS import ROOT_DIR
+from sql_table_qa.answerers.concurrency import gather_bounded, run_in_sql_executor
+from sql_table_qa.dbutils.database_connector import DatabaseConnector
+from sql_table_qa.tracing import Span, span, tracer
+from sql_table_qa.tracing import log_to_mlflow as log_stage_stats_to_mlflow
+
+
+DATASETS = {
+    "evaluation": os.path.join(ROOT_DIR, "data", "evaluation_dataset.csv"),
+    "unanswerable": os.path.join(ROOT_DIR, "data", "unanswerable_dataset.csv"),
+}
+RETRYABLE_ERRORS = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError",
+                    "TimeoutError"}
+TOKEN_COUNTERS = ("prompt_tokens", "completion_tokens")
+
+
+@dataclass
+class EvaluationRecord:
+    """The outcome of answering one evaluation question."""
+    dataset: str
+    question: str
+    expected_answer: str
+    expected_result: str = ""
+    generated_sql: str = ""
+    answer: str = ""
+    latency: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    attempts: int = 0
+    execution_match: bool = None
+    error: str = ""
+
+
+def add_token_usage_to_question(finished: Span):
+    """
+    Tracing exporter that adds the token usage recorded on any span to the "eval.question"
+    span it ran under, so that each question's usage is read from the LLM spans themselves.
+    """
+    usage = {key: finished.attributes[key] for key in TOKEN_COUNTERS if finished.attributes.get(key)}
+    ancestor = finished.parent
+    while usage and ancestor is not None:
+        if ancestor.name == "eval.question":
+            ancestor.add(**usage)
+            return
+        ancestor = ancestor.parent
+
+
+class RateLimiter:
+    """An asyncio token bucket allowing `rate_per_minute` acquisitions per minute, with bursts up to `burst`."""
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def load_dataset(name: str, path: str = None) -> list:
+    """Reads an evaluation dataset CSV into a list of dicts."""
+    with open(path or DATASETS[name], newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def values_match(expected, actual) -> bool:
+    """Compares two result values, allowing for the rounding LLM-written SQL tends to add."""
+    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)):
+        return math.isclose(expected, actual, rel_tol=1e-6, abs_tol=0.006)
+    return str(expected).strip().lower() == str(actual).strip().lower()
+
+
+def execution_match(result, expected_result: str):
+    """
+    Checks the first row of a query result against the reference first row.
+    Every value of the narrower row must appear in the wider one, so queries selecting
+    extra columns, or only the key column, still count as correct.
+
+    Args:
+    result (QueryResult): The result of the generated SQL.
+    expected_result (str): The reference row as a Python literal, e.g. "('Rock', 1297)".
+
+    Returns:
+    bool: Whether the results match, or None if there is no usable reference.
+    """
+    try:
+        expected_row = ast.literal_eval(expected_result)
+    except (ValueError, SyntaxError):
+        return None
+    if not isinstance(expected_row, tuple):
+        expected_row = (expected_row,)
+    if not len(result):
+        return False
+    row = tuple(result[0])
+    narrow, wide = (row, expected_row) if len(row) < len(expected_row) else (expected_row, row)
+    return all(any(values_match(value, other) for other in wide) for value in narrow)
+
+
+def extract_sql(text: str) -> str:
+    """Returns the contents of the first triple-backtick block, or an empty string."""
+    match = re.search(r"```(?:sql)?\s*(.*?)```", text, re.DOTALL | re.IGNORECASE)
+    return match.group(1).strip() if match else ""
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = (len(ordered) - 1) * q
+    lower, upper = math.floor(index), math.ceil(index)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (index - lower)
+
+
+class BatchEvaluator:
+    """
+    Answers the evaluation questions concurrently and scores the answers.
+
+    Works with any answerer exposing `acall` (LangchainNaiveAnswerer) or
+    `aget_response` (OpenaiAnswerer).
+    """
+
+    def __init__(self, answerer, connector: DatabaseConnector = None, max_concurrency: int = 4,
+                 requests_per_minute: float = 60, max_retries: int = 4, timeout: float = 120,
+                 base_delay: float = 1.0, judge: bool = True):
+        """
+        Initializes the evaluator.
+
+        Args:
+        answerer: The answerer under evaluation.
+        connector (DatabaseConnector): Used to execute generated SQL. Defaults to a new connector.
+        max_concurrency (int): Maximum number of questions in flight.
+        requests_per_minute (float): Maximum number of questions started per minute.
+        max_retries (int): Retries after rate limit, timeout or server errors.
+        timeout (float): Seconds allowed per attempt.
+        base_delay (float): First backoff delay in seconds, doubled on every retry.
+        judge (bool): Score answers that failed the execution check with the mlflow LLM judges.
+        """
+        self.answerer = answerer
+        self.connector = connector or DatabaseConnector()
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = RateLimiter(requests_per_minute, burst=max_concurrency)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.base_delay = base_delay
+        self.judge = judge
+        if add_token_usage_to_question not in tracer.exporters:
+            tracer.exporters.append(add_token_usage_to_question)
+
+    async def _answer(self, question: str) -> tuple:
+        if hasattr(self.answerer, "acall"):
+            sql_block, _, answer = await self.answerer.acall(question, bypass_cache=True)
+            return extract_sql(sql_block), answer
+        response = await self.answerer.aget_response(question, [], timeout=self.timeout)
+        answer = self.answerer.get_text_content_response(response)
+        return extract_sql(answer), answer
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        response = getattr(error, "response", None)
+        retry_after = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.base_delay * 2 ** attempt * (1 + random.random() * 0.25)
+
+    async def _evaluate_one(self, item: tuple) -> EvaluationRecord:
+        dataset, row = item
+        record = EvaluationRecord(dataset=dataset, question=row["question"],
+                                  expected_answer=row.get("answer_detailed", ""),
+                                  expected_result=row.get("sql_detailed_answer", ""))
+        with span("eval.question", dataset=dataset) as question_span:
+            for attempt in range(self.max_retries + 1):
+                await self.rate_limiter.acquire()
+                record.attempts = attempt + 1
+                started = time.perf_counter()
+                try:
+                    record.generated_sql, record.answer = await asyncio.wait_for(
+                        self._answer(record.question), self.timeout)
+                except Exception as e:
+                    if type(e).__name__ in RETRYABLE_ERRORS and attempt < self.max_retries:
+                        await asyncio.sleep(self._retry_delay(e, attempt))
+                        continue
+                    record.error = f"{type(e).__name__}: {e}"
+                record.latency = time.perf_counter() - started
+                break
+        record.prompt_tokens = question_span.attributes.get("prompt_tokens", 0)
+        record.completion_tokens = question_span.attributes.get("completion_tokens", 0)
+        if record.expected_result and record.generated_sql:
+            record.execution_match = await run_in_sql_executor(
+                self._check_execution, record.generated_sql, record.expected_result)
+        elif record.expected_result:
+            record.execution_match = False
+        return record
+
+    def _check_execution(self, sql: str, expected_result: str):
+        try:
+            result = self.connector.execute_sql(sql)
+        except Exception:
+            return False
+        return execution_match(result, expected_result)
+
+    async def aevaluate(self, datasets: list = ("evaluation", "unanswerable")) -> list:
+        """
+        Answers every question of the given datasets concurrently.
+
+        Args:
+        datasets (list): Names of datasets in DATASETS.
+
+        Returns:
+        list: One EvaluationRecord per question.
+        """
+        items = [(name, row) for name in datasets for row in load_dataset(name)]
+        return await gather_bounded(self._evaluate_one, items, max_concurrency=self.max_concurrency,
+                                    return_exceptions=False)
+
+    def evaluate(self, datasets: list = ("evaluation", "unanswerable")) -> list:
+        """Synchronous wrapper around `aevaluate`."""
+        return asyncio.run(self.aevaluate(datasets))
+
+    @staticmethod
+    def summarize(records: list) -> dict:
+        """
+        Aggregates execution accuracy, latency percentiles and token counts.
+
+        Args:
+        records (list): EvaluationRecords.
+
+        Returns:
+        dict: Metric names to values.
+        """
+        checked = [r.execution_match for r in records if r.execution_match is not None]
+        latencies = [r.latency for r in records]
+        return {
+            "questions": len(records),
+            "errors": sum(bool(r.error) for r in records),
+            "execution_accuracy": sum(checked) / len(checked) if checked else 0.0,
+            "latency_mean": sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_p50": percentile(latencies, 0.5),
+            "latency_p90": percentile(latencies, 0.9),
+            "latency_p99": percentile(latencies, 0.99),
+            "prompt_tokens": sum(r.prompt_tokens for r in records),
+            "completion_tokens": sum(r.completion_tokens for r in records),
+        }
+
+    @staticmethod
+    def needs_judge(record: EvaluationRecord) -> bool:
+        """Answers whose SQL result matched the reference are considered correct without a judge."""
+        return not record.error and record.execution_match is not True
+
+    def log_to_mlflow(self, records: list, experiment_name: str = "Batch Evaluation", run_name: str = None) -> dict:
+        """
+        Logs per-question results and aggregates to mlflow, running the LLM judges where needed.
+
+        Args:
+        records (list): EvaluationRecords.
+        experiment_name (str): The mlflow experiment.
+        run_name (str): The mlflow run name.
+
+        Returns:
+        dict: The logged aggregate metrics, including the judges' if they ran.
+        """
+        import mlflow
+        import pandas as pd
+
+        mlflow.set_experiment(experiment_name)
+        metrics = self.summarize(records)
+        table = pd.DataFrame([asdict(r) for r in records])
+        with mlflow.start_run(run_name=run_name):
+            mlflow.log_params({
+                "answerer": type(self.answerer).__name__,
+                "model": getattr(getattr(self.answerer, "llm", None), "model_name",
+                                 getattr(self.answerer, "model", "")),
+                "max_concurrency": self.max_concurrency,
+            })
+            for step, record in enumerate(records):
+                mlflow.log_metrics({"question_latency": record.latency,
+                                    "question_tokens": record.prompt_tokens + record.completion_tokens,
+                                    "question_execution_match": float(bool(record.execution_match))},
+                                   step=step)
+            mlflow.log_metrics(metrics)
+            log_stage_stats_to_mlflow()
+            mlflow.log_table(data=table, artifact_file="batch_answers.json")
+            to_judge = table[[self.needs_judge(r) for r in records]]
+            if self.judge and not to_judge.empty:
+                from sql_table_qa.evaluators.llm_evaluators import (
+                    openai_correctness_evaluator, openai_relevance_evaluator)
+                results = mlflow.evaluate(
+                    data=to_judge[["question", "expected_answer", "answer"]],
+                    targets="expected_answer",
+                    predictions="answer",
+                    evaluators=None,
+                    extra_metrics=[openai_correctness_evaluator, openai_relevance_evaluator],
+                    evaluator_config={'col_mapping': {"inputs": "question"}}
+                )
+                metrics.update({f"judged_{name}": value for name, value in results.metrics.items()})
+                metrics["judged_questions"] = len(to_judge)
+        return metrics
+
+
+def build_answerer(name: str, fake_llm: bool = False, latency: float = 0.0):
+    """Creates the answerer to evaluate, optionally backed by the offline fake LLM."""
+    if name == "openai":
+        if fake_llm:
+            raise ValueError("The fake LLM only backs the langchain answerer.")
+        from sql_table_qa.answerers.openai_answerer.openai_answerer import OpenaiAnswerer
+        return OpenaiAnswerer()
+    from sql_table_qa.answerers.langchain_answerer.langchain_naive_answerer import LangchainNaiveAnswerer
+    if fake_llm:
+        from sql_table_qa.evaluators.fake_llm import FakeSQLChatModel
+        return LangchainNaiveAnswerer(llm=FakeSQLChatModel.from_dataset(latency=latency), use_question_cache=False)
+    return LangchainNaiveAnswerer()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--answerer", choices=["langchain", "openai"], default="langchain")
+    parser.add_argument("--datasets", nargs="+", choices=list(DATASETS), default=list(DATASETS))
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests-per-minute", type=float, default=60)
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--fake-llm", action="store_true", help="Answer with the offline fake LLM.")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="Seconds per fake LLM call.")
+    parser.add_argument("--no-judge", action="store_true", help="Skip the LLM judges.")
+    parser.add_argument("--no-mlflow", action="store_true", help="Print results instead of logging them.")
+    parser.add_argument("--experiment", default="Batch Evaluation")
+    parser.add_argument("--run-name", default=None)
+    args = parser.parse_args()
+
+    evaluator = BatchEvaluator(
+        build_answerer(args.answerer, args.fake_llm, args.fake_latency),
+        max_concurrency=args.concurrency, requests_per_minute=args.requests_per_minute,
+        max_retries=args.retries, timeout=args.timeout, judge=not (args.no_judge or args.fake_llm))
+    records = evaluator.evaluate(args.datasets)
+    if args.no_mlflow:
+        for record in records:
+            print(f"{record.dataset:12} match={record.execution_match!s:5} {record.latency:6.2f}s "
+                  f"{record.question} -> {record.answer} {record.error}")
+        metrics = evaluator.summarize(records)
+    else:
+        metrics = evaluator.log_to_mlflow(records, args.experiment, args.run_name)
+    for name, value in metrics.items():
+        print(f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
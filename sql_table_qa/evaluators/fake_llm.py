@@ -0,0 +1,126 @@
+"""A deterministic, offline stand-in for the OpenAI chat model.
+
+It recognises the questions of the evaluation dataset and writes their reference SQL,
+and writes answers by quoting the first row of the SQL result. This lets the
+answer pipeline, the batch evaluator and the benchmarks run without network access."""
+import asyncio
+import csv
+import os
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from CONSTANTS import ROOT_DIR
+from sql_table_qa.answerers.question_cache import normalize_question
+
+
+UNKNOWN_SQL = "SELECT 'unanswerable' AS answer"
+UNKNOWN_ANSWER = "I'm sorry, I cannot answer that question from the Chinook database."
+
+
+def load_reference_sql(dataset_path: str = None) -> dict:
+    """Maps the normalized questions of an evaluation dataset to their reference SQL."""
+    dataset_path = dataset_path or os.path.join(ROOT_DIR, "data", "evaluation_dataset.csv")
+    with open(dataset_path, newline="") as f:
+        return {normalize_question(row["question"]): row["sql_query"] for row in csv.DictReader(f)}
+
+
+def count_tokens_roughly(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeSQLChatModel(BaseChatModel):
+    """
+    A chat model that answers from a question -> SQL lookup table instead of calling an API.
+
+    Prompts ending in "Answer:" are treated as answer-writing prompts, anything else
+    as query-writing prompts. Unknown questions get a query that selects a marker value.
+    """
+
+    model_name: str = "fake-sql-llm"
+    reference_sql: dict = {}
+    latency: float = 0.0
+
+    @classmethod
+    def from_dataset(cls, dataset_path: str = None, **kwargs) -> "FakeSQLChatModel":
+        """
+        Creates a fake model that knows the reference SQL of an evaluation dataset.
+
+        Args:
+        dataset_path (str): CSV with `question` and `sql_query` columns.
+            Defaults to data/evaluation_dataset.csv.
+        **kwargs: Other fields, e.g. `latency` in seconds to simulate per call.
+
+        Returns:
+        FakeSQLChatModel: The fake model.
+        """
+        return cls(reference_sql=load_reference_sql(dataset_path), **kwargs)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-sql-llm"
+
+    def respond(self, prompt: str) -> str:
+        """Returns the text the fake model writes for a prompt."""
+        questions = re.findall(r"Question:\s*(.*)", prompt)
+        question = questions[-1].strip() if questions else ""
+        if prompt.rstrip().endswith("Answer:"):
+            return self._write_answer(prompt)
+        return self.reference_sql.get(normalize_question(question), UNKNOWN_SQL)
+
+    @staticmethod
+    def _write_answer(prompt: str) -> str:
+        match = re.search(r"SQL Result:\s*(.*?)\s*Answer:\s*$", prompt, re.DOTALL)
+        result = match.group(1) if match else ""
+        lines = [line for line in result.splitlines() if line.strip()]
+        if len(lines) < 2 or "unanswerable" in result:
+            return UNKNOWN_ANSWER
+        return f"The answer is {lines[1].strip()}."
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        text = self.respond(prompt)
+        usage = {"prompt_tokens": count_tokens_roughly(prompt), "completion_tokens": count_tokens_roughly(text)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        message = AIMessage(content=text, response_metadata={"token_usage": usage, "model_name": self.model_name})
+        return ChatResult(generations=[ChatGeneration(message=message)],
+                          llm_output={"token_usage": usage, "model_name": self.model_name})
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+    def _chunks(self, messages: List[BaseMessage]) -> list:
+        """The response split into word-sized chunks, as a streaming API would send it."""
+        text = self.respond("\n".join(str(message.content) for message in messages))
+        return [ChatGenerationChunk(message=AIMessageChunk(content=piece)) for piece in re.findall(r"\s*\S+", text)]
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        if self.latency:
+            time.sleep(self.latency)
+        for chunk in self._chunks(messages):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for chunk in self._chunks(messages):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
@@ -0,0 +1,152 @@
+"""Process-wide registry of the expensive objects behind the app: config, API clients,
+connectors and answerers.
+
+Each resource is built on first request and then shared for the life of the process.
+Streamlit re-executes app/app.py on every interaction, but imported modules, and so
+this registry, survive reruns: a rerun only looks resources up instead of re-reading
+configs/local.env, creating new OpenAI clients and rebuilding the LangChain chains.
+The modules behind each resource are imported when it is first built, not when this
+module is imported.
+"""
+import os
+import threading
+import time
+
+from CONSTANTS import DATABASE_PATH, ROOT_DIR
+
+
+CONFIG_PATH = os.path.join(ROOT_DIR, "configs", "local.env")
+
+_resources = {}
+_resources_lock = threading.Lock()
+# One lock per key, so that building one resource can request another
+_key_locks = {}
+_build_seconds = {}
+_lookups = {}
+
+
+def get_resource(key, factory, *args, **kwargs):
+    """
+    Returns the resource registered under `key`, building it with `factory(*args, **kwargs)` the first time.
+
+    Concurrent first requests for the same key wait for a single build.
+
+    Args:
+    key: A hashable name, e.g. ("connector", database_path).
+    factory (callable): Builds the resource.
+    *args, **kwargs: Arguments for the factory.
+
+    Returns:
+    The shared resource.
+    """
+    with _resources_lock:
+        _lookups[key] = _lookups.get(key, 0) + 1
+        if key in _resources:
+            return _resources[key]
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        with _resources_lock:
+            if key in _resources:
+                return _resources[key]
+        started = time.perf_counter()
+        resource = factory(*args, **kwargs)
+        with _resources_lock:
+            _resources[key] = resource
+            _build_seconds[key] = time.perf_counter() - started
+        return resource
+
+
+def resource_stats() -> dict:
+    """
+    Returns how long each resource took to build and how often it was requested.
+
+    Returns:
+    dict: {key as str: {"build_seconds", "lookups"}}.
+    """
+    with _resources_lock:
+        return {str(key): {"build_seconds": _build_seconds.get(key, 0.0), "lookups": _lookups.get(key, 0)}
+                for key in _resources}
+
+
+def clear_resources():
+    """Forgets every resource, so the next request builds it again. Resources are not closed."""
+    with _resources_lock:
+        _resources.clear()
+        _build_seconds.clear()
+        _lookups.clear()
+
+
+def _read_config(path: str) -> dict:
+    from dotenv import dotenv_values
+
+    config = {**dotenv_values(path)}
+    # The OpenAI and LangChain clients read the key from the environment
+    if config.get("OPENAI_API_KEY"):
+        os.environ["OPENAI_API_KEY"] = config["OPENAI_API_KEY"]
+    return config
+
+
+def get_config(path: str = CONFIG_PATH) -> dict:
+    """
+    Returns the values of configs/local.env, read once. OPENAI_API_KEY is also exported to the environment.
+
+    Args:
+    path (str): The env file.
+
+    Returns:
+    dict: The config values. Empty if the file does not exist.
+    """
+    return get_resource(("config", path), _read_config, path)
+
+
+def get_openai_client():
+    """The shared synchronous OpenAI client."""
+    get_config()
+    from openai import OpenAI
+    return get_resource("openai_client", OpenAI)
+
+
+def get_async_openai_client():
+    """The shared asynchronous OpenAI client."""
+    get_config()
+    from openai import AsyncOpenAI
+    return get_resource("async_openai_client", AsyncOpenAI)
+
+
+def _build_connector(database_path: str):
+    from sql_table_qa.dbutils.database_connector import DatabaseConnector
+    return DatabaseConnector(database_path)
+
+
+def get_connector(database_path: str = DATABASE_PATH):
+    """
+    Returns the shared DatabaseConnector of a database.
+
+    Args:
+    database_path (str): Path to the SQLite database file.
+
+    Returns:
+    DatabaseConnector: The connector.
+    """
+    return get_resource(("connector", database_path), _build_connector, database_path)
+
+
+def _build_sql_answerer():
+    from sql_table_qa.answerers.langchain_answerer.langchain_naive_answerer import LangchainNaiveAnswerer
+    return LangchainNaiveAnswerer()
+
+
+def get_sql_answerer():
+    """The shared LangchainNaiveAnswerer, which writes and runs SQL for a question."""
+    return get_resource("sql_answerer", _build_sql_answerer)
+
+
+def _build_general_answerer():
+    from sql_table_qa.answerers.openai_answerer.openai_answerer import OpenaiAnswerer
+    return OpenaiAnswerer(client=get_openai_client(), async_client=get_async_openai_client())
+
+
+def get_general_answerer():
+    """The shared OpenaiAnswerer, which chats about the database and suggests SQL."""
+    return get_resource("general_answerer", _build_general_answerer)
+
@@ -0,0 +1,86 @@
+"""Admission control for the HTTP service: bounded concurrency with a bounded, timed queue.
+
+A request runs right away if fewer than `max_concurrency` requests are running. Otherwise
+it waits in line, unless `max_queue` requests are already waiting, in which case it is
+rejected at once. A request that waits longer than `queue_timeout` is rejected too.
+Rejecting early keeps latency bounded under overload instead of letting every request
+slow down, and tells the load balancer to retry elsewhere.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from sql_table_qa.tracing import record
+
+
+class OverloadedError(RuntimeError):
+    """Raised when a request cannot be admitted. `retry_after` is a suggested wait in seconds."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Limits the requests one worker process runs at once. Use from a single event loop."""
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        """
+        Initializes the controller.
+
+        Args:
+        max_concurrency (int): Requests running at once.
+        max_queue (int): Requests waiting for a slot. Further requests are rejected.
+        queue_timeout (float): Seconds a request may wait for a slot.
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def acquire(self):
+        """
+        Waits for a slot.
+
+        Raises:
+        OverloadedError: If the queue is full or the wait timed out.
+        """
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise OverloadedError(f"Too many requests waiting ({self.waiting}).")
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise OverloadedError(f"No capacity within {self.queue_timeout:g}s.") from None
+        finally:
+            self.waiting -= 1
+        record("service.queue_wait", time.perf_counter() - started)
+        self.running += 1
+        self.admitted += 1
+
+    def release(self):
+        """Frees the slot taken by `acquire`."""
+        self.running -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds a slot for the duration of the block."""
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {"max_concurrency": self.max_concurrency, "max_queue": self.max_queue,
+                "running": self.running, "waiting": self.waiting, "admitted": self.admitted,
+                "rejected": self.rejected, "timed_out": self.timed_out}
@@ -0,0 +1,303 @@
+"""HTTP API for answering questions, running SQL and reading the schema of the Chinook database.
+
+Endpoints:
+    POST /v1/answer          {"question": str, "bypass_cache": bool, "stream": bool}
+    POST /v1/sql             {"sql": str, "page": int, "page_size": int}
+    GET  /v1/schema          table names and descriptions
+    GET  /v1/schema/{table}  columns, keys, indexes and row count of a table
+    GET  /health, /stats, /metrics
+
+With "stream": true, /v1/answer returns server-sent events as the answer is written:
+sql_token, sql, result, answer_token and answer, then done (or error).
+
+Each worker process admits at most SERVICE_MAX_CONCURRENCY requests at once and queues
+up to SERVICE_MAX_QUEUE more. Requests beyond that, or waiting longer than
+SERVICE_QUEUE_TIMEOUT, get a 503 with Retry-After, as do requests that find every database
+connection busy. Admitted requests that take longer than SERVICE_REQUEST_TIMEOUT get a 504.
+The LLM is reached through the OpenAI client, so OPENAI_BASE_URL can point it at a gateway
+or at sql_table_qa.service.fake_openai_server.
+
+Usage:
+    python -m sql_table_qa.service.api --port 8000 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sqlite3
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from CONSTANTS import (
+    SERVICE_MAX_CONCURRENCY, SERVICE_MAX_QUEUE, SERVICE_QUEUE_TIMEOUT, SERVICE_REQUEST_TIMEOUT)
+from sql_table_qa.answerers.concurrency import run_in_sql_executor
+from sql_table_qa.dbutils.connection_pool import PoolTimeoutError
+from sql_table_qa.dbutils.cost_guard import QueryTooExpensiveError
+from sql_table_qa.dbutils.query_result import QueryResult
+from sql_table_qa.dbutils.sql_analysis import InvalidSQLError
+from sql_table_qa.resources import get_connector, get_sql_answerer
+from sql_table_qa.service.admission import AdmissionController, OverloadedError
+from sql_table_qa.tracing import span, tracer
+
+
+class AnswerRequest(BaseModel):
+    question: str = Field(min_length=1, max_length=4000)
+    bypass_cache: bool = False
+    stream: bool = False
+
+
+class SQLRequest(BaseModel):
+    sql: str = Field(min_length=1, max_length=100_000)
+    page: Optional[int] = Field(default=None, ge=0, description="Return only this page of the result.")
+    page_size: int = Field(default=50, ge=1, le=1000)
+
+
+def _json_value(value):
+    if isinstance(value, bytes):
+        return value.hex()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def result_payload(result) -> dict:
+    """
+    Converts a query result to JSON-ready data.
+
+    Args:
+    result: A QueryResult, a pandas DataFrame, or the error message of a failed query.
+
+    Returns:
+    dict: {"columns", "rows", "row_count", "truncated"}, or {"error"} for an error message.
+    """
+    if isinstance(result, str):
+        return {"error": result}
+    if isinstance(result, QueryResult):
+        columns, rows, truncated = result.columns, result.rows, result.truncated
+    else:
+        columns, truncated = [str(column) for column in result.columns], False
+        rows = result.astype(object).where(result.notna(), None).itertuples(index=False, name=None)
+    rows = [[_json_value(value) for value in row] for row in rows]
+    return {"columns": columns, "rows": rows, "row_count": len(rows), "truncated": truncated}
+
+
+def _event_payload(kind: str, content) -> dict:
+    if kind == "result":
+        return result_payload(content)
+    return {"text": content}
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class _AdmittedStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse that frees its admission slot however it ends. Neither the body
+    generator nor a background task runs if the client disconnects before the body starts.
+    """
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+def create_app(max_concurrency: int = SERVICE_MAX_CONCURRENCY, max_queue: int = SERVICE_MAX_QUEUE,
+               queue_timeout: float = SERVICE_QUEUE_TIMEOUT,
+               request_timeout: float = SERVICE_REQUEST_TIMEOUT) -> FastAPI:
+    """
+    Builds the ASGI app of one worker process.
+
+    Args:
+    max_concurrency (int): Requests handled at once.
+    max_queue (int): Requests waiting for a slot before new ones are rejected.
+    queue_timeout (float): Seconds a request may wait for a slot.
+    request_timeout (float): Seconds an admitted request may take, streaming included.
+
+    Returns:
+    FastAPI: The app.
+    """
+    admission = AdmissionController(max_concurrency, max_queue, queue_timeout)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Opens the pool and reads the schema before the first request arrives
+        await run_in_sql_executor(lambda: get_connector().database_schema)
+        yield
+
+    app = FastAPI(title="SQL Table QA", lifespan=lifespan)
+    app.state.admission = admission
+
+    @app.exception_handler(OverloadedError)
+    async def overloaded(request, error: OverloadedError):
+        return JSONResponse({"error": "overloaded", "message": str(error)}, status_code=503,
+                            headers={"Retry-After": f"{math.ceil(error.retry_after)}"})
+
+    @app.exception_handler(PoolTimeoutError)
+    async def pool_exhausted(request, error: PoolTimeoutError):
+        return JSONResponse({"error": "overloaded", "message": str(error)}, status_code=503,
+                            headers={"Retry-After": "1"})
+
+    @app.exception_handler(TimeoutError)
+    async def timed_out(request, error: TimeoutError):
+        return JSONResponse({"error": "timeout", "message": f"No response within {request_timeout:g}s."},
+                            status_code=504)
+
+    @app.exception_handler(QueryTooExpensiveError)
+    async def too_expensive(request, error: QueryTooExpensiveError):
+        return JSONResponse(error.to_dict(), status_code=422)
+
+    @app.exception_handler(InvalidSQLError)
+    @app.exception_handler(sqlite3.Error)
+    async def bad_sql(request, error: Exception):
+        return JSONResponse({"error": "invalid_sql", "message": str(error)}, status_code=400)
+
+    async def admitted(coroutine_factory):
+        async with admission.slot():
+            return await asyncio.wait_for(coroutine_factory(), request_timeout)
+
+    async def collect_answer(request: AnswerRequest) -> dict:
+        with span("service.answer"):
+            answerer = await run_in_sql_executor(get_sql_answerer)
+            response = {"question": request.question}
+            async for event in answerer.astream(request.question, bypass_cache=request.bypass_cache):
+                if event.kind == "sql":
+                    response["sql"] = event.content
+                elif event.kind == "result":
+                    response["result"] = result_payload(event.content)
+                elif event.kind == "answer":
+                    response["answer"] = event.content
+            return response
+
+    async def stream_answer(request: AnswerRequest) -> StreamingResponse:
+        # Admitted before the response starts, so that overload is still reported as a 503
+        await admission.acquire()
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                admission.release()
+
+        async def events():
+            try:
+                answerer = await run_in_sql_executor(get_sql_answerer)
+                async with asyncio.timeout(request_timeout):
+                    async for event in answerer.astream(request.question, bypass_cache=request.bypass_cache):
+                        if event.kind.endswith("_token") and not event.content:
+                            continue
+                        yield _sse(event.kind, _event_payload(event.kind, event.content))
+                yield _sse("done", {})
+            except PoolTimeoutError as e:
+                yield _sse("error", {"error": "overloaded", "message": str(e)})
+            except TimeoutError:
+                yield _sse("error", {"error": "timeout", "message": f"No response within {request_timeout:g}s."})
+            except Exception as e:
+                yield _sse("error", {"error": type(e).__name__, "message": str(e)})
+            finally:
+                release()
+
+        return _AdmittedStreamingResponse(events(), release, media_type="text/event-stream",
+                                          headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.post("/v1/answer")
+    async def answer(request: AnswerRequest):
+        """Writes and runs SQL for a question and answers it from the result."""
+        if request.stream:
+            return await stream_answer(request)
+        return await admitted(lambda: collect_answer(request))
+
+    @app.post("/v1/sql")
+    async def execute_sql(request: SQLRequest):
+        """Runs a read-only SQL query, or one page of it."""
+        connector = get_connector()
+
+        async def run():
+            with span("service.sql"):
+                if request.page is None:
+                    return result_payload(await run_in_sql_executor(connector.execute_sql, request.sql))
+                page = await run_in_sql_executor(connector.execute_sql_page, request.sql,
+                                                 page=request.page, page_size=request.page_size)
+                return {**result_payload(page.to_result()), "page": page.page, "page_size": page.page_size,
+                        "has_more": page.has_more}
+        return await admitted(run)
+
+    @app.get("/v1/schema")
+    async def schema():
+        """Lists the tables with their descriptions."""
+        tables = await run_in_sql_executor(get_connector().get_table_names_and_description)
+        return {"tables": [{"name": name, "desc": desc} for name, desc in tables]}
+
+    @app.get("/v1/schema/{table}")
+    async def table_schema(table: str):
+        """Returns the columns, keys, indexes and row count of a table."""
+        connector = get_connector()
+        tables = await run_in_sql_executor(lambda: connector.database_schema)
+        if table not in tables:
+            raise HTTPException(status_code=404, detail=f"No schema found for table: {table}")
+        return {"name": table, **tables[table]}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "pid": os.getpid()}
+
+    @app.get("/stats")
+    async def stats():
+        connector = get_connector()
+        return {"pid": os.getpid(), "admission": admission.stats(), "pool": connector.get_pool_stats(),
+                "cache": connector.get_cache_stats(), "stages": tracer.stage_stats()}
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        return tracer.prometheus_text()
+
+    return app
+
+
+app = create_app()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes.")
+    parser.add_argument("--max-concurrency", type=int, default=SERVICE_MAX_CONCURRENCY,
+                        help="Requests handled at once per worker.")
+    parser.add_argument("--max-queue", type=int, default=SERVICE_MAX_QUEUE, help="Requests waiting per worker.")
+    parser.add_argument("--queue-timeout", type=float, default=SERVICE_QUEUE_TIMEOUT)
+    parser.add_argument("--request-timeout", type=float, default=SERVICE_REQUEST_TIMEOUT)
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    if args.workers == 1:
+        uvicorn.run(create_app(args.max_concurrency, args.max_queue, args.queue_timeout, args.request_timeout),
+                    host=args.host, port=args.port, log_level=args.log_level)
+        return
+    # Worker processes import this module afresh and read their limits from the environment
+    os.environ.update({
+        "SQL_TABLE_QA_SERVICE_MAX_CONCURRENCY": str(args.max_concurrency),
+        "SQL_TABLE_QA_SERVICE_MAX_QUEUE": str(args.max_queue),
+        "SQL_TABLE_QA_SERVICE_QUEUE_TIMEOUT": str(args.queue_timeout),
+        "SQL_TABLE_QA_SERVICE_REQUEST_TIMEOUT": str(args.request_timeout),
+    })
+    uvicorn.run("sql_table_qa.service.api:app", host=args.host, port=args.port, workers=args.workers,
+                log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""An OpenAI-compatible chat completions server backed by the fake SQL chat model.
+
+It answers POST /v1/chat/completions, streaming or not, with the text FakeSQLChatModel
+writes for the prompt, after a configurable delay and at a configurable token rate.
+Point the OpenAI client at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 to run the
+HTTP service and its load test without network access or API cost.
+
+Usage:
+    python -m sql_table_qa.service.fake_openai_server --port 8100 --latency 0.3 --tokens-per-second 50
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from sql_table_qa.evaluators.fake_llm import FakeSQLChatModel, count_tokens_roughly
+
+
+def _message_text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        # Content parts, as sent for multimodal messages
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content)
+
+
+def create_app(latency: float = 0.0, tokens_per_second: float = 0.0, dataset_path: str = None) -> FastAPI:
+    """
+    Builds the fake server.
+
+    Args:
+    latency (float): Seconds before the first token of every response.
+    tokens_per_second (float): Rate at which streamed tokens are sent, 0 for no delay.
+        Non-streaming responses wait as long as streaming them would take.
+    dataset_path (str): Evaluation dataset the fake model takes its SQL from.
+
+    Returns:
+    FastAPI: The app.
+    """
+    model = FakeSQLChatModel.from_dataset(dataset_path)
+    token_delay = 1 / tokens_per_second if tokens_per_second > 0 else 0.0
+    app = FastAPI(title="Fake OpenAI")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = "\n".join(_message_text(message) for message in body.get("messages", []))
+        text = model.respond(prompt)
+        pieces = re.findall(r"\s*\S+", text)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        name = body.get("model", model.model_name)
+        await asyncio.sleep(latency)
+
+        if not body.get("stream"):
+            await asyncio.sleep(token_delay * len(pieces))
+            usage = {"prompt_tokens": count_tokens_roughly(prompt), "completion_tokens": count_tokens_roughly(text)}
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            return {"id": completion_id, "object": "chat.completion", "created": created, "model": name,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": text}}],
+                    "usage": usage}
+
+        def chunk(delta: dict, finish_reason: str = None) -> str:
+            data = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": name,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(data)}\n\n"
+
+        async def chunks():
+            yield chunk({"role": "assistant", "content": ""})
+            for piece in pieces:
+                if token_delay:
+                    await asyncio.sleep(token_delay)
+                yield chunk({"content": piece})
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before the first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="0 sends all tokens at once.")
+    parser.add_argument("--dataset", help="Evaluation dataset CSV. Defaults to data/evaluation_dataset.csv.")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run(create_app(args.latency, args.tokens_per_second, args.dataset), host=args.host, port=args.port,
+                log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
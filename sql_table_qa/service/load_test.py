@@ -0,0 +1,256 @@
+"""Load test of the HTTP service: throughput and tail latency per worker count.
+
+For every worker count, the service is started with that many worker processes, its LLM
+calls going to a local fake OpenAI server (sql_table_qa.service.fake_openai_server), and
+`--concurrency` virtual users send requests back to back for `--duration` seconds. Reported
+per run: requests per second, p50/p95/p99 latency of successful requests, and the counts of
+503 (rejected by admission control), 504 (timed out) and other failures. With `--stream`,
+the time to the first answer token is reported too.
+
+Questions and SQL come from the evaluation dataset. The answerer caches answers per
+question, so pass `--bypass-cache` to have every request call the (fake) LLM.
+
+The virtual users run in this one process, so at a few thousand requests per second the
+client itself becomes the bottleneck. Pass `--url` to test a service that is already running.
+
+Usage:
+    python -m sql_table_qa.service.load_test --workers 1 2 4 --concurrency 32 --duration 20
+    python -m sql_table_qa.service.load_test --endpoint answer --stream --bypass-cache --llm-latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+
+import httpx
+
+from CONSTANTS import ROOT_DIR
+from sql_table_qa.evaluators.batch_evaluator import load_dataset, percentile
+
+
+ENDPOINTS = ("answer", "sql", "mixed")
+
+
+@dataclass
+class Sample:
+    status: str
+    seconds: float
+    first_token: float = None
+
+
+@dataclass
+class LoadTestResult:
+    workers: int
+    concurrency: int
+    endpoint: str
+    seconds: float
+    requests: int
+    ok: int
+    rejected: int
+    timed_out: int
+    failed: int
+    rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    first_token_p50_ms: float = None
+    first_token_p95_ms: float = None
+
+    @classmethod
+    def from_samples(cls, samples: list, seconds: float, **fields) -> "LoadTestResult":
+        latencies = [sample.seconds for sample in samples if sample.status == "200"]
+        first_tokens = [sample.first_token for sample in samples if sample.first_token is not None]
+        statuses = [sample.status for sample in samples]
+        ms = lambda values, q: round(percentile(values, q) * 1000, 1)  # noqa: E731
+        return cls(**fields, seconds=round(seconds, 2), requests=len(samples), ok=len(latencies),
+                   rejected=statuses.count("503"), timed_out=statuses.count("504"),
+                   failed=len(samples) - len(latencies) - statuses.count("503") - statuses.count("504"),
+                   rps=round(len(latencies) / seconds, 1) if seconds else 0.0,
+                   p50_ms=ms(latencies, 0.5), p95_ms=ms(latencies, 0.95), p99_ms=ms(latencies, 0.99),
+                   first_token_p50_ms=ms(first_tokens, 0.5) if first_tokens else None,
+                   first_token_p95_ms=ms(first_tokens, 0.95) if first_tokens else None)
+
+
+def build_requests(endpoint: str, stream: bool = False, bypass_cache: bool = False) -> list:
+    """
+    The requests the virtual users cycle through.
+
+    Args:
+    endpoint (str): "answer", "sql", or "mixed" for both, alternating.
+    stream (bool): Ask /v1/answer for server-sent events.
+    bypass_cache (bool): Ask /v1/answer not to use the answer cache.
+
+    Returns:
+    list: (path, JSON body) pairs.
+    """
+    rows = load_dataset("evaluation")
+    answers = [("/v1/answer", {"question": row["question"], "stream": stream, "bypass_cache": bypass_cache})
+               for row in rows]
+    queries = [("/v1/sql", {"sql": row["sql_query"]}) for row in rows]
+    if endpoint == "answer":
+        return answers
+    if endpoint == "sql":
+        return queries
+    return [request for pair in zip(answers, queries) for request in pair]
+
+
+async def _send(client: httpx.AsyncClient, path: str, body: dict) -> Sample:
+    started = time.perf_counter()
+    first_token = None
+    try:
+        if not body.get("stream"):
+            response = await client.post(path, json=body)
+            return Sample(str(response.status_code), time.perf_counter() - started)
+        status = None
+        async with client.stream("POST", path, json=body) as response:
+            status = str(response.status_code)
+            async for line in response.aiter_lines():
+                if line == "event: answer_token" and first_token is None:
+                    first_token = time.perf_counter() - started
+                elif line == "event: error":
+                    # The stream had started with a 200, the error arrives as an event
+                    status = "stream_error"
+        return Sample(status, time.perf_counter() - started, first_token)
+    except httpx.HTTPError as e:
+        return Sample(type(e).__name__, time.perf_counter() - started)
+
+
+async def drive(base_url: str, requests: list, concurrency: int, duration: float, timeout: float = 120) -> tuple:
+    """
+    Sends requests from `concurrency` virtual users, each waiting for its response before the next request.
+
+    Args:
+    base_url (str): URL of the service.
+    requests (list): (path, JSON body) pairs, cycled through.
+    concurrency (int): Virtual users.
+    duration (float): Seconds to keep sending. Requests in flight at the end are awaited.
+    timeout (float): Client timeout per request, in seconds.
+
+    Returns:
+    tuple: The samples, and the seconds the run took.
+    """
+    samples = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+
+        async def user(index: int):
+            while time.perf_counter() < deadline:
+                path, body = requests[index % len(requests)]
+                samples.append(await _send(client, path, body))
+                index += concurrency
+
+        await asyncio.gather(*(user(index) for index in range(concurrency)))
+        return samples, time.perf_counter() - started
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_healthy(url: str, process: subprocess.Popen, timeout: float = 60):
+    """Polls `url`/health until it answers. Raises RuntimeError if the process exits or the timeout passes."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with code {process.returncode}.")
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} was not healthy after {timeout:g}s.")
+
+
+@contextmanager
+def serve(module: str, port: int, *args, env: dict = None):
+    """Runs `python -m module --port port *args` until the block exits, and yields its URL once healthy."""
+    url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen([sys.executable, "-m", module, "--port", str(port), *map(str, args)],
+                               cwd=ROOT_DIR, env={**os.environ, **(env or {})})
+    try:
+        wait_until_healthy(url, process)
+        yield url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def run(url: str, requests: list, args, workers: int) -> LoadTestResult:
+    if args.warmup:
+        asyncio.run(drive(url, requests, args.concurrency, args.warmup))
+    samples, seconds = asyncio.run(drive(url, requests, args.concurrency, args.duration))
+    return LoadTestResult.from_samples(samples, seconds, workers=workers, concurrency=args.concurrency,
+                                       endpoint=args.endpoint)
+
+
+def format_result(result: LoadTestResult) -> str:
+    line = (f"{result.workers:>7} {result.requests:>8} {result.rps:>9.1f} {result.p50_ms:>9.1f} "
+            f"{result.p95_ms:>9.1f} {result.p99_ms:>9.1f} {result.rejected:>6} {result.timed_out:>6} "
+            f"{result.failed:>6}")
+    if result.first_token_p50_ms is not None:
+        line += f" {result.first_token_p50_ms:>11.1f} {result.first_token_p95_ms:>11.1f}"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to test.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Virtual users.")
+    parser.add_argument("--duration", type=float, default=15, help="Seconds per worker count.")
+    parser.add_argument("--warmup", type=float, default=2, help="Seconds of unmeasured requests first.")
+    parser.add_argument("--endpoint", choices=ENDPOINTS, default="mixed")
+    parser.add_argument("--stream", action="store_true", help="Request /v1/answer as server-sent events.")
+    parser.add_argument("--bypass-cache", action="store_true", help="Skip the answer cache of the service.")
+    parser.add_argument("--llm-latency", type=float, default=0.1, help="Seconds before the fake LLM's first token.")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200)
+    parser.add_argument("--max-concurrency", type=int, help="Requests handled at once per worker.")
+    parser.add_argument("--max-queue", type=int, help="Requests waiting per worker.")
+    parser.add_argument("--url", help="Test this running service instead of starting one.")
+    parser.add_argument("--output", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    requests = build_requests(args.endpoint, args.stream, args.bypass_cache)
+    results = []
+    header = f"{'workers':>7} {'requests':>8} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} " \
+             f"{'503':>6} {'504':>6} {'failed':>6}" + (f" {'1st tok p50':>11} {'1st tok p95':>11}" if args.stream else "")
+    print(f"{args.endpoint} requests, {args.concurrency} virtual users, {args.duration:g}s per run\n{header}")
+
+    if args.url:
+        results.append(run(args.url, requests, args, workers=0))
+        print(format_result(results[-1]))
+    else:
+        limits = []
+        if args.max_concurrency:
+            limits += ["--max-concurrency", args.max_concurrency]
+        if args.max_queue:
+            limits += ["--max-queue", args.max_queue]
+        with serve("sql_table_qa.service.fake_openai_server", free_port(), "--latency", args.llm_latency,
+                   "--tokens-per-second", args.llm_tokens_per_second) as llm_url:
+            env = {"OPENAI_BASE_URL": f"{llm_url}/v1", "OPENAI_API_KEY": "sk-fake"}
+            for workers in args.workers:
+                with serve("sql_table_qa.service.api", free_port(), "--workers", workers, *limits, env=env) as url:
+                    results.append(run(url, requests, args, workers))
+                print(format_result(results[-1]))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump([asdict(result) for result in results], f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
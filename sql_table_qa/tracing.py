@@ -0,0 +1,274 @@
+"""Lightweight tracing of where time goes when answering a question.
+
+Wrap a stage in `with span("stage.name") as s:` and attach counters with `s.set(rows=...)`.
+Every finished span is added to a per-stage latency reservoir, from which p50/p95/p99
+are computed, and passed to the registered exporters (a structured logger by default).
+Stage statistics can be logged to mlflow with `log_to_mlflow` or scraped in Prometheus
+text format from `start_metrics_server`.
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95, 0.99)
+_STAT_KEYS = {"count", "errors", "total", "mean", *(f"p{int(q * 100)}" for q in QUANTILES)}
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """A timed stage with attributes such as row counts, bytes or token usage."""
+
+    __slots__ = ("name", "parent", "attributes", "start", "duration", "error")
+
+    def __init__(self, name: str, parent: "Span" = None, attributes: dict = None):
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.start = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes):
+        """Sets attributes on the span."""
+        self.attributes.update(attributes)
+
+    def add(self, **counters):
+        """Adds to numeric attributes, e.g. token counts from several LLM calls."""
+        for key, value in counters.items():
+            self.attributes[key] = self.attributes.get(key, 0) + (value or 0)
+
+    def to_dict(self) -> dict:
+        return {"span": self.name, "parent": self.parent.name if self.parent else None,
+                "duration": self.duration, "error": self.error, **self.attributes}
+
+
+class _StageStats:
+    __slots__ = ("count", "total", "errors", "samples", "counters")
+
+    def __init__(self, reservoir_size: int):
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.samples = deque(maxlen=reservoir_size)
+        self.counters = defaultdict(float)
+
+
+def _quantile(ordered: list, q: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Tracer:
+    """Collects spans into per-stage statistics and forwards them to exporters."""
+
+    def __init__(self, reservoir_size: int = 5000):
+        """
+        Initializes an empty tracer.
+
+        Args:
+        reservoir_size (int): Number of most recent durations kept per stage for percentiles.
+        """
+        self.reservoir_size = reservoir_size
+        self.exporters = [log_exporter]
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Times a stage. Spans opened inside it record it as their parent.
+
+        Args:
+        name (str): Stage name, e.g. "sql.execute".
+        **attributes: Initial attributes of the span.
+
+        Yields:
+        Span: The span, to attach attributes to.
+        """
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            span.duration = time.perf_counter() - span.start
+            self.finish(span)
+
+    def record(self, name: str, duration: float, error: str = None, **attributes):
+        """
+        Records a stage timed outside of a `span` block, such as a stream consumed over several calls.
+
+        Args:
+        name (str): Stage name, e.g. "llm.chat.first_token".
+        duration (float): Seconds the stage took.
+        error (str): Name of the exception the stage failed with, if any.
+        **attributes: Attributes of the span.
+        """
+        span = Span(name, _current_span.get(), attributes)
+        span.duration = duration
+        span.error = error
+        self.finish(span)
+
+    def finish(self, span: Span):
+        """Records a finished span and passes it to the exporters."""
+        with self._lock:
+            stats = self._stages.get(span.name)
+            if stats is None:
+                stats = self._stages[span.name] = _StageStats(self.reservoir_size)
+            stats.count += 1
+            stats.total += span.duration
+            stats.errors += span.error is not None
+            stats.samples.append(span.duration)
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stats.counters[key] += value
+        for exporter in self.exporters:
+            try:
+                exporter(span)
+            except Exception:
+                logger.exception("Span exporter failed")
+
+    def stage_stats(self) -> dict:
+        """
+        Returns latency percentiles and summed counters per stage.
+
+        Returns:
+        dict: {stage: {"count", "errors", "mean", "p50", "p95", "p99", "total", **counters}}.
+        """
+        with self._lock:
+            stages = {name: (stats.count, stats.errors, stats.total, sorted(stats.samples), dict(stats.counters))
+                      for name, stats in self._stages.items()}
+        report = {}
+        for name, (count, errors, total, ordered, counters) in stages.items():
+            report[name] = {"count": count, "errors": errors, "total": total,
+                            "mean": total / count if count else 0.0,
+                            **{f"p{int(q * 100)}": _quantile(ordered, q) for q in QUANTILES},
+                            **counters}
+        return report
+
+    def reset(self):
+        """Forgets all recorded spans."""
+        with self._lock:
+            self._stages.clear()
+
+    def prometheus_text(self, prefix: str = "sql_table_qa") -> str:
+        """
+        Renders the stage statistics in the Prometheus text exposition format.
+
+        Returns:
+        str: One latency summary per stage plus one counter per numeric span attribute.
+        """
+        lines = [f"# HELP {prefix}_stage_seconds Latency of each answer pipeline stage.",
+                 f"# TYPE {prefix}_stage_seconds summary"]
+        counter_lines = []
+        for stage, stats in sorted(self.stage_stats().items()):
+            label = f'stage="{stage}"'
+            for q in QUANTILES:
+                lines.append(f'{prefix}_stage_seconds{{{label},quantile="{q}"}} {stats[f"p{int(q * 100)}"]}')
+            lines.append(f"{prefix}_stage_seconds_sum{{{label}}} {stats['total']}")
+            lines.append(f"{prefix}_stage_seconds_count{{{label}}} {stats['count']}")
+            counter_lines.append(f"{prefix}_stage_errors_total{{{label}}} {stats['errors']}")
+            for key, value in stats.items():
+                if key not in _STAT_KEYS:
+                    counter_lines.append(f'{prefix}_stage_{key}_total{{{label}}} {value}')
+        return "\n".join(lines + counter_lines) + "\n"
+
+
+def log_exporter(span: Span):
+    """Logs each finished span as one JSON line at DEBUG level."""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps(span.to_dict(), default=str))
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attributes):
+    """Opens a span on the process-wide tracer. See Tracer.span."""
+    return tracer.span(name, **attributes)
+
+
+def record(name: str, duration: float, error: str = None, **attributes):
+    """Records a stage timed outside of a `span` block on the process-wide tracer. See Tracer.record."""
+    tracer.record(name, duration, error, **attributes)
+
+
+def current_span() -> Span:
+    """Returns the innermost open span, or None."""
+    return _current_span.get()
+
+
+def log_to_mlflow(tracer: Tracer = tracer, prefix: str = "stage"):
+    """
+    Logs per-stage latency percentiles and counters to the active mlflow run.
+
+    Args:
+    tracer (Tracer): The tracer to report. Defaults to the process-wide tracer.
+    prefix (str): Prefix of the metric names.
+    """
+    import mlflow
+
+    metrics = {}
+    for stage, stats in tracer.stage_stats().items():
+        for key, value in stats.items():
+            metrics[f"{prefix}.{stage}.{key}"] = value
+    mlflow.log_metrics(metrics)
+
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = 9464, host: str = "127.0.0.1",
+                         tracer: Tracer = tracer) -> "ThreadingHTTPServer":
+    """
+    Serves `tracer.prometheus_text()` at /metrics from a daemon thread.
+    Calling it again returns the already running server.
+
+    Args:
+    port (int): Port to listen on.
+    host (str): Interface to bind. Local only by default, since the metrics name SQL stages
+        and errors; use "0.0.0.0" to let a scraper on another host reach it.
+    tracer (Tracer): The tracer to expose.
+
+    Returns:
+    ThreadingHTTPServer: The running server.
+    """
+    global _metrics_server
+    with _metrics_server_lock:
+        if _metrics_server is not None:
+            return _metrics_server
+        # Imported here, http.server being slow to import and rarely needed
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = tracer.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        _metrics_server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=_metrics_server.serve_forever, daemon=True, name="metrics").start()
+        return _metrics_server
@@ -0,0 +1,20 @@
+import shutil
+
+import pytest
+
+from CONSTANTS import DATABASE_PATH
+from sql_table_qa.dbutils.database_connector import DatabaseConnector
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    """A private copy of the Chinook database, safe to write to."""
+    path = tmp_path / "Chinook.db"
+    shutil.copyfile(DATABASE_PATH, path)
+    return str(path)
+
+
+@pytest.fixture
+def connector(database_path):
+    """A SQLite-only connector over the private copy, without rollups."""
+    return DatabaseConnector(database_path, engine="sqlite", use_rollups=False)
@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from sql_table_qa.dbutils.connection_pool import PoolTimeoutError
+from sql_table_qa.service import api
+
+
+class _Connector:
+    """Stands in for the shared connector, raising the error a test needs."""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+    def execute_sql(self, sql):
+        raise self.error
+
+
+class _SlowAnswerer:
+    async def astream(self, question, bypass_cache=False):
+        await asyncio.sleep(3600)
+        yield
+
+
+@pytest.fixture
+def client():
+    return TestClient(api.create_app(), raise_server_exceptions=False)
+
+
+def test_invalid_sql_is_a_bad_request(client):
+    response = client.post("/v1/sql", json={"sql": "DELETE FROM Track"})
+    assert response.status_code == 400
+    assert response.json()["error"] == "invalid_sql"
+
+
+def test_internal_value_errors_are_not_blamed_on_the_sql(client, monkeypatch):
+    monkeypatch.setattr(api, "get_connector", lambda: _Connector(ValueError("bad state")))
+    assert client.post("/v1/sql", json={"sql": "SELECT 1"}).status_code == 500
+
+
+def test_pool_exhaustion_is_an_overload(client, monkeypatch):
+    monkeypatch.setattr(api, "get_connector", lambda: _Connector(PoolTimeoutError("No connection within 1s.")))
+    response = client.post("/v1/sql", json={"sql": "SELECT 1"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_stream_slot_is_freed_when_the_client_leaves_before_the_body(monkeypatch):
+    monkeypatch.setattr(api, "get_sql_answerer", _SlowAnswerer)
+    app = api.create_app()
+    body = json.dumps({"question": "How many tracks are there?", "stream": True}).encode()
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            raise OSError("Connection reset by peer")
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+             "scheme": "http", "path": "/v1/answer", "raw_path": b"/v1/answer", "root_path": "",
+             "query_string": b"", "headers": [(b"content-type", b"application/json")],
+             "client": ("test", 1), "server": ("test", 80)}
+    with pytest.raises((OSError, ExceptionGroup)):
+        asyncio.run(app(scope, receive, send))
+    assert app.state.admission.running == 0
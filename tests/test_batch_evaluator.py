@@ -0,0 +1,23 @@
+from sql_table_qa.evaluators.batch_evaluator import add_token_usage_to_question, execution_match
+from sql_table_qa.tracing import Tracer
+
+
+def test_token_usage_is_read_from_the_spans_under_each_question():
+    tracer = Tracer()
+    tracer.exporters = [add_token_usage_to_question]
+    with tracer.span("eval.question") as question:
+        with tracer.span("answer"):
+            with tracer.span("llm.chat") as llm:
+                llm.set(prompt_tokens=100, completion_tokens=10)
+            with tracer.span("llm.chat") as llm:
+                llm.add(prompt_tokens=50, completion_tokens=5)
+        tracer.record("llm.chat.stream", 0.1, prompt_tokens=7)
+    with tracer.span("llm.chat") as outside:
+        outside.set(prompt_tokens=1000)
+    assert question.attributes["prompt_tokens"] == 157
+    assert question.attributes["completion_tokens"] == 15
+
+
+def test_execution_match_compares_the_first_row():
+    assert execution_match([(3503,)], "(3503,)")
+    assert not execution_match([(3502,)], "(3503,)")
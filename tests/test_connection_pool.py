@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+
+from sql_table_qa.dbutils.connection_pool import ConnectionPool
+from sql_table_qa.dbutils.database_connector import DatabaseConnector
+
+
+def _is_open(connection: sqlite3.Connection) -> bool:
+    try:
+        connection.execute("SELECT 1")
+    except sqlite3.ProgrammingError:
+        return False
+    return True
+
+
+def test_connections_released_after_close_are_closed(database_path):
+    pool = ConnectionPool(database_path, size=2)
+    connection = pool.acquire()
+    pool.close()
+    pool.release(connection)
+    assert not _is_open(connection)
+    assert pool.stats()["open"] == 0 and pool.stats()["idle"] == 0
+
+
+class _ClosingDuringRollback:
+    """A connection in a transaction whose rollback runs while another thread closes the pool."""
+
+    in_transaction = True
+
+    def __init__(self, pool: ConnectionPool, connection: sqlite3.Connection):
+        self.pool = pool
+        self.connection = connection
+
+    def rollback(self):
+        self.pool.close()
+
+    def close(self):
+        self.connection.close()
+
+
+def test_no_connection_outlives_a_concurrent_close(database_path):
+    pool = ConnectionPool(database_path, size=2)
+    connection = pool.acquire()
+    pool.release(_ClosingDuringRollback(pool, connection))
+    assert not _is_open(connection)
+    assert pool.stats()["open"] == 0 and pool.stats()["idle"] == 0
+
+
+def test_acquire_after_close_fails(database_path):
+    pool = ConnectionPool(database_path)
+    pool.close()
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+
+
+def test_connector_can_switch_the_database_to_wal(database_path):
+    connector = DatabaseConnector(database_path, engine="sqlite", use_rollups=False, wal=True)
+    with connector.pool.connection() as connection:
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
@@ -0,0 +1,99 @@
+import sqlite3
+
+import pytest
+
+from CONSTANTS import DATABASE_PATH
+from sql_table_qa.dbutils.cost_guard import CostGuard, QueryTooExpensiveError
+from sql_table_qa.dbutils.sql_analysis import analyze_sql
+
+
+@pytest.fixture(scope="module")
+def connection():
+    connection = sqlite3.connect(f"file:{DATABASE_PATH}?mode=ro", uri=True)
+    yield connection
+    connection.close()
+
+
+@pytest.fixture(scope="module")
+def row_counts(connection):
+    tables = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    return {table: connection.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+
+
+def _check(connection, row_counts, sql, row_limit=None, **limits):
+    return CostGuard(**limits).check(connection, sql, analyze_sql(sql), row_counts, row_limit=row_limit)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM Track t1, Track t2 LIMIT 5",
+    "SELECT t1.Name, t2.Name FROM Track t1 CROSS JOIN Track t2 ORDER BY t1.TrackId LIMIT 5",
+    "SELECT t.Name, g.Name FROM Track t JOIN Genre g ON g.GenreId = t.GenreId",
+    "SELECT t.Name, g.Name FROM Track t, Genre g WHERE g.GenreId = t.GenreId",
+    "SELECT g.Name, m.Name FROM Genre g, MediaType m",
+])
+def test_joins_that_are_bounded_or_predicated_are_accepted(connection, row_counts, sql):
+    assert _check(connection, row_counts, sql) == sql
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*) FROM Track t1, Track t2",
+    "SELECT * FROM Track t1, Track t2 ORDER BY t1.Name LIMIT 5",
+    "SELECT DISTINCT t1.Composer FROM Track t1, Track t2 LIMIT 5",
+    "SELECT COUNT(*) FROM (SELECT * FROM Track t1, Track t2 LIMIT 5) s, Track t3",
+    # The LIMIT waits for rows passing the filter, which may take the whole product
+    "SELECT a.InvoiceLineId FROM InvoiceLine a, InvoiceLine b, Track c "
+    "WHERE a.UnitPrice + b.UnitPrice + c.UnitPrice > 100 LIMIT 5",
+])
+def test_unbounded_cross_joins_are_rejected(connection, row_counts, sql):
+    with pytest.raises(QueryTooExpensiveError) as raised:
+        _check(connection, row_counts, sql)
+    assert raised.value.reason in ("missing_join_predicate", "estimated_rows")
+
+
+def test_large_scans_are_rejected_unless_the_plan_stops_early(connection, row_counts):
+    limits = {"max_scan_rows": 1000}
+    with pytest.raises(QueryTooExpensiveError) as raised:
+        _check(connection, row_counts, "SELECT Composer, COUNT(*) FROM Track GROUP BY Composer", **limits)
+    assert raised.value.reason == "full_scan"
+    assert raised.value.details["table"] == "Track"
+    bounded = "SELECT Name FROM Track WHERE Milliseconds > 300000 LIMIT 10"
+    assert _check(connection, row_counts, bounded, **limits) == bounded
+    lookup = "SELECT Name FROM Track WHERE TrackId = 5"
+    assert _check(connection, row_counts, lookup, **limits) == lookup
+    joined = ("SELECT t.Name FROM Track t JOIN Genre g ON g.GenreId = t.GenreId "
+              "WHERE t.Milliseconds > 300000 LIMIT 10")
+    assert _check(connection, row_counts, joined, **limits) == joined
+    with pytest.raises(QueryTooExpensiveError):
+        _check(connection, row_counts, "SELECT t.Name FROM Track t, Genre g "
+                                        "WHERE t.Name > g.Name LIMIT 10", **limits)
+
+
+def test_plain_projections_are_limited_instead_of_rejected(connection, row_counts):
+    checked = _check(connection, row_counts, "SELECT Name FROM Track", row_limit=101, max_scan_rows=1000)
+    assert checked == "SELECT Name FROM Track LIMIT 101"
+
+
+def test_estimated_rows(connection, row_counts):
+    sql = "SELECT COUNT(*) FROM InvoiceLine il JOIN Track t ON t.TrackId = il.TrackId"
+    assert _check(connection, row_counts, sql) == sql
+    with pytest.raises(QueryTooExpensiveError) as raised:
+        _check(connection, row_counts, sql, max_estimated_rows=1000)
+    assert raised.value.reason == "estimated_rows"
+    assert "Query too expensive" in str(raised.value)
+
+
+def test_execution_budget_interrupts_long_queries(database_path):
+    connection = sqlite3.connect(database_path)
+    budget = CostGuard(timeout=None, max_vm_steps=10_000).budget()
+    budget.start(connection)
+    with pytest.raises(QueryTooExpensiveError) as raised:
+        try:
+            connection.execute("SELECT COUNT(*) FROM Track t1, Track t2").fetchone()
+        except sqlite3.OperationalError as e:
+            budget.raise_if_exceeded(e)
+    budget.stop()
+    assert raised.value.reason == "vm_steps"
+
+
+def test_bounded_cross_join_runs_through_the_connector(connector):
+    assert connector.execute_sql("SELECT * FROM Track t1, Track t2 LIMIT 5").row_count == 5
@@ -0,0 +1,95 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from CONSTANTS import ROOT_DIR
+from sql_table_qa.dbutils.cost_guard import CostGuard, QueryTooExpensiveError
+from sql_table_qa.dbutils.database_connector import DatabaseConnector
+from sql_table_qa.dbutils.engines import DuckDBEngine, EngineError, EngineRouter
+from sql_table_qa.dbutils.rollups import results_equivalent
+from sql_table_qa.dbutils.sql_analysis import analyze_sql
+
+duckdb = pytest.importorskip("duckdb")
+
+EVALUATION_SQL = pd.read_csv(f"{ROOT_DIR}/data/evaluation_dataset.csv")["sql_query"].tolist()
+
+
+@pytest.fixture
+def duckdb_engine(database_path):
+    engine = DuckDBEngine(database_path, mode="ingest")
+    yield engine
+    engine.close()
+
+
+def _duckdb_connector(database_path, duckdb_engine, **kwargs):
+    return DatabaseConnector(database_path, engine="duckdb", duckdb_engine=duckdb_engine,
+                             router=EngineRouter(min_rows=0), use_cache=False, use_rollups=False, **kwargs)
+
+
+@pytest.fixture
+def duckdb_connector(database_path, duckdb_engine):
+    assert duckdb_engine.ensure_loaded(wait=True)
+    return _duckdb_connector(database_path, duckdb_engine)
+
+
+@pytest.mark.parametrize("sql", EVALUATION_SQL)
+def test_evaluation_queries_give_the_same_result_on_both_engines(connector, duckdb_connector, sql):
+    assert results_equivalent(connector.execute_sql(sql), duckdb_connector.execute_sql(sql))
+
+
+def test_duckdb_runs_most_evaluation_queries(duckdb_connector, duckdb_engine):
+    for sql in EVALUATION_SQL:
+        duckdb_connector.execute_sql(sql)
+    assert duckdb_engine.stats()["queries"] >= len(EVALUATION_SQL) // 2
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*) FROM Track WHERE Name LIKE '%love%'",
+    "SELECT COUNT(*) FROM Track WHERE Name NOT LIKE 'THE %'",
+    "SELECT COUNT(*) FROM Artist WHERE Name LIKE '%\\_%' ESCAPE '\\'",
+])
+def test_like_ignores_ascii_case_on_both_engines(connector, duckdb_connector, duckdb_engine, sql):
+    assert results_equivalent(connector.execute_sql(sql), duckdb_connector.execute_sql(sql))
+    assert duckdb_engine.stats()["queries"] == 1
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*) FROM Track WHERE Name GLOB '*Love*'",
+    "SELECT COUNT(*) FROM Track WHERE Name LIKE Composer",
+    "SELECT COUNT(*) FROM Track WHERE Name LIKE '%ü%'",
+])
+def test_text_matches_that_differ_between_engines_stay_on_sqlite(duckdb_engine, sql):
+    with pytest.raises(EngineError):
+        duckdb_engine.transpile(analyze_sql(sql))
+
+
+def test_queries_run_on_sqlite_while_duckdb_loads(database_path, duckdb_engine):
+    sql = "SELECT GenreId, COUNT(*) FROM Track GROUP BY GenreId"
+    with pytest.raises(EngineError):
+        duckdb_engine.execute(sql)
+    connector = _duckdb_connector(database_path, duckdb_engine)
+    assert results_equivalent(connector.execute_sql(sql),
+                              DatabaseConnector(database_path, engine="sqlite", use_rollups=False).execute_sql(sql))
+    assert duckdb_engine.ensure_loaded(wait=True)
+    assert duckdb_engine.stats()["loads"] == 1
+
+
+def test_a_change_to_the_file_is_swapped_in_by_the_next_load(database_path, duckdb_engine):
+    assert duckdb_engine.ensure_loaded(wait=True)
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("INSERT INTO Genre (GenreId, Name) VALUES (1000, 'Sea Shanty')")
+    assert not duckdb_engine.ensure_loaded()
+    assert duckdb_engine.ensure_loaded(wait=True)
+    result = duckdb_engine.execute("SELECT Name FROM Genre WHERE GenreId = 1000")
+    assert list(result.rows) == [("Sea Shanty",)]
+    tables = {row[0] for row in duckdb_engine._connection.execute("SHOW TABLES").fetchall()}
+    assert not any(table.startswith("_load_") for table in tables)
+
+
+def test_the_cost_guard_applies_before_duckdb(database_path, duckdb_engine):
+    assert duckdb_engine.ensure_loaded(wait=True)
+    connector = _duckdb_connector(database_path, duckdb_engine, cost_guard=CostGuard())
+    with pytest.raises(QueryTooExpensiveError):
+        connector.execute_sql("SELECT COUNT(*) FROM Track t1, Track t2")
+    assert duckdb_engine.stats()["queries"] == 0
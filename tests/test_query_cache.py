@@ -0,0 +1,46 @@
+import sqlite3
+
+import pytest
+
+from sql_table_qa.dbutils.query_cache import QueryResultCache, normalize_sql
+
+
+def test_formatting_differences_share_a_key():
+    assert normalize_sql("select  count(*) from track;") == normalize_sql("SELECT COUNT(*)\nFROM Track")
+
+
+def test_hit_keeps_the_column_labels_of_the_caller(connector):
+    first = connector.execute_sql("SELECT COUNT(*) FROM Track")
+    second = connector.execute_sql("select count(*) from track")
+    assert first.columns == ["COUNT(*)"]
+    assert second.columns == ["count(*)"]
+    assert second.rows == first.rows
+    assert connector.get_cache_stats()["hits"] == 1
+
+
+def test_hit_returns_a_result_the_caller_cannot_corrupt(connector):
+    first = connector.execute_sql("SELECT Name FROM Artist ORDER BY ArtistId LIMIT 3")
+    first.columns[0] = "Renamed"
+    with pytest.raises((TypeError, AttributeError)):
+        first.data[0][0] = "Changed"
+    second = connector.execute_sql("SELECT Name FROM Artist ORDER BY ArtistId LIMIT 3")
+    assert second.columns == ["Name"]
+    assert second.rows == [("AC/DC",), ("Accept",), ("Aerosmith",)]
+
+
+def test_write_invalidates_cached_results(connector, database_path):
+    assert connector.execute_sql("SELECT Name FROM Artist WHERE ArtistId = 1").rows == [("AC/DC",)]
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("UPDATE Artist SET Name = 'ACDC' WHERE ArtistId = 1")
+    assert connector.execute_sql("SELECT Name FROM Artist WHERE ArtistId = 1").rows == [("ACDC",)]
+
+
+def test_lru_eviction_and_byte_cap():
+    cache = QueryResultCache(max_entries=2, max_bytes=100)
+    cache.put("a", 1, size=10)
+    cache.put("b", 2, size=10)
+    cache.get("a")
+    cache.put("c", 3, size=10)
+    assert cache.get("b") is None and cache.get("a") == 1
+    cache.put("huge", 4, size=101)
+    assert cache.get("huge") is None
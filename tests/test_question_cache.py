@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+from sql_table_qa.answerers.langchain_answerer.langchain_naive_answerer import LangchainNaiveAnswerer
+from sql_table_qa.answerers.question_cache import QuestionCache, key_terms
+from sql_table_qa.evaluators.fake_llm import FakeSQLChatModel
+
+
+@pytest.fixture
+def cache():
+    cache = QuestionCache(":memory:")
+    cache.put("Which customer has spent the most money in total?", "model", 1,
+              "SELECT ... ORDER BY SUM(Total) DESC LIMIT 1", "Helena Holý")
+    cache.put("How many tracks are there in the database?", "model", 1, "SELECT COUNT(*) FROM Track", "3503")
+    cache.put("What are the top 5 genres by number of tracks?", "model", 1, "SELECT ... LIMIT 5", "Rock, ...")
+    return cache
+
+
+def test_exact_match_ignores_case_and_punctuation(cache):
+    assert cache.get("how many tracks are there in the database", "model", 1).answer == "3503"
+    assert cache.stats()["hits"] == 1
+
+
+def test_rewording_matches(cache):
+    cached = cache.get("Which customer spent the most money in total?", "model", 1)
+    assert cached is not None and cached.answer == "Helena Holý"
+    assert cached.similarity < 1.0
+
+
+@pytest.mark.parametrize("question", [
+    "Which customer has spent the least money in total?",
+    "Which tracks are there in the database?",
+    "What are the top 10 genres by number of tracks?",
+    "Which customer has not spent the most money in total?",
+])
+def test_near_misses_do_not_match(cache, question):
+    assert cache.get(question, "model", 1) is None
+    assert cache.stats()["similar_hits"] == 0
+
+
+def test_entries_only_match_their_model_and_schema_version(cache):
+    assert cache.get("How many tracks are there in the database?", "other-model", 1) is None
+    assert cache.get("How many tracks are there in the database?", "model", 2) is None
+
+
+def test_key_terms_keep_quantifiers_and_numbers():
+    assert {"most", "5"} <= key_terms("Top 5 artists with the most albums?")
+    assert key_terms("How many tracks?") != key_terms("Which tracks?")
+
+
+def test_cached_answers_are_tied_to_their_result(cache):
+    cache.put("How many genres are there?", "model", 1, "SELECT COUNT(*) FROM Genre", "25", result="COUNT(*)\n25")
+    cached = cache.get("How many genres are there?", "model", 1)
+    assert cached.answers("COUNT(*)\n25")
+    assert not cached.answers("COUNT(*)\n26")
+    # Entries stored without their result are never reused as they are
+    assert not cache.get("How many tracks are there in the database?", "model", 1).answers("COUNT(*)\n3503")
+
+
+def test_files_without_result_hashes_are_upgraded(tmp_path):
+    path = str(tmp_path / "question_cache.db")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE question_cache (normalized TEXT NOT NULL, model TEXT NOT NULL, "
+                       "schema_version INTEGER NOT NULL, question TEXT NOT NULL, sql TEXT NOT NULL, "
+                       "answer TEXT NOT NULL, embedding BLOB, created REAL NOT NULL, "
+                       "PRIMARY KEY (normalized, model, schema_version))")
+    connection.execute("INSERT INTO question_cache VALUES ('how many genres', 'model', 1, 'How many genres?', "
+                       "'SELECT COUNT(*) FROM Genre', '25', NULL, 0)")
+    connection.commit()
+    connection.close()
+    cache = QuestionCache(path)
+    assert cache.get("How many genres?", "model", 1).result_hash is None
+    cache.put("How many genres?", "model", 1, "SELECT COUNT(*) FROM Genre", "25", result="25")
+    assert cache.get("How many genres?", "model", 1).answers("25")
+
+
+def test_answers_are_rewritten_when_the_data_changes(connector, database_path):
+    answerer = LangchainNaiveAnswerer(llm=FakeSQLChatModel.from_dataset(), connector=connector,
+                                      question_cache=QuestionCache(":memory:"))
+    question = "How many tracks are there in the database?"
+    assert "3503" in answerer.call(question)[2]
+    assert "3503" in answerer.call(question)[2]
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("INSERT INTO Track (Name, MediaTypeId, Milliseconds, UnitPrice) "
+                           "VALUES ('New Song', 1, 200000, 0.99)")
+    _, result, answer = answerer.call(question)
+    assert result.iloc[0, 0] == 3504 and "3504" in answer
+    assert answerer.question_cache.stats()["hits"] == 2
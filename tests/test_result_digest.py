@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+from sql_table_qa.answerers.conversation_context import ConversationContext, digest_content
+from sql_table_qa.answerers.result_digest import digest_result
+from sql_table_qa.answerers.tokens import count_tokens
+from sql_table_qa.dbutils.query_result import QueryResult
+
+
+def _tracks(rows: int) -> QueryResult:
+    return QueryResult.from_rows(["TrackId", "Name", "Milliseconds"],
+                                 [(i, f"Track {i}", 200_000 + i) for i in range(rows)])
+
+
+@pytest.mark.parametrize("result, counts", [
+    (_tracks(3), "(3 rows x 3 columns)"),
+    (_tracks(0), "(0 rows x 3 columns)"),
+    (pd.DataFrame({"Genre": ["Rock", "Jazz"]}), "(2 rows x 1 columns)"),
+])
+def test_whole_results_end_with_their_size(result, counts):
+    text = digest_result(result)
+    assert text.splitlines()[-1] == counts
+    assert text.splitlines()[0] == " | ".join(map(str, result.columns))
+
+
+def test_large_results_are_digested_with_their_size():
+    text = digest_result(_tracks(5_000), max_tokens=200, sql="SELECT * FROM Track ORDER BY TrackId")
+    assert "(5000 rows x 3 columns, ordered by TrackId." in text
+    assert "0 | Track 0 | 200000" in text
+    assert "4999 | Track 4999 | 204999" in text
+
+
+@pytest.mark.parametrize("rows", [0, 1, 10, 100, 5_000])
+@pytest.mark.parametrize("max_tokens", [5, 20, 60, 200])
+def test_digests_stay_within_their_budget(rows, max_tokens):
+    assert count_tokens(digest_result(_tracks(rows), max_tokens=max_tokens)) <= max_tokens
+
+
+@pytest.mark.parametrize("max_tokens", [10, 40, 120])
+def test_digested_history_messages_stay_within_their_budget(max_tokens):
+    text = digest_content(_tracks(1_000), max_tokens)
+    assert text.startswith("[SQL result]\n")
+    assert count_tokens(text) <= max_tokens
+
+
+def test_context_stays_within_its_budget():
+    context = ConversationContext(max_tokens=300, max_messages=6, digest_tokens=60)
+    messages = []
+    for turn in range(20):
+        messages += [{"role": "user", "content": f"Question {turn}: which tracks are longest? " * 5},
+                     {"role": "assistant", "content": _tracks(500)}]
+        built = context.build(messages)
+        assert context.count(built) <= 300
+        assert built[-1]["content"].startswith("[SQL result]")
+    assert built[0]["role"] == "system"
@@ -0,0 +1,117 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from sql_table_qa.dbutils.chinook_rollups import CHINOOK_ROLLUPS
+from sql_table_qa.dbutils.database_connector import DatabaseConnector
+from sql_table_qa.dbutils.rollups import RollupStore, results_equivalent
+
+REWRITABLE = [
+    "SELECT BillingCountry, SUM(Total) FROM Invoice GROUP BY BillingCountry ORDER BY 2 DESC",
+    "SELECT strftime('%Y', InvoiceDate) AS year, COUNT(*), AVG(Total) FROM Invoice GROUP BY year",
+    "SELECT MAX(Total) FROM Invoice WHERE BillingCountry = 'USA'",
+    "SELECT c.Country, SUM(i.Total) FROM Invoice i JOIN Customer c ON c.CustomerId = i.CustomerId "
+    "GROUP BY c.Country",
+    "SELECT g.Name, SUM(il.UnitPrice * il.Quantity) AS revenue FROM InvoiceLine il "
+    "JOIN Track t ON t.TrackId = il.TrackId JOIN Genre g ON g.GenreId = t.GenreId "
+    "GROUP BY g.Name ORDER BY revenue DESC LIMIT 3",
+    "SELECT ar.Name, SUM(il.Quantity) FROM InvoiceLine il JOIN Track t ON t.TrackId = il.TrackId "
+    "JOIN Album al ON al.AlbumId = t.AlbumId JOIN Artist ar ON ar.ArtistId = al.ArtistId GROUP BY ar.Name",
+]
+NOT_REWRITABLE = [
+    "SELECT BillingCountry, AVG(Total) FROM Invoice WHERE Total > 5 GROUP BY BillingCountry",
+    "SELECT COUNT(DISTINCT BillingCountry) FROM Invoice",
+    "SELECT CustomerId, SUM(Total) FROM Invoice GROUP BY CustomerId",
+    "SELECT * FROM Invoice",
+]
+# Rollups folding in a new InvoiceLine row, each counted as one incremental refresh
+SALES_ROLLUPS = sum(definition["source"].startswith("InvoiceLine ") for definition in CHINOOK_ROLLUPS.values())
+GENRE_REVENUE = ("SELECT g.Name, SUM(il.UnitPrice * il.Quantity) FROM InvoiceLine il "
+                 "JOIN Track t ON t.TrackId = il.TrackId JOIN Genre g ON g.GenreId = t.GenreId "
+                 "WHERE g.Name = 'Rock' GROUP BY g.Name")
+
+
+@pytest.fixture
+def store(database_path, tmp_path):
+    store = RollupStore(database_path, path=str(tmp_path / "Chinook.rollups.db"), refresh_interval=0)
+    store.refresh()
+    assert store.ensure_fresh(wait=True)
+    return store
+
+
+@pytest.fixture
+def routed(database_path, store):
+    return DatabaseConnector(database_path, engine="sqlite", use_cache=False, rollups=store)
+
+
+@pytest.mark.parametrize("sql", REWRITABLE)
+def test_rewrites_reproduce_the_base_result(connector, routed, store, sql):
+    analysis = connector.analyze_sql(sql)
+    rewrite = store.rewrite(analysis)
+    assert rewrite is not None
+    base = connector.execute_sql(sql)
+    rolled_up = routed.execute_sql(sql)
+    assert results_equivalent(base, rolled_up)
+    assert rolled_up.columns == base.columns
+    assert store.stats()["verified"] == 1 and store.stats()["mismatches"] == 0
+
+
+@pytest.mark.parametrize("sql", NOT_REWRITABLE)
+def test_queries_outside_the_rollups_are_not_rewritten(connector, store, sql):
+    assert store.rewrite(connector.analyze_sql(sql)) is None
+
+
+def _sell_rock_track(database_path):
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("INSERT INTO InvoiceLine (InvoiceId, TrackId, UnitPrice, Quantity) VALUES (1, 1, 100, 1)")
+
+
+def test_stale_rollups_are_refreshed_in_the_background(connector, routed, store, database_path):
+    before = routed.execute_sql(GENRE_REVENUE)
+    _sell_rock_track(database_path)
+    # The first query after the write reads the base tables while the refresh runs
+    assert routed.execute_sql(GENRE_REVENUE).rows[0][1] == pytest.approx(before.rows[0][1] + 100)
+    assert store.wait_for_refresh(timeout=30)
+    assert store.ensure_fresh()
+    assert store.stats()["incremental_refreshes"] == SALES_ROLLUPS
+    rolled_up = store.rewrite(connector.analyze_sql(GENRE_REVENUE)).rewritten_sql
+    with sqlite3.connect(store.path) as connection:
+        assert connection.execute(rolled_up).fetchone()[1] == pytest.approx(before.rows[0][1] + 100)
+
+
+def test_queries_do_not_wait_for_a_refresh(routed, store, database_path):
+    _sell_rock_track(database_path)
+    with store._refresh_lock:
+        # A refresh is stuck: queries still run, on the base tables
+        started = time.perf_counter()
+        result = routed.execute_sql(GENRE_REVENUE)
+        assert time.perf_counter() - started < 5
+        assert not store.ensure_fresh()
+        assert store.stats()["incremental_refreshes"] == 0
+    assert store.wait_for_refresh(timeout=30)
+    assert store.ensure_fresh()
+    assert routed.execute_sql(GENRE_REVENUE) == result
+
+
+def test_refreshes_are_throttled(store, database_path):
+    store.refresh_interval = 60
+    store._refreshed_at = time.monotonic()
+    _sell_rock_track(database_path)
+    assert not store.ensure_fresh()
+    assert store.wait_for_refresh(timeout=1)
+    assert not store.ensure_fresh()
+    assert store.ensure_fresh(wait=True)
+
+
+def test_concurrent_checks_start_one_refresh(store, database_path):
+    _sell_rock_track(database_path)
+    with store._refresh_lock:
+        threads = [threading.Thread(target=store.ensure_fresh) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert store.wait_for_refresh(timeout=30)
+    assert store.stats()["incremental_refreshes"] == SALES_ROLLUPS
@@ -0,0 +1,23 @@
+import sqlite3
+
+
+def test_row_counts_follow_data_only_changes(connector, database_path):
+    before = connector.database_schema["Artist"]["row_count"]
+    connector.schema.invalidate()
+    assert connector.database_schema["Artist"]["row_count"] == before
+
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("INSERT INTO Artist (Name) VALUES ('New Artist')")
+    connector.schema.invalidate()
+    assert connector.database_schema["Artist"]["row_count"] == before + 1
+    assert f"({before + 1} rows)" in connector.schema.get_table_prompts()["Artist"]
+
+
+def test_schema_change_is_introspected(connector, database_path):
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("CREATE TABLE Review (ReviewId INTEGER PRIMARY KEY, TrackId INTEGER NOT NULL)")
+        connection.execute("INSERT INTO Review (TrackId) VALUES (1), (2)")
+    connector.schema.invalidate()
+    review = connector.database_schema["Review"]
+    assert list(review["columns"]) == ["ReviewId", "TrackId"]
+    assert review["row_count"] == 2
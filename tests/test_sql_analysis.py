@@ -0,0 +1,67 @@
+import pytest
+
+from sql_table_qa.dbutils.sql_analysis import analyze_sql
+
+
+def _check(sql: str) -> str:
+    try:
+        analyze_sql(sql).check_allowed()
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM Track",
+    "with t as (select 1 as x) select x from t;",
+    "SELECT 1 UNION SELECT 2",
+    "VALUES (1, 2)",
+    "PRAGMA table_info(Track)",
+    "PRAGMA main.index_list('Track')",
+    "PRAGMA user_version",
+])
+def test_read_only_statements_are_allowed(sql):
+    assert _check(sql) is None
+
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM Track",
+    "UPDATE Track SET Name = 'x'",
+    "INSERT INTO Genre (Name) VALUES ('x')",
+    "DROP TABLE Track",
+    "CREATE TABLE t (x INTEGER)",
+    "BEGIN",
+    "VACUUM",
+    "WITH t AS (SELECT 1) DELETE FROM Track",
+    "PRAGMA user_version = 5",
+    "PRAGMA user_version(5)",
+    "PRAGMA journal_mode = DELETE",
+])
+def test_modifying_statements_are_rejected(sql):
+    assert _check(sql) == "Modifying SQL statements are not allowed."
+
+
+def test_explain_is_unsupported_rather_than_modifying():
+    analysis = analyze_sql("EXPLAIN SELECT 1")
+    assert not analysis.is_modifying
+    assert _check("EXPLAIN SELECT 1") == "EXPLAIN statements are not supported: only queries can be run."
+
+
+@pytest.mark.parametrize("sql", ["SELEC x", "SELEC", "Track"])
+def test_typos_are_parse_errors(sql):
+    assert not analyze_sql(sql).is_valid
+    assert _check(sql).startswith("Could not parse the SQL statement")
+
+
+def test_pragmas_outside_the_allow_list_are_rejected():
+    assert _check("PRAGMA journal_mode") == "PRAGMA statements are not supported: only queries can be run."
+
+
+def test_multiple_statements_are_rejected():
+    assert _check("SELECT 1; SELECT 2") == "Only one SQL statement can be executed at a time."
+
+
+def test_nondeterministic_queries_are_not_cacheable():
+    assert analyze_sql("SELECT Name FROM Track").is_cacheable
+    assert not analyze_sql("SELECT Name FROM Track ORDER BY random() LIMIT 1").is_cacheable
+    assert not analyze_sql("SELECT date('now')").is_cacheable
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from CONSTANTS import ROOT_DIR
+from sql_table_qa.dbutils.table_retriever import TableRetriever, tokenize
+
+
+def test_quantifiers_are_kept():
+    assert tokenize("How many tracks sold the most?") == ["how", "many", "track", "sold", "most"]
+
+
+@pytest.mark.parametrize("question, tables", [
+    ("Which playlist contains the fewest tracks?", {"Playlist", "PlaylistTrack"}),
+    ("Which employee supports the most customers?", {"Customer", "Employee"}),
+])
+def test_named_tables_and_join_tables_are_retrieved(connector, question, tables):
+    assert tables <= set(TableRetriever(connector).retrieve(question))
+
+
+def test_foreign_key_neighbours_of_every_hit_are_retrieved(connector):
+    tables = set(TableRetriever(connector).retrieve("Which music style has the longest average song length?"))
+    assert {"Genre", "Track"} <= tables
+
+
+def test_weak_matches_retrieve_every_table(connector):
+    retriever = TableRetriever(connector)
+    assert len(retriever.retrieve("How many people work for the company?")) == len(connector.database_schema)
+
+
+def test_heldout_recall(connector):
+    report = TableRetriever(connector).evaluate_recall(os.path.join(ROOT_DIR, "data", "table_retrieval_heldout.csv"))
+    assert report["complete"] == 1.0
+    assert report["mean_tables"] < len(connector.database_schema)
@@ -0,0 +1,11 @@
+from sql_table_qa import tracing
+
+
+def test_metrics_are_served_locally_by_default(monkeypatch):
+    monkeypatch.setattr(tracing, "_metrics_server", None)
+    server = tracing.start_metrics_server(port=0)
+    try:
+        assert server.server_address[0] == "127.0.0.1"
+    finally:
+        server.shutdown()
+        server.server_close()